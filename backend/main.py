@@ -3,7 +3,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from pathlib import Path
-import sys, os
+import sys, os, asyncio
 
 # Obtener el directorio base
 BASE_DIR = Path(__file__).resolve().parent
@@ -11,10 +11,28 @@ BASE_DIR = Path(__file__).resolve().parent
 # Añadir directorio de scripts al path
 sys.path.insert(0, str(BASE_DIR))
 
+# Directorios de almacenamiento (versión mínima); en Docker STORAGE_DIR apunta al volumen.
+# Se fijan antes de importar los scripts, que leen STORAGE_DIR al cargarse: así resultados,
+# cola y subidas comparten sistema de archivos y los resultados se mueven sin copiarse
+STORAGE_DIR = Path(os.environ.get("STORAGE_DIR", BASE_DIR / "storage")).resolve()
+TMP_DIR = Path(os.environ.get("TMP_DIR", BASE_DIR / "tmp")).resolve()
+CACHE_DIR = Path(os.environ.get("CACHE_DIR", STORAGE_DIR / "cache")).resolve()
+
+# Crear directorios básicos
+for directory in [STORAGE_DIR, TMP_DIR]:
+    directory.mkdir(parents=True, exist_ok=True)
+    print(f"Directorio creado: {directory}")
+
+# Establecer variables de entorno para los scripts
+os.environ["STORAGE_DIR"] = str(STORAGE_DIR)
+os.environ["TMP_DIR"] = str(TMP_DIR)
+os.environ["CACHE_DIR"] = str(CACHE_DIR)
+
 # Importar los routers
 from scripts.diapos_autofit import get_autofit_router
 from scripts.diapos_split import get_router as get_split_router
 from scripts.diapos_translate import router as translate_router
+from scripts.storage_lifecycle import LIFECYCLE, LIFECYCLE_CONFIG, start_lifecycle, stop_lifecycle
 
 # Crear una instancia de FastAPI
 app = FastAPI(
@@ -33,22 +51,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Directorios de almacenamiento (versión mínima)
-STORAGE_DIR = BASE_DIR / "storage"
-TMP_DIR = BASE_DIR / "tmp"
-
-# Crear directorios básicos
-for directory in [STORAGE_DIR, TMP_DIR]:
-    directory.mkdir(parents=True, exist_ok=True)
-    print(f"Directorio creado: {directory}")
-
-# Establecer variables de entorno para los scripts
-os.environ["STORAGE_DIR"] = str(STORAGE_DIR)
-os.environ["CACHE_DIR"] = str(BASE_DIR / "config" / "cache")
-
-# Montar directorios estáticos para archivos procesados
+# Montar directorios estáticos para archivos procesados.
+# STORAGE_DIR no se monta: contiene las bases de datos (registro, cola, almacén de
+# contenido), las subidas y los resultados de todos los usuarios. Las descargas pasan
+# siempre por los endpoints de cada router (serve_file), que exigen su identificador
 app.mount("/tmp", StaticFiles(directory=TMP_DIR), name="temp")
-app.mount("/storage", StaticFiles(directory=STORAGE_DIR), name="storage")
 
 # Ya no montamos el frontend aquí, ya que se sirve separadamente en el puerto 3001
 # Dejamos solamente la API en este puerto 8088
@@ -58,6 +65,10 @@ app.include_router(get_autofit_router())
 app.include_router(get_split_router())
 app.include_router(translate_router)
 
+# Limpieza periódica del almacenamiento (caducidad, cuota, huérfanos)
+app.add_event_handler("startup", start_lifecycle)
+app.add_event_handler("shutdown", stop_lifecycle)
+
 @app.get("/root")
 async def root():
     return {"message": "INSCO Tools API", "version": "1.0.0"}
@@ -71,6 +82,21 @@ async def health_check():
         "storage": STORAGE_DIR.exists()
     }
 
+@app.get("/api/storage/lifecycle")
+async def storage_lifecycle_report():
+    """Informe de la última limpieza del almacenamiento y su configuración"""
+    return {
+        "last_report": LIFECYCLE.last_report,
+        "ttl_hours": {name: seconds / 3600 for name, seconds in LIFECYCLE_CONFIG["ttl"].items()},
+        "quota_bytes": LIFECYCLE_CONFIG["quota_bytes"],
+        "interval_seconds": LIFECYCLE_CONFIG["interval"]
+    }
+
+@app.post("/api/storage/lifecycle/run")
+async def run_storage_lifecycle():
+    """Ejecuta una limpieza inmediata y devuelve los bytes recuperados"""
+    return await asyncio.to_thread(LIFECYCLE.run_once)
+
 # Endpoint para manejar rutas del frontend
 @app.get("/slides/{rest_of_path:path}")
 async def serve_frontend_routes(rest_of_path: str):
@@ -14,11 +14,36 @@ from pathlib import Path
 import sys, os, re, argparse, uuid, shutil, json, time
 import logging
 from typing import Dict, Any, List, Optional
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks, Request
+from fastapi.responses import JSONResponse
 from pptx import Presentation
 from pptx.enum.text import MSO_AUTO_SIZE
 
+try:
+    from scripts.job_registry import JobRegistry
+except ImportError:
+    from job_registry import JobRegistry
+
+try:
+    from scripts.file_serving import serve_file
+except ImportError:
+    from file_serving import serve_file
+
+try:
+    from scripts.file_store import shard_dir
+except ImportError:
+    from file_store import shard_dir
+
+try:
+    from scripts.upload_pipeline import receive_upload, UploadRejected
+except ImportError:
+    from upload_pipeline import receive_upload, UploadRejected
+
+try:
+    from scripts.pptx_package import autofit_package
+except ImportError:
+    from pptx_package import autofit_package
+
 # Configuración de logging estandarizado
 logger = logging.getLogger("autofit")
 handler = logging.StreamHandler()
@@ -33,7 +58,16 @@ DEFAULT_INPUT_DIR = BASE_DIR / "storage/input/diapos"
 DEFAULT_OUTPUT_DIR = BASE_DIR / "storage/output/autofit"
 
 # Directorios de almacenamiento
-STORAGE_DIR = Path(os.environ.get("AUTOFIT_STORAGE_DIR", BASE_DIR / "storage/autofit")).resolve()
+STORAGE_DIR = Path(os.environ.get(
+    "AUTOFIT_STORAGE_DIR", Path(os.environ.get("STORAGE_DIR", BASE_DIR / "storage")) / "autofit"
+)).resolve()
+
+# Motor de autofit: "xml" reescribe solo el bodyPr de las diapositivas sin cargar la
+# presentación; "pptx" recorre el modelo de objetos de python-pptx (comportamiento anterior)
+AUTOFIT_ENGINES = ("xml", "pptx")
+DEFAULT_ENGINE = os.environ.get("AUTOFIT_ENGINE", "xml").strip().lower()
+if DEFAULT_ENGINE not in AUTOFIT_ENGINES:
+    DEFAULT_ENGINE = "xml"
 
 # Asegurar que los directorios existan
 for directory in [DEFAULT_INPUT_DIR, DEFAULT_OUTPUT_DIR, STORAGE_DIR]:
@@ -43,7 +77,7 @@ for directory in [DEFAULT_INPUT_DIR, DEFAULT_OUTPUT_DIR, STORAGE_DIR]:
 # BLOQUE 1: Funciones de servicio
 #===================================
 
-def procesar_pptx(pptx_entrada, pptx_salida=None, silent=False):
+def procesar_pptx(pptx_entrada, pptx_salida=None, silent=False, engine=None):
     """
     Procesa una presentación PPTX aplicando autofit a todos los textos.
     
@@ -51,6 +85,7 @@ def procesar_pptx(pptx_entrada, pptx_salida=None, silent=False):
         pptx_entrada: Ruta al archivo PPTX a procesar
         pptx_salida: Ruta de salida (opcional)
         silent: Si se debe mostrar información por consola
+        engine: "xml" o "pptx" (por defecto AUTOFIT_ENGINE)
         
     Returns:
         Ruta al archivo procesado
@@ -76,32 +111,18 @@ def procesar_pptx(pptx_entrada, pptx_salida=None, silent=False):
         if not silent:
             logger.info(f"Procesando archivo: {pptx_entrada} -> {pptx_salida}")
         
-        presentacion = Presentation(pptx_entrada)
-        num_slides = len(presentacion.slides)
-        
-        if not silent:
-            logger.info(f"Presentación cargada, {num_slides} diapositivas")
-        
-        for i, slide in enumerate(presentacion.slides):
+        engine = engine or DEFAULT_ENGINE
+        if engine not in AUTOFIT_ENGINES:
+            raise ValueError(f"Motor de autofit desconocido: {engine}")
+        if engine == "xml":
+            # Solo se reescribe el XML de las diapositivas; multimedia y demás partes se copian tal cual
+            stats = autofit_package(pptx_entrada, pptx_salida)
+            num_slides = stats["slides"]
             if not silent:
-                logger.info(f"Procesando diapositiva {i+1}/{num_slides}")
-                
-            for shape in slide.shapes:
-                try:
-                    if hasattr(shape, "text_frame"):
-                        shape.text_frame.auto_size = MSO_AUTO_SIZE.TEXT_TO_FIT_SHAPE
-                    
-                    if hasattr(shape, "has_table") and shape.has_table:
-                        for cell in (cell for row in shape.table.rows for cell in row.cells if hasattr(cell, "text_frame")):
-                            cell.text_frame.auto_size = MSO_AUTO_SIZE.TEXT_TO_FIT_SHAPE
-                except Exception as e:
-                    if not silent:
-                        logger.warning(f"Error al ajustar shape: {e}")
-        
-        if not silent:
-            logger.info(f"Guardando presentación procesada en: {pptx_salida}")
-            
-        presentacion.save(pptx_salida)
+                logger.info(f"Autofit aplicado a {stats['text_frames']} cuadros de texto "
+                            f"({stats['rewritten']}/{num_slides} diapositivas modificadas)")
+        else:
+            num_slides = _autofit_presentacion(pptx_entrada, pptx_salida, silent)
         
         if not silent:
             logger.info(f"✅ Archivo generado: {pptx_salida} ({num_slides} diapositivas)")
@@ -118,7 +139,37 @@ def procesar_pptx(pptx_entrada, pptx_salida=None, silent=False):
         logger.error(error_msg)
         raise Exception(error_msg)
 
-def procesar_lote(directorio=None, salida=None, silent=False):
+def _autofit_presentacion(pptx_entrada: Path, pptx_salida: Path, silent: bool) -> int:
+    """Autofit mediante el modelo de objetos de python-pptx; devuelve el número de diapositivas"""
+    presentacion = Presentation(pptx_entrada)
+    num_slides = len(presentacion.slides)
+    
+    if not silent:
+        logger.info(f"Presentación cargada, {num_slides} diapositivas")
+    
+    for i, slide in enumerate(presentacion.slides):
+        if not silent:
+            logger.info(f"Procesando diapositiva {i+1}/{num_slides}")
+            
+        for shape in slide.shapes:
+            try:
+                if hasattr(shape, "text_frame"):
+                    shape.text_frame.auto_size = MSO_AUTO_SIZE.TEXT_TO_FIT_SHAPE
+                
+                if hasattr(shape, "has_table") and shape.has_table:
+                    for cell in (cell for row in shape.table.rows for cell in row.cells if hasattr(cell, "text_frame")):
+                        cell.text_frame.auto_size = MSO_AUTO_SIZE.TEXT_TO_FIT_SHAPE
+            except Exception as e:
+                if not silent:
+                    logger.warning(f"Error al ajustar shape: {e}")
+    
+    if not silent:
+        logger.info(f"Guardando presentación procesada en: {pptx_salida}")
+        
+    presentacion.save(pptx_salida)
+    return num_slides
+
+def procesar_lote(directorio=None, salida=None, silent=False, engine=None):
     """
     Procesa un lote de archivos PPTX aplicando autofit.
     
@@ -126,6 +177,7 @@ def procesar_lote(directorio=None, salida=None, silent=False):
         directorio: Directorio con archivos PPTX a procesar
         salida: Directorio donde guardar los archivos procesados
         silent: Si se debe mostrar información por consola
+        engine: Motor de autofit, como en procesar_pptx
         
     Returns:
         Diccionario con información de los archivos procesados
@@ -158,7 +210,7 @@ def procesar_lote(directorio=None, salida=None, silent=False):
             else:
                 salida_archivo = salida / f"{archivo.stem}_autofit{archivo.suffix}"
             
-            resultado = procesar_pptx(archivo, salida_archivo, silent=True)
+            resultado = procesar_pptx(archivo, salida_archivo, silent=True, engine=engine)
             resultados["procesados"] += 1
             resultados["archivos"].append({
                 "entrada": str(archivo),
@@ -253,13 +305,18 @@ async def upload_pptx_for_autofit(file: UploadFile = File(...)):
         if file_extension.lower() != '.pptx':
             raise HTTPException(status_code=400, detail=error_response("Solo se permiten archivos PPTX"))
         
-        file_location = STORAGE_DIR / f"{file_id}{file_extension}"
+        file_location = shard_dir(STORAGE_DIR, file_id) / f"{file_id}{file_extension}"
         
-        with open(file_location, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+        # Copia y validación fuera del bucle de eventos: no bloquea otras peticiones
+        try:
+            received = await receive_upload(file, file_location)
+        except UploadRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=error_response(str(e)))
         
-        if not file_location.exists():
-            raise HTTPException(status_code=500, detail=error_response("No se pudo guardar el archivo"))
+        JobRegistry.shared().register_file(file_id, "autofit", file_location, original_name, {
+            "sha256": received["sha256"],
+            "size": received["size"]
+        })
         
         return success_response({
             "file_id": file_id,
@@ -280,35 +337,52 @@ async def process_autofit(file_id: str = Form(...), original_name: str = Form(No
     """Procesa un archivo PPTX previamente subido para aplicar autofit."""
     try:
         # Buscar archivo por ID
-        files = list(STORAGE_DIR.glob(f"{file_id}.*"))
+        registry = JobRegistry.shared()
+        uploaded = registry.get_file(file_id)
         
-        if not files:
+        if not uploaded or not Path(uploaded["path"]).exists():
             raise HTTPException(status_code=404, detail=error_response("Archivo no encontrado"))
         
-        file_path = files[0]
+        file_path = Path(uploaded["path"])
+        original_name = original_name or uploaded["original_name"]
         
         # Usar el nombre original o un UUID si no está disponible
         output_filename = f"{original_name or file_id}_autofit.pptx"
         output_path = STORAGE_DIR / output_filename
         
-        # Procesar archivo
-        result_path = procesar_pptx(file_path, output_path, silent=False)
+        # Registrar trabajo
+        job_id = str(uuid.uuid4())
+        _, created = registry.create_job(job_id, "autofit", file_id, {"output_filename": output_filename}, status="processing")
+        if not created:
+            raise HTTPException(status_code=409, detail=error_response("El archivo ya se está procesando"))
         
-        # Verificar que el archivo procesado existe
-        if not Path(result_path).exists():
-            raise HTTPException(
-                status_code=500, 
-                detail=error_response("El procesamiento falló: No se generó el archivo")
-            )
+        # Procesar archivo
+        try:
+            result_path = procesar_pptx(file_path, output_path, silent=False)
+            
+            # Verificar que el archivo procesado existe
+            if not Path(result_path).exists():
+                raise HTTPException(
+                    status_code=500, 
+                    detail=error_response("El procesamiento falló: No se generó el archivo")
+                )
+        except HTTPException as e:
+            registry.transition(job_id, "error", e.detail)
+            raise
+        except Exception as e:
+            registry.transition(job_id, "error", error_response(str(e)))
+            raise
         
         # Construir respuesta
         response_data = {
+            "job_id": job_id,
             "file_id": file_id,
             "original_name": original_name,
             "processed_file": result_path,
             "output_filename": output_filename,
             "download_url": f"/api/autofit/download/{output_filename}"
         }
+        registry.transition(job_id, "completed", response_data)
         
         return success_response(response_data)
     except HTTPException:
@@ -320,7 +394,7 @@ async def process_autofit(file_id: str = Form(...), original_name: str = Form(No
         )
 
 @router.get("/download/{filename}")
-async def download_file(filename: str):
+async def download_file(filename: str, request: Request):
     """Descarga un archivo procesado por autofit."""
     file_path = STORAGE_DIR / filename
     if not file_path.exists():
@@ -329,11 +403,7 @@ async def download_file(filename: str):
             detail=error_response("Archivo no encontrado")
         )
     
-    return FileResponse(
-        path=file_path,
-        media_type="application/vnd.openxmlformats-officedocument.presentationml.presentation",
-        filename=filename
-    )
+    return await serve_file(request, file_path, filename)
 
 #===================================
 # BLOQUE 4: CLI principal
@@ -342,7 +412,7 @@ async def download_file(filename: str):
 def main():
     """Función principal del script."""
     parser = argparse.ArgumentParser(
-        description="Aplica autofit a presentaciones PPTX usando python-pptx",
+        description="Aplica autofit a presentaciones PPTX",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
     parser.add_argument("pptx_file", nargs="?", type=Path, 
@@ -360,6 +430,8 @@ def main():
     
     parser.add_argument("--output-dir", type=Path, default=DEFAULT_OUTPUT_DIR, 
                       help="Directorio para archivos de salida")
+    parser.add_argument("--engine", choices=AUTOFIT_ENGINES, default=DEFAULT_ENGINE,
+                      help="xml: reescribe solo el XML de las diapositivas; pptx: usa python-pptx")
     
     args = parser.parse_args()
     
@@ -372,12 +444,12 @@ def main():
             if carpeta is None:
                 if input("¿Procesar TODAS las carpetas? (s/N): ").lower() == 's':
                     logger.info(f"Procesando todos los archivos en {args.input_dir}")
-                    procesar_lote(args.input_dir, args.output_dir)
+                    procesar_lote(args.input_dir, args.output_dir, engine=args.engine)
                 else:
                     logger.info("Operación cancelada")
             elif input(f"¿Procesar la carpeta {carpeta.name}? (S/n): ").lower() != 'n':
                 logger.info(f"Procesando carpeta {carpeta.name}")
-                procesar_lote(carpeta, args.output_dir / carpeta.name)
+                procesar_lote(carpeta, args.output_dir / carpeta.name, engine=args.engine)
             else:
                 logger.info("Operación cancelada")
         elif args.pptx_file or (not args.batch and len(sys.argv) > 1):
@@ -385,11 +457,11 @@ def main():
             archivo = args.pptx_file or Path(sys.argv[1])
             salida = args.output or (Path(sys.argv[2]) if len(sys.argv) > 2 else None)
             logger.info(f"Procesando archivo: {archivo}")
-            procesar_pptx(archivo, salida)
+            procesar_pptx(archivo, salida, engine=args.engine)
         else:
             # Procesamiento por lotes
             logger.info(f"Procesando todos los archivos en {args.input_dir}")
-            procesar_lote(args.input_dir, args.output_dir)
+            procesar_lote(args.input_dir, args.output_dir, engine=args.engine)
             
         return 0
     except Exception as e:
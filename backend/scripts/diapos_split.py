@@ -2,18 +2,57 @@
 from pathlib import Path
 import os
 import logging
-import tempfile
 import shutil
 import re
 import sys
 import uuid
 import json
+import asyncio
 import argparse
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable
 
-from pptx import Presentation
-from fastapi import FastAPI, APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, APIRouter, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+
+try:
+    from scripts.pptx_package import SlidePackage, map_unordered, write_slide_range
+except ImportError:
+    from pptx_package import SlidePackage, map_unordered, write_slide_range
+
+try:
+    from scripts.file_serving import serve_file
+except ImportError:
+    from file_serving import serve_file
+
+try:
+    from scripts.upload_pipeline import receive_upload, UploadRejected
+except ImportError:
+    from upload_pipeline import receive_upload, UploadRejected
+
+try:
+    from scripts.zip_stream import zip_response
+except ImportError:
+    from zip_stream import zip_response
+
+try:
+    from scripts.file_store import ContentStore, new_storage_path, stored_path, result_key
+except ImportError:
+    from file_store import ContentStore, new_storage_path, stored_path, result_key
+
+try:
+    from scripts.job_queue import JobQueue, register_handler, submit, start_workers, stop_workers
+except ImportError:
+    from job_queue import JobQueue, register_handler, submit, start_workers, stop_workers
+
+try:
+    from scripts.job_registry import JobRegistry
+except ImportError:
+    from job_registry import JobRegistry
+
+try:
+    from scripts.job_events import EVENTS, ProgressTracker
+except ImportError:
+    from job_events import EVENTS, ProgressTracker
 
 # Configuración de logging
 logger = logging.getLogger("diapos_split")
@@ -31,11 +70,29 @@ STORAGE_DIR.mkdir(exist_ok=True, parents=True)
 # DEFINIR EL ROUTER COMO VARIABLE GLOBAL igual que en diapos_autofit.py
 router = APIRouter(prefix="/api/pptx", tags=["pptx"])
 
+def part_base_name(stem: str) -> str:
+    """Nombre base de las partes, sin sufijos de procesos anteriores"""
+    return re.sub(r'_(autofit|translated|parte\d*)$', '', stem)
+
+def part_filename(base_name: str, number: int) -> str:
+    return f"{base_name}_parte {number}.pptx"
+
 def split_presentation(
     input_file: str, 
     output_dir: Optional[str] = None, 
-    slides_per_chunk: int = 20
+    slides_per_chunk: int = 20,
+    progress: Optional[Callable[..., None]] = None,
+    destination: Optional[Callable[[str], Path]] = None,
+    on_part: Optional[Callable[[int, Path, int, int], None]] = None
 ) -> List[str]:
+    """
+    Divide la presentación en partes de `slides_per_chunk` diapositivas.
+    
+    Las partes se escriben en paralelo en el pool de procesos. `destination` decide la ruta
+    final de cada archivo a partir de su nombre (por defecto, dentro de `output_dir`) y
+    `on_part(nº de parte, ruta, primera, última diapositiva)` se llama en cuanto cada parte
+    está escrita, en el orden en que terminan.
+    """
     input_path = Path(input_file).resolve()
     logger.info(f"Dividiendo presentación: {input_path}")
     
@@ -45,58 +102,38 @@ def split_presentation(
     if input_path.suffix.lower() != '.pptx':
         raise ValueError(f"El archivo debe ser PPTX: {input_file}")
     
-    output_dir = Path(output_dir or input_path.parent / f"{input_path.stem}_partes").resolve()
-    output_dir.mkdir(parents=True, exist_ok=True)
+    if destination is None:
+        output_dir = Path(output_dir or input_path.parent / f"{input_path.stem}_partes").resolve()
+        output_dir.mkdir(parents=True, exist_ok=True)
+        destination = lambda filename: output_dir / filename
     
     try:
-        # Cargar presentación y calcular chunks
-        prs = Presentation(input_path)
-        total_slides = len(prs.slides)
+        # Leer una sola vez las relaciones del paquete y calcular chunks
+        package = SlidePackage(input_path)
+        total_slides = len(package.slides)
         num_chunks = (total_slides + slides_per_chunk - 1) // slides_per_chunk
         logger.info(f"Presentación tiene {total_slides} diapositivas, se crearán {num_chunks} archivos")
         
-        output_files = []
-        base_name = re.sub(r'_(autofit|translated|parte\d*)$', '', input_path.stem)
+        base_name = part_base_name(input_path.stem)
         
-        # Procesar cada chunk
-        for chunk in range(num_chunks):
-            start_idx = chunk * slides_per_chunk
-            end_idx = min((chunk + 1) * slides_per_chunk, total_slides)
-            logger.info(f"Procesando parte {chunk+1}: diapositivas {start_idx+1}-{end_idx}")
-            
-            # Crear copia temporal de la presentación
-            with tempfile.NamedTemporaryFile(suffix='.pptx', delete=False) as temp_file:
-                temp_path = temp_file.name
-            
-            try:
-                # Copiar y procesar
-                shutil.copy2(input_path, temp_path)
-                new_prs = Presentation(temp_path)
-                
-                # Eliminar diapositivas fuera del rango (orden inverso)
-                slides_to_delete = list(range(0, start_idx)) + list(range(end_idx, total_slides))
-                for idx in sorted(slides_to_delete, reverse=True):
-                    slide_id = new_prs.slides._sldIdLst[idx].rId
-                    new_prs.part.drop_rel(slide_id)
-                    del new_prs.slides._sldIdLst[idx]
-                
-                # Guardar el archivo resultante
-                output_filename = f"{base_name}_parte {chunk+1}.pptx"
-                output_path = output_dir / output_filename
-                
-                new_prs.save(str(output_path))
-                output_files.append(str(output_path))
-                
-            except Exception as e:
-                logger.error(f"Error al procesar parte {chunk+1}: {str(e)}")
-                raise
-            finally:
-                try:
-                    os.unlink(temp_path)
-                except:
-                    pass
+        # Cada chunk solo copia sus diapositivas y las partes que estas usan
+        ranges = [(chunk * slides_per_chunk, min((chunk + 1) * slides_per_chunk, total_slides))
+                  for chunk in range(num_chunks)]
+        output_files = [destination(part_filename(base_name, chunk + 1)) for chunk in range(num_chunks)]
+        
+        slides_written = 0
+        tasks = ((package, str(path), start_idx, end_idx) for path, (start_idx, end_idx) in zip(output_files, ranges))
+        for done, (chunk, stats) in enumerate(map_unordered(write_slide_range, tasks, min_parallel=2), 1):
+            start_idx, end_idx = ranges[chunk]
+            slides_written += end_idx - start_idx
+            logger.info(f"Parte {chunk+1} escrita: diapositivas {start_idx+1}-{end_idx}, "
+                        f"{stats['copied'] + stats['rewritten']} miembros, {stats['skipped']} omitidos")
+            if on_part:
+                on_part(chunk + 1, output_files[chunk], start_idx + 1, end_idx)
+            if progress:
+                progress("splitting", done, num_chunks, slides_processed=slides_written, total_slides=total_slides)
                     
-        return output_files
+        return [str(path) for path in output_files]
         
     except Exception as e:
         logger.error(f"Error durante el proceso: {str(e)}", exc_info=True)
@@ -163,69 +200,116 @@ def cli_main():
         return 1
 
 # ----- PARTE API -----
-def save_to_storage(file_path: str) -> str:
-    file_id = str(uuid.uuid4())
-    dest_dir = STORAGE_DIR / file_id
-    dest_dir.mkdir(exist_ok=True)
-    
-    dest_path = dest_dir / Path(file_path).name
-    shutil.copy2(file_path, dest_path)
-    
-    return file_id
-
-def process_pptx_task(input_path: str, output_dir: str, slides_per_chunk: int, job_id: str) -> None:
-    result_file = STORAGE_DIR / f"{job_id}_result.json"
+def process_pptx_task(input_path: str, output_dir: str, slides_per_chunk: int, job_id: str,
+                      result_key: Optional[str] = None) -> None:
+    registry = JobRegistry.shared()
+    if not registry.transition(job_id, "processing"):
+        # La cola puede repetir un trabajo interrumpido justo después de terminar
+        logger.info(f"El trabajo {job_id} ya había terminado; no se repite")
+        return
+    store = ContentStore.shared()
+    created_dirs = []
     
     try:
         # Comprobar tamaño y procesar archivo
         file_size_mb = os.path.getsize(input_path) / (1024 * 1024)
         logger.info(f"Procesando: {input_path} ({file_size_mb:.2f} MB), diapositivas/chunk: {slides_per_chunk}")
         
-        # Dividir la presentación
-        output_files = split_presentation(input_path, output_dir, slides_per_chunk)
+        # Las partes se escriben directamente en el almacenamiento y se publican al terminar
+        # cada una, así pueden descargarse antes de que acabe la última
+        results = {}
+        hashes = {}
+        
+        def destination(filename):
+            path = new_storage_path(STORAGE_DIR, filename)
+            created_dirs.append(path.parent)
+            return path
+        
+        def part_written(number, path, first_slide, last_slide):
+            # Por contenido: una parte idéntica a otra ya almacenada comparte sus bytes
+            hashes[number] = store.store(path, path)
+            results[number] = {
+                "part": number,
+                "file_id": path.parent.name,
+                "filename": path.name,
+                "url": f"/api/pptx/files/{path.parent.name}/{path.name}",
+                "slides": f"{first_slide}-{last_slide}"
+            }
+            registry.report(job_id, {"status": "processing", "files": [results[n] for n in sorted(results)]})
+        
+        # Dividir la presentación, con avance en vivo para /jobs/{job_id}/events
+        tracker = ProgressTracker(job_id, {"splitting": 1.0})
+        output_files = split_presentation(input_path, output_dir, slides_per_chunk, progress=tracker.update,
+                                          destination=destination, on_part=part_written)
         
         if not output_files:
             raise Exception("No se generaron archivos de salida")
         
-        # Guardar resultados
-        results = []
-        for output_file in output_files:
-            file_id = save_to_storage(str(output_file))
-            filename = Path(output_file).name
-            results.append({
-                "file_id": file_id,
-                "filename": filename,
-                "url": f"/api/pptx/files/{file_id}/{filename}"
-            })
-        
-        # Guardar resultado exitoso
-        with open(result_file, "w", encoding="utf-8") as f:
-            json.dump({"status": "completed", "files": results}, f, ensure_ascii=False)
+        # Guardar resultado exitoso y recordarlo para peticiones idénticas
+        result_data = {"status": "completed", "files": [results[n] for n in sorted(results)]}
+        if result_key:
+            store.remember(result_key, result_data, [
+                {"sha256": hashes[n], "filename": results[n]["filename"]} for n in sorted(results)
+            ])
+        registry.transition(job_id, "completed", result_data)
             
     except Exception as e:
-        # Guardar resultado con error
+        # Guardar resultado con error y descartar las partes ya escritas
         logger.error(f"Error procesando PPTX: {str(e)}", exc_info=True)
+        for created_dir in created_dirs:
+            for path in Path(created_dir).glob("*"):
+                store.release(path)
+            shutil.rmtree(created_dir, ignore_errors=True)
         try:
-            with open(result_file, "w", encoding="utf-8") as f:
-                json.dump({"status": "error", "message": str(e)}, f, ensure_ascii=False)
+            registry.transition(job_id, "error", {"status": "error", "message": str(e)})
         except Exception as write_error:
             logger.error(f"Error al escribir resultado: {str(write_error)}")
     finally:
         # Limpiar archivos temporales
         try:
-            if os.path.exists(input_path):
-                os.unlink(input_path)
+            store.release(input_path)
             if os.path.exists(output_dir):
                 shutil.rmtree(output_dir)
         except Exception as e:
             logger.error(f"Error limpiando temporales: {str(e)}")
 
+register_handler("split", process_pptx_task)
+
+# La cola de trabajos arranca y se detiene con la aplicación
+router.on_event("startup")(start_workers)
+router.on_event("shutdown")(stop_workers)
+
+def reuse_split(key: str, job_id: str, filename: str, job_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Registra como completado un trabajo idéntico a uno anterior, enlazando sus partes"""
+    store = ContentStore.shared()
+    previous = store.recall(key)
+    if not previous:
+        return None
+    
+    files = []
+    base_name = part_base_name(Path(filename).stem)
+    for entry, stored in zip(previous["result"]["files"], previous["files"]):
+        dest = store.link(stored["sha256"], new_storage_path(STORAGE_DIR, part_filename(base_name, entry["part"])))
+        if dest is None:
+            for linked in files:
+                store.release(stored_path(STORAGE_DIR, linked["file_id"], linked["filename"]))
+            return None
+        files.append({**entry, "file_id": dest.parent.name, "filename": dest.name,
+                      "url": f"/api/pptx/files/{dest.parent.name}/{dest.name}"})
+    
+    result = {"status": "completed", "files": files, "reused": True}
+    registry = JobRegistry.shared()
+    registry.create_job(job_id, "split", data=job_data, status="processing")
+    registry.transition(job_id, "completed", result)
+    logger.info(f"Partes reutilizadas de una división idéntica: job_id={job_id}")
+    return {"job_id": job_id, "message": "Partes reutilizadas de una división idéntica", **result}
+
 # Definir los endpoints directamente en el router global
 @router.post("/split")
 async def split_pptx_endpoint(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    slides_per_chunk: int = Form(20)
+    slides_per_chunk: int = Form(20),
+    priority: int = Form(0)
 ) -> JSONResponse:
     try:
         logger.info(f"Solicitud recibida: archivo={file.filename}, slides_per_chunk={slides_per_chunk}")
@@ -237,32 +321,50 @@ async def split_pptx_endpoint(
         if not 1 <= slides_per_chunk <= 100:
             raise HTTPException(status_code=400, detail="El número de diapositivas debe estar entre 1 y 100")
         
-        # Crear directorios temporales
-        temp_dir = tempfile.mkdtemp()
+        # Directorio de trabajo persistente: el trabajo puede reanudarse tras un reinicio
+        job_id = str(uuid.uuid4())
+        temp_dir = str(JobQueue.shared().workspace(job_id))
         input_path = os.path.join(temp_dir, file.filename)
         output_dir = os.path.join(temp_dir, "output")
         os.makedirs(output_dir, exist_ok=True)
         
-        # Guardar archivo
-        total_size = 0
-        with open(input_path, "wb") as buffer:
-            chunk_size = 1024 * 1024  # 1MB chunks
-            while chunk := await file.read(chunk_size):
-                buffer.write(chunk)
-                total_size += len(chunk)
+        # Guardar y validar el archivo fuera del bucle de eventos, con su SHA-256
+        try:
+            received = await receive_upload(file, input_path)
+        except UploadRejected as e:
+            await asyncio.to_thread(shutil.rmtree, temp_dir, True)
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        
+        logger.info(f"Archivo guardado: {input_path} ({received['size']/1024/1024:.2f} MB)")
+        content_hash = received["sha256"]
+        key = result_key(content_hash, "split", {"slides_per_chunk": slides_per_chunk})
+        job_data = {"filename": file.filename, "slides_per_chunk": slides_per_chunk, "sha256": content_hash}
         
-        logger.info(f"Archivo guardado: {input_path} ({total_size/1024/1024:.2f} MB)")
+        # Misma presentación y mismo tamaño de parte: devolver las partes ya generadas
+        reused = await asyncio.to_thread(reuse_split, key, job_id, file.filename, job_data)
+        if reused:
+            await asyncio.to_thread(shutil.rmtree, temp_dir, True)
+            return JSONResponse(reused)
         
-        # Generar ID de trabajo e iniciar tarea
-        job_id = str(uuid.uuid4())
-        background_tasks.add_task(process_pptx_task, input_path, output_dir, slides_per_chunk, job_id)
-        logger.info(f"Tarea iniciada: job_id={job_id}")
+        # Por contenido: la misma presentación subida para traducir comparte los bytes
+        await asyncio.to_thread(ContentStore.shared().store, input_path, input_path, content_hash)
+        
+        # Registrar y encolar trabajo
+        JobRegistry.shared().create_job(job_id, "split", data=job_data)
+        await submit("split", {
+            "input_path": input_path,
+            "output_dir": output_dir,
+            "slides_per_chunk": slides_per_chunk,
+            "job_id": job_id,
+            "result_key": key
+        }, priority=priority, job_id=job_id)
+        logger.info(f"Trabajo encolado: job_id={job_id}")
         
         # Devolver respuesta inmediata
         return JSONResponse({
             "job_id": job_id,
-            "status": "processing",
-            "message": "Procesando presentación en segundo plano"
+            "status": "queued",
+            "message": "Presentación en cola para procesar"
         })
     except HTTPException:
         raise
@@ -272,38 +374,66 @@ async def split_pptx_endpoint(
 
 @router.get("/jobs/{job_id}")
 async def get_job_status(job_id: str) -> JSONResponse:
-    result_file = STORAGE_DIR / f"{job_id}_result.json"
+    job = JobRegistry.shared().get_job(job_id)
     
-    if not result_file.exists():
-        return JSONResponse({
-            "job_id": job_id,
-            "status": "processing",
-            "message": "El trabajo sigue en proceso"
-        })
+    if job and job["status"] in ("completed", "error"):
+        return JSONResponse(job["result"] or {"status": job["status"]})
     
-    try:
-        with open(result_file, "r", encoding="utf-8") as f:
-            return JSONResponse(json.load(f))
-    except Exception as e:
-        logger.error(f"Error leyendo resultado {result_file}: {str(e)}")
+    queued = JobQueue.shared().get(job_id)
+    if queued and queued["status"] == "queued":
         return JSONResponse({
             "job_id": job_id,
-            "status": "error",
-            "message": f"Error al recuperar el estado: {str(e)}"
+            "status": "queued",
+            "message": "El trabajo está en cola",
+            "queue_position": queued["position"]
         })
+    if queued and queued["status"] == "failed":
+        error_data = {"status": "error", "message": queued["error"]}
+        JobRegistry.shared().transition(job_id, "error", error_data)
+        return JSONResponse({"job_id": job_id, **error_data})
+    
+    # Partes ya escritas: se pueden descargar mientras se generan las demás
+    return JSONResponse({
+        "job_id": job_id,
+        "status": "processing",
+        "message": "El trabajo sigue en proceso",
+        "files": (job["result"] or {}).get("files", []) if job else []
+    })
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str) -> StreamingResponse:
+    """Progreso del trabajo en vivo (Server-Sent Events) hasta que termina"""
+    if EVENTS.snapshot(job_id) is None and JobRegistry.shared().get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    
+    return StreamingResponse(
+        EVENTS.stream(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/jobs/{job_id}/download-all")
+async def download_all_parts(job_id: str):
+    """Todas las partes escritas del trabajo en un único ZIP generado mientras se envía"""
+    job = JobRegistry.shared().get_job(job_id)
+    files = (job["result"] or {}).get("files", []) if job else []
+    parts = [(stored_path(STORAGE_DIR, f["file_id"], f["filename"]), f["filename"]) for f in files]
+    parts = [(path, name) for path, name in parts if path.exists()]
+    
+    if not parts:
+        raise HTTPException(status_code=404, detail="El trabajo no tiene partes disponibles")
+    
+    base_name = part_base_name(Path(job["data"].get("filename") or "presentacion").stem)
+    return zip_response(parts, f"{base_name}_partes.zip")
 
 @router.get("/files/{file_id}/{filename}")
-async def get_file(file_id: str, filename: str) -> FileResponse:
-    file_path = STORAGE_DIR / file_id / filename
+async def get_file(file_id: str, filename: str, request: Request) -> Response:
+    file_path = stored_path(STORAGE_DIR, file_id, filename)
     
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
     
-    return FileResponse(
-        path=file_path,
-        filename=filename,
-        media_type="application/vnd.openxmlformats-officedocument.presentationml.presentation"
-    )
+    return await serve_file(request, file_path, filename)
 
 # Función para crear API independiente (mantener para retrocompatibilidad)
 def create_api():
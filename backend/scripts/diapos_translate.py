@@ -1,13 +1,55 @@
 #!/usr/bin/env python3
-import argparse, sys, time, os, json, re, zipfile, tempfile, shutil, uuid, logging
+import argparse, sys, time, os, json, re, zipfile, tempfile, shutil, uuid, logging, threading, sqlite3, asyncio, weakref
+from collections import OrderedDict
+from concurrent.futures import Future
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Tuple, Union
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse, FileResponse
-from openai import OpenAI
+from typing import Dict, List, Any, Optional, Tuple, Union, Callable
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from openai import AsyncOpenAI, RateLimitError
 import tiktoken
 from xml.etree import ElementTree as ET
 
+try:
+    from scripts.pptx_package import rewrite_package, list_members, map_ordered, open_packages, submit_to_pool, PARALLEL_MIN_PARTS, extract_part_texts, apply_part_translations
+except ImportError:
+    from pptx_package import rewrite_package, list_members, map_ordered, open_packages, submit_to_pool, PARALLEL_MIN_PARTS, extract_part_texts, apply_part_translations
+
+try:
+    from scripts.job_queue import JobQueue, register_handler, submit, start_workers, stop_workers, queue_stats
+except ImportError:
+    from job_queue import JobQueue, register_handler, submit, start_workers, stop_workers, queue_stats
+
+try:
+    from scripts.job_registry import JobRegistry
+except ImportError:
+    from job_registry import JobRegistry
+
+try:
+    from scripts.job_events import EVENTS, ProgressTracker
+except ImportError:
+    from job_events import EVENTS, ProgressTracker
+
+try:
+    from scripts.file_serving import serve_file
+except ImportError:
+    from file_serving import serve_file
+
+try:
+    from scripts.upload_pipeline import receive_upload, UploadRejected
+except ImportError:
+    from upload_pipeline import receive_upload, UploadRejected
+
+try:
+    from scripts.zip_stream import zip_response
+except ImportError:
+    from zip_stream import zip_response
+
+try:
+    from scripts.file_store import ContentStore, store_result, new_storage_path, stored_path, shard_dir, result_key
+except ImportError:
+    from file_store import ContentStore, store_result, new_storage_path, stored_path, shard_dir, result_key
+
 # Configurar logger
 logger = logging.getLogger("translate-pptx")
 logger.setLevel(logging.INFO)
@@ -24,14 +66,41 @@ router = APIRouter(prefix="/api/translate", tags=["translate"])
 
 # Configuración global
 CONFIG = {
-    "storage_dir": Path(os.environ.get("STORAGE_DIR", "/app/storage")),
-    "cache_dir": Path(os.environ.get("CACHE_DIR", "/app/storage/cache")),
+    "storage_dir": Path(os.environ.get("STORAGE_DIR", "./storage")),
+    # Caché de traducciones dentro del mismo árbol de almacenamiento por defecto
+    "cache_dir": Path(os.environ.get("CACHE_DIR") or Path(os.environ.get("STORAGE_DIR", "./storage")) / "cache"),
     "supported_languages": ["es", "en", "fr", "de", "it", "pt"],
     "retries": 3,
     "wait_times": {"base": 2.0, "max": 30.0, "backoff": 2.0},
     "headers": {"OpenAI-Beta": "assistants=v2"},
+    # Transporte de traducción: "chat" (chat.completions en streaming) o "assistant" (Assistants API)
+    "transport": os.environ.get("TRANSLATE_TRANSPORT", "chat"),
+    "model": os.environ.get("TRANSLATE_MODEL", "gpt-4o"),
+    "temperature": 0.3,
+    # Sondeo adaptativo de runs del asistente (segundos)
+    "polling": {"min_interval": 0.25, "max_interval": 3.0, "backoff": 1.5, "max_wait": 180.0,
+                "base_overhead": 1.0, "learning_rate": 0.3},
     "use_cache": True,
-    "batch_size": 10
+    # Cambiar al modificar el prompt o el modelo para no reutilizar traducciones antiguas
+    "prompt_version": "1",
+    # Tope de memoria de la capa LRU compartida delante de SQLite
+    "cache_memory_mb": int(os.environ.get("TRANSLATE_CACHE_MEMORY_MB", 64)),
+    "batch_size": 10,
+    # Troceado de la traducción: presupuesto de tokens por lote y lotes simultáneos
+    "chunk_max_tokens": int(os.environ.get("TRANSLATE_CHUNK_TOKENS", 1500)),
+    "chunk_max_texts": 60,
+    "max_concurrent_chunks": int(os.environ.get("TRANSLATE_MAX_CONCURRENCY", 4)),
+    # Peticiones a OpenAI en vuelo sumando los trabajos de un mismo bucle de eventos; entre
+    # bucles (trabajos de la cola en hilos distintos) solo reparte el limitador de rate_limits
+    "max_concurrent_requests": int(os.environ.get("TRANSLATE_MAX_REQUESTS", 16)),
+    # Límites de la cuenta de OpenAI repartidos entre todos los trabajos del proceso. Cada
+    # petición reserva unos 2 × chunk_max_tokens (prompt más respuesta), así que el TPM por
+    # defecto deja pasar varias ráfagas de max_concurrent_requests por minuto; ajústalo al
+    # límite real de la cuenta (un TPM menor serializa las peticiones aunque haya huecos libres)
+    "rate_limits": {
+        "rpm": int(os.environ.get("TRANSLATE_RPM", 500)),
+        "tpm": int(os.environ.get("TRANSLATE_TPM", 200000))
+    }
 }
 
 # Rutas posibles para credenciales (solo como fallback)
@@ -45,23 +114,27 @@ CREDENTIALS_PATHS = [
     Path.cwd() / "backend" / "config" / "auth_credentials.json"
 ]
 
-# Crear directorios necesarios con permisos adecuados
-try:
-    CONFIG["storage_dir"].mkdir(exist_ok=True, parents=True, mode=0o777)
-    CONFIG["cache_dir"].mkdir(exist_ok=True, parents=True, mode=0o777)
-    CACHE_FILE = CONFIG["cache_dir"] / "translations.json"
-    logger.info(f"Directorios creados: {CONFIG['storage_dir']} y {CONFIG['cache_dir']}")
-except Exception as e:
-    logger.warning(f"No se pudieron crear directorios con permisos: {e}")
-    # Fallback a directorios temporales si no podemos escribir en las rutas configuradas
-    import tempfile
-    temp_dir = Path(tempfile.gettempdir())
-    CONFIG["storage_dir"] = temp_dir / "pptx_translate_storage"
-    CONFIG["cache_dir"] = temp_dir / "pptx_translate_cache"
-    CONFIG["storage_dir"].mkdir(exist_ok=True, parents=True)
-    CONFIG["cache_dir"].mkdir(exist_ok=True, parents=True)
-    CACHE_FILE = CONFIG["cache_dir"] / "translations.json"
-    logger.info(f"Usando directorios temporales: {CONFIG['storage_dir']} y {CONFIG['cache_dir']}")
+def _writable_dir(path: Path, fallback_name: str) -> Path:
+    """Crea `path`; si no se puede, recurre a un directorio temporal solo para ese directorio"""
+    try:
+        path.mkdir(exist_ok=True, parents=True, mode=0o777)
+        return path
+    except OSError as e:
+        fallback = Path(tempfile.gettempdir()) / fallback_name
+        logger.warning(f"No se pudo crear {path} ({e}); usando {fallback}")
+        fallback.mkdir(exist_ok=True, parents=True)
+        return fallback
+
+# Crear directorios necesarios con permisos adecuados. Cada uno recurre a un temporal por
+# separado: si falla la caché, subidas y resultados siguen en STORAGE_DIR, junto al registro
+# y ContentStore, para moverse y enlazarse sin copias entre sistemas de archivos
+CONFIG["storage_dir"] = _writable_dir(CONFIG["storage_dir"], "pptx_translate_storage")
+CONFIG["cache_dir"] = _writable_dir(CONFIG["cache_dir"], "pptx_translate_cache")
+CONFIG["upload_dir"] = _writable_dir(CONFIG["storage_dir"] / "uploads", "pptx_translate_uploads")
+CACHE_FILE = CONFIG["cache_dir"] / "translations.json"
+CACHE_DB = CONFIG["cache_dir"] / "translations.db"
+RUN_TIMINGS_FILE = CONFIG["cache_dir"] / "run_timings.json"
+logger.info(f"Directorios: {CONFIG['storage_dir']} y {CONFIG['cache_dir']}")
 
 def load_credentials():
     """Carga configuración y credenciales, usando primero las embebidas"""
@@ -74,48 +147,665 @@ def load_credentials():
         }
     }
 
+class MemoryTranslationTier:
+    """Capa LRU en memoria, única por proceso y acotada en bytes, delante del almacén persistente"""
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.resident_bytes = 0
+        self.hits = self.misses = self.evictions = 0
+    
+    @staticmethod
+    def _size(key, value):
+        return sys.getsizeof(key) + sys.getsizeof(value)
+    
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                value = self._entries.get(key)
+                if value is None:
+                    self.misses += 1
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = value
+                self.hits += 1
+        return found
+    
+    def put_many(self, items: Dict[str, str]):
+        with self._lock:
+            for key, value in items.items():
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self.resident_bytes -= self._size(key, previous)
+                size = self._size(key, value)
+                if size > self.max_bytes:
+                    continue
+                self._entries[key] = value
+                self.resident_bytes += size
+            # Expulsar las entradas menos usadas hasta volver al tope
+            while self.resident_bytes > self.max_bytes and self._entries:
+                old_key, old_value = self._entries.popitem(last=False)
+                self.resident_bytes -= self._size(old_key, old_value)
+                self.evictions += 1
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "resident_bytes": self.resident_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions
+            }
+
+MEMORY_TIER = MemoryTranslationTier(CONFIG["cache_memory_mb"] * 1024 * 1024)
+
+class TranslationStore:
+    """Almacén persistente de traducciones en SQLite (modo WAL), compartido por todo el proceso"""
+    
+    _instance = None
+    _instance_lock = threading.Lock()
+    # Límite de variables por consulta en versiones antiguas de SQLite
+    _BATCH = 500
+    
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS translations (
+                    key TEXT PRIMARY KEY,
+                    translation TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._import_json_once()
+    
+    @classmethod
+    def shared(cls):
+        """Devuelve la instancia del proceso, creándola la primera vez"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(CACHE_DB)
+            return cls._instance
+    
+    def _connect(self):
+        """Conexión propia de cada hilo; WAL permite lectores y escritores simultáneos"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+    
+    def _import_json_once(self):
+        """Importa translations.json la primera vez que se abre la base de datos"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM meta WHERE name = 'json_imported'").fetchone():
+                conn.rollback()
+                return
+            imported = skipped = 0
+            if CACHE_FILE.exists():
+                legacy = json.loads(CACHE_FILE.read_text(encoding='utf-8'))
+                now = time.time()
+                rows = []
+                for key, translation in legacy.items():
+                    # Solo las claves con idiomas y versión; las antiguas (texto solo) son ambiguas
+                    if key.count("|") >= 3 and translation:
+                        rows.append((key, translation, now))
+                    else:
+                        skipped += 1
+                conn.executemany("INSERT OR IGNORE INTO translations VALUES (?, ?, ?)", rows)
+                imported = len(rows)
+            conn.execute("INSERT INTO meta VALUES ('json_imported', ?)", (str(int(time.time())),))
+            conn.commit()
+            if imported or skipped:
+                logger.info(f"Caché JSON importada: {imported} traducciones, {skipped} claves antiguas descartadas")
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error al importar la caché JSON: {e}")
+    
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        """Búsqueda puntual por clave primaria, en bloques"""
+        found = {}
+        conn = self._connect()
+        for start in range(0, len(keys), self._BATCH):
+            batch = keys[start:start + self._BATCH]
+            placeholders = ",".join("?" * len(batch))
+            found.update(conn.execute(
+                f"SELECT key, translation FROM translations WHERE key IN ({placeholders})", batch
+            ).fetchall())
+        return found
+    
+    def set_many(self, items: Dict[str, str]):
+        """Inserta o reemplaza varias traducciones en una sola transacción"""
+        if not items:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?)",
+                [(key, translation, now) for key, translation in items.items()]
+            )
+    
+    def count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
 class TranslationCache:
+    """Caché de traducciones por (idioma origen, idioma destino, versión, texto normalizado)"""
+    
     def __init__(self):
-        self.cache, self.modified = {}, False
+        self.pending = {}
         self.hits = self.misses = 0
         try:
-            if CACHE_FILE.exists():
-                self.cache = json.loads(CACHE_FILE.read_text(encoding='utf-8'))
-                logger.info(f"Caché cargada: {len(self.cache)} traducciones")
-            else:
-                logger.info("Creando nueva caché")
+            self.store = TranslationStore.shared()
         except Exception as e:
             logger.error(f"Error de caché: {e}")
+            self.store = None
+    
+    @staticmethod
+    def normalize(text):
+        """Normaliza espacios para que variantes triviales compartan entrada"""
+        return " ".join(text.split())
     
-    def get(self, text):
+    @classmethod
+    def make_key(cls, text, source_language, target_language, version):
+        """Construye la clave de caché; el texto va al final porque puede contener '|'"""
+        return f"{source_language.strip().lower()}|{target_language.strip().lower()}|{version}|{cls.normalize(text)}"
+    
+    def get_many(self, texts, source_language, target_language, version):
+        """Devuelve {texto: traducción} para los textos presentes en caché"""
+        keys = {}
+        for text in texts:
+            if text and text.strip():
+                keys.setdefault(self.make_key(text, source_language, target_language, version), []).append(text)
+        found = dict((key, self.pending[key]) for key in keys if key in self.pending)
+        found.update(MEMORY_TIER.get_many([key for key in keys if key not in found]))
+        missing = [key for key in keys if key not in found]
+        if self.store and missing:
+            try:
+                from_store = self.store.get_many(missing)
+                MEMORY_TIER.put_many(from_store)
+                found.update(from_store)
+            except Exception as e:
+                logger.error(f"Error al consultar caché: {e}")
+        result = {}
+        for key, key_texts in keys.items():
+            if key in found:
+                self.hits += len(key_texts)
+                for text in key_texts:
+                    result[text] = found[key]
+            else:
+                self.misses += len(key_texts)
+        return result
+    
+    def get(self, text, source_language, target_language, version):
         if not text or not text.strip(): return None
-        if text in self.cache:
-            self.hits += 1
-            return self.cache[text]
-        self.misses += 1
-        return None
+        return self.get_many([text], source_language, target_language, version).get(text)
     
-    def set(self, text, translation):
+    def set(self, text, translation, source_language, target_language, version):
         if text and text.strip() and translation:
-            self.cache[text] = translation
-            self.modified = True
+            key = self.make_key(text, source_language, target_language, version)
+            self.pending[key] = translation
+            # Visible para los demás trabajos del proceso antes de persistirse
+            MEMORY_TIER.put_many({key: translation})
     
     def save(self):
-        if not self.modified: return
+        """Escribe en bloque las traducciones nuevas"""
+        if not self.pending or not self.store: return
         try:
-            CACHE_FILE.write_text(json.dumps(self.cache, ensure_ascii=False, indent=2), encoding='utf-8')
-            logger.info(f"Caché guardada: {len(self.cache)} traducciones")
-            self.modified = False
+            self.store.set_many(self.pending)
+            logger.info(f"Caché guardada: {len(self.pending)} traducciones nuevas")
+            self.pending = {}
         except Exception as e:
             logger.error(f"Error al guardar caché: {e}")
 
+# Objetos asyncio (cliente, semáforos) compartidos por los trabajos de un mismo bucle de eventos
+_LOOP_STATE = weakref.WeakKeyDictionary()
+
+def loop_shared(name, factory):
+    """Devuelve el objeto `name` del bucle de eventos actual, creándolo la primera vez"""
+    state = _LOOP_STATE.setdefault(asyncio.get_running_loop(), {})
+    if name not in state:
+        state[name] = factory()
+    return state[name]
+
+def openai_client(api_key) -> AsyncOpenAI:
+    """Cliente asíncrono de OpenAI con su pool de conexiones compartido en el bucle actual"""
+    # Sin reintentos del SDK: los 429/5xx vuelven a _translate_chunk, que pasa por el
+    # limitador compartido (cupo de tokens y pausa de retry-after común a todos los trabajos)
+    return loop_shared(("openai", api_key), lambda: AsyncOpenAI(api_key=api_key, max_retries=0))
+
+def run_sync(coro):
+    """Ejecuta una corrutina del pipeline desde código síncrono (CLI, hilos o scripts)"""
+    return asyncio.run(coro)
+
+_ENCODER = None
+_ENCODER_LOADED = False
+
+def _token_encoder():
+    """Carga cl100k_base una sola vez; si no está disponible se recuerda el fallo"""
+    global _ENCODER, _ENCODER_LOADED
+    if not _ENCODER_LOADED:
+        try:
+            _ENCODER = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"No se pudo cargar cl100k_base, se estimarán tokens por longitud: {e}")
+        _ENCODER_LOADED = True
+    return _ENCODER
+
+def estimate_tokens(text):
+    """Estima tokens en un texto para el modelo cl100k_base"""
+    if not text: return 0
+    encoder = _token_encoder()
+    if encoder is None:
+        return len(text) // 4
+    return len(encoder.encode(text))
+
+class RunTimeEstimator:
+    """Aprende por modelo cuánto tarda un run: una parte fija más un tiempo por token"""
+    
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.models: Dict[str, Dict[str, float]] = {}
+        try:
+            if self.path.exists():
+                self.models = json.loads(self.path.read_text(encoding='utf-8'))
+        except Exception as e:
+            logger.warning(f"No se pudieron cargar los tiempos de runs: {e}")
+    
+    def expected(self, model, tokens) -> Optional[float]:
+        """Tiempo esperado hasta completar un run, o None si aún no hay historial"""
+        stats = self.models.get(model)
+        if not stats:
+            return None
+        return stats["overhead"] + stats["per_token"] * tokens
+    
+    def record(self, model, tokens, seconds):
+        """Incorpora un run completado con media móvil exponencial"""
+        overhead = CONFIG["polling"]["base_overhead"]
+        rate = CONFIG["polling"]["learning_rate"]
+        sample = max(0.0, seconds - overhead) / max(tokens, 1)
+        with self._lock:
+            stats = self.models.get(model)
+            if stats is None:
+                stats = self.models[model] = {"overhead": overhead, "per_token": sample, "samples": 0}
+            else:
+                stats["per_token"] = (1 - rate) * stats["per_token"] + rate * sample
+            stats["samples"] += 1
+            try:
+                self.path.write_text(json.dumps(self.models, indent=2), encoding='utf-8')
+            except Exception as e:
+                logger.warning(f"No se pudieron guardar los tiempos de runs: {e}")
+
+RUN_TIMINGS = RunTimeEstimator(RUN_TIMINGS_FILE)
+
+class RateLimiter:
+    """Doble cubo de tokens (peticiones y tokens por minuto) compartido por todo el proceso"""
+    
+    _instance = None
+    _instance_lock = threading.Lock()
+    
+    def __init__(self, rpm, tpm):
+        self.rpm, self.tpm = rpm, tpm
+        self.requests_available = float(rpm)
+        self.tokens_available = float(tpm)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        # threading.Lock y no asyncio.Lock: los trabajos corren en bucles de eventos distintos
+        # (uno por hilo de la cola), y solo se retiene para cuadrar cuentas, nunca durante la espera
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def shared(cls):
+        """Devuelve la instancia del proceso, creándola la primera vez"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                limits = CONFIG["rate_limits"]
+                cls._instance = cls(limits["rpm"], limits["tpm"])
+            return cls._instance
+    
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        self.requests_available = min(self.rpm, self.requests_available + elapsed * self.rpm / 60)
+        self.tokens_available = min(self.tpm, self.tokens_available + elapsed * self.tpm / 60)
+    
+    async def acquire(self, tokens) -> float:
+        """Espera hasta poder hacer una petición de `tokens` tokens; devuelve los segundos esperados"""
+        # Una petición mayor que el cubo entero nunca cabría: se limita al máximo
+        tokens = min(tokens, self.tpm)
+        started = time.monotonic()
+        with self._lock:
+            # El cupo se reserva al llegar aunque el cubo quede en negativo: cada petición espera
+            # a que se repongan las reservas anteriores, así se atienden por orden de llegada
+            self._refill()
+            self.requests_available -= 1
+            self.tokens_available -= tokens
+            wait = max(
+                -self.requests_available * 60 / self.rpm,
+                -self.tokens_available * 60 / self.tpm,
+                self.paused_until - time.monotonic()
+            )
+        while wait > 0:
+            await asyncio.sleep(wait)
+            # Una pausa por 429 llegada mientras se esperaba también detiene esta petición
+            wait = self.paused_until - time.monotonic()
+        return time.monotonic() - started
+    
+    def pause(self, seconds):
+        """Detiene todas las peticiones (p. ej. tras un 429 con retry-after)"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+def rate_limiter() -> RateLimiter:
+    """Limitador único del proceso, compartido por los trabajos de todos los bucles de eventos"""
+    return RateLimiter.shared()
+
+def retry_after_seconds(error) -> Optional[float]:
+    """Lee los encabezados retry-after(-ms) de un error de la API, si los trae"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+def parse_numbered_translations(translation_text: str, expected: int) -> List[str]:
+    """Extrae las traducciones numeradas [1], [2]... de una respuesta completa"""
+    # Buscar todos los bloques numerados [1], [2], etc. en la respuesta
+    pattern = r"\[(\d+)\](.*?)(?=\[\d+\]|$)"
+    matches = re.findall(pattern, translation_text, re.DOTALL)
+    
+    logger.info(f"Coincidencias encontradas con patrón: {len(matches)}")
+    
+    # Si no hay coincidencias o faltan algunas, intentar extraer línea por línea
+    if not matches or len(matches) < expected:
+        logger.warning(f"No se encontraron suficientes coincidencias. Procesando líneas...")
+        translations = []
+        for line in translation_text.strip().split("\n"):
+            if line.strip():
+                # Limpiar cualquier numeración al inicio de la línea
+                translations.append(re.sub(r'^\s*\[\d+\]\s*', '', line.strip()))
+        logger.info(f"Líneas procesadas: {len(translations)}")
+    else:
+        # Ordenar las coincidencias por número y extraer solo el texto
+        translations = [
+            re.sub(r'^\s*\[\d+\]\s*', '', text.strip())
+            for _, text in sorted(matches, key=lambda x: int(x[0]))
+        ]
+        logger.info(f"Coincidencias procesadas: {len(translations)}")
+    
+    # Verificar que tenemos el mismo número de traducciones que de textos originales
+    if len(translations) != expected:
+        logger.warning(f"Desajuste entre originales ({expected}) y traducciones ({len(translations)})")
+        logger.debug(f"Respuesta recibida: {translation_text}")
+        if len(translations) < expected:
+            logger.warning(f"Faltan traducciones. Añadiendo {expected - len(translations)} elementos vacíos")
+            translations.extend(["" for _ in range(expected - len(translations))])
+        else:
+            logger.warning(f"Sobran traducciones. Recortando a {expected} elementos")
+            translations = translations[:expected]
+    
+    return translations
+
+class NumberedStreamParser:
+    """Extrae bloques [n] de una respuesta a medida que llega por streaming"""
+    
+    _MARKER = re.compile(r"\[(\d+)\]")
+    
+    def __init__(self, expected: int):
+        self.expected = expected
+        self.buffer = ""
+        self.current = None
+        self.start = 0
+        self.items: Dict[int, str] = {}
+    
+    def _close(self, end) -> List[Tuple[int, str]]:
+        number, text = self.current, self.buffer[self.start:end].strip()
+        if number is None or not 1 <= number <= self.expected or number in self.items:
+            return []
+        self.items[number] = text
+        return [(number - 1, text)]
+    
+    def feed(self, delta: str) -> List[Tuple[int, str]]:
+        """Añade un fragmento y devuelve (posición, traducción) de los bloques ya cerrados"""
+        self.buffer += delta
+        completed = []
+        # Un bloque se cierra cuando aparece el marcador del siguiente
+        while True:
+            match = self._MARKER.search(self.buffer, self.start)
+            if not match:
+                break
+            completed.extend(self._close(match.start()))
+            self.current, self.start = int(match.group(1)), match.end()
+        return completed
+    
+    def finish(self) -> List[Tuple[int, str]]:
+        """Cierra el último bloque al terminar la respuesta"""
+        completed = self._close(len(self.buffer))
+        self.current = None
+        return completed
+
+class AssistantTransport:
+    """Transporte mediante Assistants API: thread, mensaje, run y sondeo del estado"""
+    
+    name = "assistant"
+    
+    def __init__(self, api_key, assistant_id):
+        self.api_key = api_key
+        self.assistant_id = assistant_id
+        self._model = None
+        # Métricas por run: tokens, sondeos y segundos hasta completar
+        self.run_metrics: List[Dict[str, Any]] = []
+    
+    @property
+    def version(self):
+        return f"assistant:{self.assistant_id}"
+    
+    async def _resolve_model(self, client):
+        """Modelo del asistente, usado para aprender los tiempos por modelo"""
+        if self._model is None:
+            try:
+                assistant = await client.beta.assistants.retrieve(assistant_id=self.assistant_id)
+                logger.info(f"✅ Asistente verificado: {assistant.name}")
+                self._model = assistant.model
+            except Exception as e:
+                logger.warning(f"No se pudo obtener el modelo del asistente: {e}")
+                self._model = self.assistant_id
+        return self._model
+    
+    def polling_stats(self):
+        """Resumen de sondeos para ajustar los intervalos"""
+        runs = len(self.run_metrics)
+        polls = sum(m["polls"] for m in self.run_metrics)
+        seconds = sum(m["seconds"] for m in self.run_metrics)
+        return {
+            "model": self._model,
+            "runs": runs,
+            "polls": polls,
+            "avg_polls_per_run": round(polls / runs, 2) if runs else 0,
+            "avg_seconds_to_complete": round(seconds / runs, 2) if runs else 0,
+            "run_metrics": self.run_metrics
+        }
+    
+    async def complete(self, content: str, system_prompt: Optional[str] = None,
+                 on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """Ejecuta el asistente y devuelve el texto completo de su respuesta"""
+        client = openai_client(self.api_key)
+        model = await self._resolve_model(client)
+        tokens = estimate_tokens(content)
+        
+        # 1. Crear un thread (nueva conversación)
+        thread = await client.beta.threads.create()
+        logger.info(f"Thread creado: {thread.id}")
+        
+        # 2. Añadir mensaje al thread
+        message = await client.beta.threads.messages.create(
+            thread_id=thread.id,
+            role="user",
+            content=content
+        )
+        logger.info(f"Mensaje enviado al thread: {message.id}")
+        
+        # 3. Ejecutar el asistente en el thread
+        run = await client.beta.threads.runs.create(
+            thread_id=thread.id,
+            assistant_id=self.assistant_id
+        )
+        started = time.monotonic()
+        logger.info(f"Run iniciado: {run.id} con status inicial: {run.status}")
+        
+        # 4. Esperar a que se complete la ejecución con sondeo adaptativo:
+        #    la primera consulta se hace cerca del tiempo esperado para este modelo y
+        #    tamaño de lote; después se consulta rápido y se va espaciando
+        polling = CONFIG["polling"]
+        expected = RUN_TIMINGS.expected(model, tokens)
+        interval = max(polling["min_interval"], 0.8 * expected) if expected else polling["min_interval"]
+        polls = 0
+        
+        while run.status not in ["completed", "failed", "cancelled", "expired"]:
+            elapsed = time.monotonic() - started
+            if elapsed >= polling["max_wait"]:
+                logger.error(f"Tiempo de espera agotado después de {polling['max_wait']} segundos")
+                raise Exception(f"Tiempo de espera agotado para el run {run.id}")
+            
+            await asyncio.sleep(min(interval, polling["max_wait"] - elapsed))
+            interval = polling["min_interval"] if polls == 0 and expected else min(interval * polling["backoff"], polling["max_interval"])
+            polls += 1
+            
+            # Verificar estado del run
+            run = await client.beta.threads.runs.retrieve(
+                thread_id=thread.id,
+                run_id=run.id
+            )
+            
+            logger.debug(f"Run {run.id} status después de {time.monotonic() - started:.2f}s: {run.status}")
+            
+            if run.status in ["failed", "cancelled", "expired"]:
+                error_details = getattr(run, 'last_error', 'No hay detalles adicionales')
+                logger.error(f"Run terminó con estado {run.status}. Detalles: {error_details}")
+                raise Exception(f"Error en la ejecución del asistente: {run.status} - {error_details}")
+        
+        if run.status != "completed":
+            logger.error(f"Estado del run inesperado: {run.status}")
+            raise Exception(f"Estado del run inesperado: {run.status}")
+        
+        seconds = time.monotonic() - started
+        # record escribe run_timings.json: fuera del bucle para no frenar a los demás trabajos
+        await asyncio.to_thread(RUN_TIMINGS.record, model, tokens, seconds)
+        self.run_metrics.append({"tokens": tokens, "polls": polls, "seconds": round(seconds, 2)})
+        logger.info(f"Run completado: {run.id} en {seconds:.2f}s con {polls} sondeos")
+        
+        # 5. Obtener la respuesta del asistente
+        messages = await client.beta.threads.messages.list(
+            thread_id=thread.id
+        )
+        
+        # El primer mensaje del asistente contiene la traducción
+        assistant_messages = [msg for msg in messages.data if msg.role == "assistant"]
+        if not assistant_messages:
+            logger.error("No se recibió respuesta del asistente")
+            raise Exception("No se recibió respuesta del asistente")
+        
+        # Extraer el texto de la respuesta
+        try:
+            if not assistant_messages[0].content or not assistant_messages[0].content[0].text:
+                logger.error("El texto del mensaje está vacío o no existe")
+                raise Exception("El texto del mensaje está vacío o no existe")
+            translation_text = assistant_messages[0].content[0].text.value
+        except (IndexError, AttributeError, KeyError) as e:
+            logger.error(f"Error al extraer respuesta: {e}")
+            logger.error(f"Estructura del mensaje: {assistant_messages[0]}")
+            raise Exception(f"Error al extraer respuesta: {e}")
+        
+        if not translation_text or translation_text.strip() == "":
+            logger.error("Texto de traducción vacío")
+            raise Exception("El texto de traducción está vacío")
+        
+        # La respuesta llega entera: se entrega de una vez al analizador
+        if on_delta:
+            on_delta(translation_text)
+        return translation_text
+
+class ChatCompletionTransport:
+    """Transporte directo con chat.completions en streaming: una única petición por lote"""
+    
+    name = "chat"
+    
+    def __init__(self, api_key, model, temperature=0.3):
+        self.api_key = api_key
+        self.model = model
+        self.temperature = temperature
+    
+    @property
+    def version(self):
+        return f"chat:{self.model}"
+    
+    async def complete(self, content: str, system_prompt: Optional[str] = None,
+                       on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """Envía el lote en una sola petición y entrega cada fragmento según llega"""
+        messages = [{"role": "user", "content": content}]
+        if system_prompt:
+            messages.insert(0, {"role": "system", "content": system_prompt})
+        
+        stream = await openai_client(self.api_key).chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature,
+            stream=True
+        )
+        
+        parts = []
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                if on_delta:
+                    on_delta(delta)
+        
+        translation_text = "".join(parts)
+        if not translation_text.strip():
+            logger.error("Texto de traducción vacío")
+            raise Exception("El texto de traducción está vacío")
+        return translation_text
+
 class Translator:
     """Clase para gestionar traducciones con diferentes métodos"""
     
-    def __init__(self, target_language="inglés", use_cache=True):
+    def __init__(self, target_language="inglés", use_cache=True, source_language="español", transport=None):
         """Inicializa el traductor con configuración para OpenAI."""
         self.target_language = target_language
+        self.source_language = source_language
         self.use_cache = use_cache
+        self.cache = None
+        self.transport = None
+        # Callback opcional (original, traducción) invocado según llegan las traducciones
+        self.on_translation: Optional[Callable[[str, str], None]] = None
+        # Callback opcional con el avance (textos y lotes terminados, aciertos de caché)
+        self.on_progress: Optional[Callable[[Dict[str, Any]], None]] = None
+        self._progress: Dict[str, int] = {}
         
         # Inicializar estadísticas
         self.translations = 0
@@ -127,6 +817,9 @@ class Translator:
         self.successful_retries = 0
         self.duplicates_avoided = 0
         self.tokens_used = 0
+        self.chunks_sent = 0
+        self.rate_limit_wait = 0.0
+        self._stats_lock = threading.Lock()
         
         # Cargar credenciales
         self.credentials = load_credentials()
@@ -147,41 +840,17 @@ class Translator:
             logger.info(f"API key encontrada: {api_key[:8]}...{api_key[-4:]}")
             logger.info(f"Asistente ID: {self.assistant_id}")
             
-            # Inicializar cliente con solo el API key
-            self.client = OpenAI(api_key=api_key)
-            
-            # DEBUG: Verificar que el cliente y el assistant_id están correctamente cargados
-            logger.info(f"Verificación de cliente: {self.client is not None}")
-            logger.info(f"Tipo de cliente: {type(self.client).__name__}")
-            logger.info(f"Assistant ID verificación: '{self.assistant_id}'")
+            # El cliente asíncrono se crea por bucle de eventos (ver openai_client)
+            self.api_key = api_key
             
-            # Intento de verificación del asistente (sin esperar respuesta)
-            try:
-                # Verificar asistente de forma no bloqueante
-                logger.info("Intentando verificar acceso al asistente...")
-                def verify_assistant():
-                    try:
-                        assistant = self.client.beta.assistants.retrieve(assistant_id=self.assistant_id)
-                        logger.info(f"✅ Asistente verificado: {assistant.name}")
-                        return True
-                    except Exception as e:
-                        logger.error(f"❌ Error al verificar asistente: {str(e)}")
-                        return False
-                
-                # Ejecutar en un hilo separado para no bloquear
-                import threading
-                threading.Thread(target=verify_assistant).start()
-            except Exception as e:
-                logger.warning(f"No se pudo verificar asistente: {e}")
+            self.transport = self._create_transport(transport or CONFIG["transport"])
+            logger.info(f"Transporte de traducción: {self.transport.name}")
             
         except Exception as e:
             logger.error(f"Error al inicializar OpenAI: {e}")
-            self.client = None
+            self.api_key = None
             self.assistant_id = None
-            
-            # DEBUG: Verificar qué falló
-            logger.error(f"client es None: {self.client is None}")
-            logger.error(f"assistant_id es None: {self.assistant_id is None}")
+            self.transport = None
         
         # Inicializar caché
         if self.use_cache:
@@ -190,58 +859,64 @@ class Translator:
     def _init_cache(self):
         self.cache = TranslationCache()
     
-    def translate(self, texts: Union[str, List[str]], source_language: str = "español") -> Union[str, List[str]]:
+    def _create_transport(self, name):
+        """Crea el transporte de traducción indicado"""
+        if name == "assistant":
+            return AssistantTransport(self.api_key, self.assistant_id)
+        if name == "chat":
+            return ChatCompletionTransport(self.api_key, CONFIG["model"], CONFIG["temperature"])
+        raise ValueError(f"Transporte de traducción desconocido: {name}")
+    
+    @property
+    def cache_version(self):
+        """Versión de prompt y asistente/modelo que forma parte de la clave de caché"""
+        backend = self.transport.version if self.transport else self.assistant_id
+        return f"{CONFIG['prompt_version']}:{backend}"
+    
+    def translate(self, texts: Union[str, List[str]], source_language: Optional[str] = None) -> Union[str, List[str]]:
+        """Versión síncrona de translate_async para la CLI y código sin bucle de eventos"""
+        return run_sync(self.translate_async(texts, source_language))
+    
+    async def translate_async(self, texts: Union[str, List[str]], source_language: Optional[str] = None) -> Union[str, List[str]]:
         """
         Traduce textos al idioma objetivo.
         
         Args:
             texts: Texto o lista de textos a traducir
-            source_language: Idioma de origen (por defecto 'español')
+            source_language: Idioma de origen (por defecto el del traductor)
             
         Returns:
             Texto traducido o lista de textos traducidos
         """
         if not texts:
             return [] if isinstance(texts, list) else ""
+        
+        source_language = source_language or self.source_language
             
         # Convertir texto único a lista para procesamiento uniforme
         single_text = not isinstance(texts, list)
         texts_to_translate = [texts] if single_text else texts
         
         # Filtrar textos vacíos
-        non_empty_texts = []
-        empty_indices = []
-        
-        for i, text in enumerate(texts_to_translate):
-            if text and text.strip():
-                non_empty_texts.append(text)
-            else:
-                empty_indices.append(i)
+        non_empty_texts = [text for text in texts_to_translate if text and text.strip()]
         
         if not non_empty_texts:
             return "" if single_text else ["" for _ in texts_to_translate]
         
-        # Traducir usando el asistente de OpenAI
-        translated_texts = self._translate_with_assistant(non_empty_texts, source_language)
+        # Traducir solo lo que no está en caché, en lotes concurrentes
+        translated_texts = await self._translate_with_cache(non_empty_texts, source_language)
         
         # Crear un diccionario de traducciones para que _update_slides pueda usar get()
         translations_dict = {}
         for original, translated in zip(non_empty_texts, translated_texts):
             translations_dict[original] = translated
         
-        # Reinsertamos los textos vacíos en sus posiciones originales
-        final_translations = []
-        non_empty_idx = 0
-        
-        for i in range(len(texts_to_translate)):
-            if i in empty_indices:
-                final_translations.append("")
-            else:
-                if non_empty_idx < len(translated_texts):
-                    final_translations.append(translated_texts[non_empty_idx])
-                    non_empty_idx += 1
-                else:
-                    final_translations.append("")  # Por si acaso hay algún problema
+        # Reinsertamos los textos vacíos en sus posiciones originales en una sola pasada
+        translated_iter = iter(translated_texts)
+        final_translations = [
+            next(translated_iter, "") if text and text.strip() else ""
+            for text in texts_to_translate
+        ]
         
         # Devolver el resultado en el mismo formato que se recibió
         if single_text:
@@ -252,221 +927,215 @@ class Translator:
                 self._current_translations_dict = translations_dict
             return translations_dict if len(translations_dict) > 0 else final_translations
     
-    def _translate_batch(self, texts):
-        """Divide y traduce textos en lotes óptimos"""
-        if not texts: 
-            return {}
+    async def _translate_with_cache(self, texts: List[str], source_language: str) -> List[str]:
+        """Resuelve desde la caché y envía a la API únicamente los textos únicos no cacheados"""
+        unique_texts = list(dict.fromkeys(texts))
+        self.duplicates_avoided += len(texts) - len(unique_texts)
+        version = self.cache_version
+        
+        # SQLite es bloqueante: las consultas a la caché se hacen fuera del bucle de eventos
+        resolved = await asyncio.to_thread(
+            self.cache.get_many, unique_texts, source_language, self.target_language, version
+        ) if self.cache else {}
+        pending = [text for text in unique_texts if text not in resolved]
+        self.cache_hits += len(resolved)
+        self.cache_misses += len(pending)
         
-        translations = {}
-        chunks = [texts[i:i+30] for i in range(0, len(texts), 30)]
+        if self.cache:
+            logger.info(f"Caché: {self.cache_hits} aciertos, {len(pending)} textos a traducir")
+        for text, translation in resolved.items():
+            self._notify_translation(text, translation)
+        
+        # Lotes calculados antes del primer aviso: un total de 0 se mostraría como etapa terminada
+        chunks = self._build_chunks(pending)
+        self._progress = {"texts_total": len(unique_texts), "texts_translated": len(resolved),
+                          "cache_hits": len(resolved), "chunks_done": 0, "chunks_total": len(chunks)}
+        self._report_progress()
+        
+        if pending:
+            translated = await self._translate_batch(chunks, source_language)
+            for text, translation in zip(pending, translated):
+                resolved[text] = translation
+                if self.cache:
+                    self.cache.set(text, translation, source_language, self.target_language, version)
+            if self.cache:
+                await asyncio.to_thread(self.cache.save)
+        
+        return [resolved[text] for text in texts]
+    
+    def _notify_translation(self, original, translation):
+        """Entrega una traducción a on_translation en cuanto se conoce (caché o streaming)"""
+        if self.on_translation:
+            try:
+                self.on_translation(original, translation)
+            except Exception as e:
+                logger.warning(f"Error notificando la traducción: {e}")
+    
+    def _report_progress(self, **changes):
+        """Actualiza el avance del trabajo en curso y lo notifica (siempre desde el bucle de eventos)"""
+        for key, amount in changes.items():
+            self._progress[key] = self._progress.get(key, 0) + amount
+        if self.on_progress:
+            try:
+                self.on_progress(dict(self._progress))
+            except Exception as e:
+                logger.warning(f"Error notificando el progreso: {e}")
+    
+    def _count(self, stat, amount=1):
+        """Incrementa un contador de estadísticas de forma segura entre hilos"""
+        with self._stats_lock:
+            setattr(self, stat, getattr(self, stat) + amount)
+    
+    def _build_chunks(self, texts: List[str]) -> List[List[str]]:
+        """Agrupa los textos en lotes que respetan el presupuesto de tokens"""
+        max_tokens = CONFIG["chunk_max_tokens"]
+        max_texts = CONFIG["chunk_max_texts"]
+        chunks, current, current_tokens = [], [], 0
+        
+        for text in texts:
+            # Sumar el coste del marcador [n] y los separadores
+            tokens = self._estimate_tokens(text) + 4
+            if current and (current_tokens + tokens > max_tokens or len(current) >= max_texts):
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append(text)
+            current_tokens += tokens
+        
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    async def _translate_batch(self, chunks: List[List[str]], source_language: str) -> List[str]:
+        """Traduce en paralelo los lotes de _build_chunks, conservando el orden de los textos"""
+        if not chunks:
+            return []
         
-        for chunk in chunks:
-            translations.update(self._translate_with_assistant(chunk))
+        workers = max(1, min(CONFIG["max_concurrent_chunks"], len(chunks)))
+        logger.info(f"Traduciendo {sum(map(len, chunks))} textos en {len(chunks)} lotes ({workers} simultáneos)")
         
-        if self.cache:
-            self.cache.save()
+        # Límite propio del trabajo y límite de peticiones del bucle de eventos
+        job_slots = asyncio.Semaphore(workers)
+        request_slots = loop_shared("openai-requests", lambda: asyncio.Semaphore(CONFIG["max_concurrent_requests"]))
+        
+        async def run_chunk(index, chunk):
+            # Cada lote reintenta por su cuenta en _translate_chunk
+            async with job_slots, request_slots:
+                result = await self._translate_chunk(chunk, source_language)
+            self._count("chunks_sent")
+            logger.info(f"Lote {index + 1}/{len(chunks)} traducido ({len(chunk)} textos)")
+            self._report_progress(chunks_done=1, texts_translated=len(chunk))
+            return result
         
-        return translations
+        tasks = [asyncio.create_task(run_chunk(index, chunk)) for index, chunk in enumerate(chunks)]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # Si un lote falla definitivamente, cancelar los que siguen pendientes
+            for task in tasks:
+                task.cancel()
+            raise
+        
+        return [translation for chunk_result in results for translation in chunk_result]
     
-    def _translate_with_assistant(self, texts: List[str], source_language: str) -> List[str]:
-        """Traduce un lote de textos usando el asistente de OpenAI"""
-        if not texts:
-            return []
-            
-        if not self.client or not self.assistant_id:
-            logger.error("No se han configurado correctamente las credenciales de OpenAI")
-            logger.error(f"client: {self.client}, assistant_id: {self.assistant_id}")
-            raise ValueError("No se han configurado correctamente las credenciales de OpenAI")
-            
-        # Preparar textos con formato
+    def _build_prompt(self, texts: List[str], source_language: str) -> str:
+        """Prompt numerado que se envía para un lote"""
         batch_texts = "\n\n".join(f"[{i+1}] {text}" for i, text in enumerate(texts))
-        content = f"""
+        return f"""
 Traduce los siguientes textos de {source_language} a {self.target_language}. 
 Devuelve SOLO los textos traducidos, conservando el formato original de enumeración [1], [2], etc.
 No incluyas elementos adicionales, solo la traducción con su enumeración.
 
 {batch_texts}
 """
+    
+    def _system_prompt(self, source_language: str) -> str:
+        return (f"Eres un traductor profesional especializado en traducir de {source_language} a {self.target_language}. "
+                "Traduce únicamente el texto proporcionado, manteniendo el formato y la numeración exacta.")
+    
+    async def _translate_chunk(self, texts: List[str], source_language: str) -> List[str]:
+        """Traduce un lote de textos con el transporte configurado"""
+        if not texts:
+            return []
+            
+        if not self.api_key or not self.transport:
+            logger.error("No se han configurado correctamente las credenciales de OpenAI")
+            logger.error(f"transport: {self.transport}")
+            raise ValueError("No se han configurado correctamente las credenciales de OpenAI")
+        
+        # Traducciones recibidas por posición; sobreviven a los reintentos
+        received: Dict[int, str] = {}
         max_retries = CONFIG["retries"]
         attempt = 0
         wait_time = CONFIG["wait_times"]["base"]
         
         while attempt <= max_retries:
+            # Un reintento solo vuelve a pedir lo que no llegó en el intento anterior
+            remaining = [i for i in range(len(texts)) if i not in received]
+            subset = [texts[i] for i in remaining]
+            parser = NumberedStreamParser(len(subset))
+            
+            def accept(items):
+                for position, translation in items:
+                    index = remaining[position]
+                    received[index] = translation
+                    self._notify_translation(texts[index], translation)
+            
+            prompt = self._build_prompt(subset, source_language)
+            system_prompt = self._system_prompt(source_language)
             try:
-                # Actualizar estadísticas
-                self.api_calls += 1
-                logger.info(f"Iniciando traducción de {len(texts)} textos")
-                
-                # 1. Crear un thread (nueva conversación)
-                thread = self.client.beta.threads.create()
-                logger.info(f"Thread creado: {thread.id}")
+                # Reservar cupo antes de llamar: prompt más una respuesta de tamaño similar a los textos
+                tokens = estimate_tokens(system_prompt) + estimate_tokens(prompt) + sum(map(estimate_tokens, subset))
+                waited = await rate_limiter().acquire(tokens)
+                if waited > 0.01:
+                    self._count("rate_limit_wait", waited)
+                    logger.info(f"Esperados {waited:.2f}s por el límite de peticiones/tokens")
                 
-                # 2. Añadir mensaje al thread
-                message = self.client.beta.threads.messages.create(
-                    thread_id=thread.id,
-                    role="user",
-                    content=content
-                )
-                logger.info(f"Mensaje enviado al thread: {message.id}")
-                
-                # 3. Ejecutar el asistente en el thread
-                run = self.client.beta.threads.runs.create(
-                    thread_id=thread.id,
-                    assistant_id=self.assistant_id
-                )
-                logger.info(f"Run iniciado: {run.id} con status inicial: {run.status}")
-                
-                # 4. Esperar a que se complete la ejecución
-                total_wait_time = 0
-                max_wait_time = 180  # Tiempo máximo de espera: 3 minutos
-                check_interval = 1    # Intervalo de verificación: 1 segundo
-                
-                while run.status not in ["completed", "failed", "cancelled", "expired"]:
-                    if total_wait_time >= max_wait_time:
-                        logger.error(f"Tiempo de espera agotado después de {max_wait_time} segundos")
-                        raise Exception(f"Tiempo de espera agotado para el run {run.id}")
-                    
-                    time.sleep(check_interval)
-                    total_wait_time += check_interval
-                    
-                    # Verificar estado del run
-                    run = self.client.beta.threads.runs.retrieve(
-                        thread_id=thread.id,
-                        run_id=run.id
-                    )
-                    
-                    logger.debug(f"Run {run.id} status después de {total_wait_time}s: {run.status}")
-                    
-                    if run.status in ["failed", "cancelled", "expired"]:
-                        error_details = getattr(run, 'last_error', 'No hay detalles adicionales')
-                        logger.error(f"Run terminó con estado {run.status}. Detalles: {error_details}")
-                        raise Exception(f"Error en la ejecución del asistente: {run.status} - {error_details}")
-                
-                if run.status != "completed":
-                    logger.error(f"Estado del run inesperado: {run.status}")
-                    raise Exception(f"Estado del run inesperado: {run.status}")
-                
-                logger.info(f"Run completado: {run.id} con status final: {run.status}")
+                # Actualizar estadísticas
+                self._count("api_calls")
+                self._count("tokens_used", tokens)
+                logger.info(f"Iniciando traducción de {len(subset)} textos ({self.transport.name})")
                 
-                # 5. Obtener la respuesta del asistente
-                messages = self.client.beta.threads.messages.list(
-                    thread_id=thread.id
+                translation_text = await self.transport.complete(
+                    prompt,
+                    system_prompt,
+                    on_delta=lambda delta: accept(parser.feed(delta))
                 )
+                accept(parser.finish())
+                logger.info(f"Longitud del texto traducido: {len(translation_text)}")
                 
-                # El primer mensaje del asistente contiene la traducción
-                assistant_messages = [msg for msg in messages.data if msg.role == "assistant"]
-                if not assistant_messages:
-                    logger.error("No se recibió respuesta del asistente")
-                    raise Exception("No se recibió respuesta del asistente")
-                
-                logger.info(f"Recibidos {len(assistant_messages)} mensajes del asistente")
-                
-                # Extraer el texto de la respuesta
-                try:
-                    # Verificar que el contenido existe y no está vacío
-                    if not assistant_messages[0].content:
-                        logger.error("El contenido del mensaje está vacío")
-                        raise Exception("El contenido del mensaje está vacío")
-                    
-                    logger.info(f"Tipo de contenido: {type(assistant_messages[0].content)}")
-                    logger.info(f"Longitud del contenido: {len(assistant_messages[0].content)}")
-                    
-                    if not assistant_messages[0].content[0].text:
-                        logger.error("El texto del mensaje está vacío o no existe")
-                        raise Exception("El texto del mensaje está vacío o no existe")
-                    
-                    translation_text = assistant_messages[0].content[0].text.value
-                    
-                    if not translation_text or translation_text.strip() == "":
-                        logger.error("Texto de traducción vacío")
-                        raise Exception("El texto de traducción está vacío")
-                    
-                    logger.info(f"Longitud del texto traducido: {len(translation_text)}")
-                    
-                except (IndexError, AttributeError, KeyError) as e:
-                    logger.error(f"Error al extraer respuesta: {e}")
-                    logger.error(f"Estructura del mensaje: {assistant_messages[0]}")
-                    raise Exception(f"Error al extraer respuesta: {e}")
-                
-                # Procesar las traducciones
-                translations = []
+                # Sin numeración reconocible: análisis de la respuesta completa, línea a línea
+                if not parser.items:
+                    accept(enumerate(parse_numbered_translations(translation_text, len(subset))))
+                elif len(parser.items) < len(subset):
+                    logger.warning(f"Desajuste entre originales ({len(subset)}) y traducciones ({len(parser.items)})")
                 
-                # Buscar todos los bloques numerados [1], [2], etc. en la respuesta
-                pattern = r"\[(\d+)\](.*?)(?=\[\d+\]|$)"
-                matches = re.findall(pattern, translation_text, re.DOTALL)
-                
-                logger.info(f"Coincidencias encontradas con patrón: {len(matches)}")
-                
-                # Si no hay coincidencias o faltan algunas, intentar extraer línea por línea
-                if not matches or len(matches) < len(texts):
-                    logger.warning(f"No se encontraron suficientes coincidencias. Procesando líneas...")
-                    lines = translation_text.strip().split("\n")
-                    translations_lines = []
-                    
-                    for line in lines:
-                        if line.strip():
-                            # Limpiar cualquier numeración al inicio de la línea
-                            cleaned_line = re.sub(r'^\s*\[\d+\]\s*', '', line.strip())
-                            translations_lines.append(cleaned_line)
-                    
-                    translations = translations_lines
-                    logger.info(f"Líneas procesadas: {len(translations)}")
-                else:
-                    # Ordenar las coincidencias por número y extraer solo el texto
-                    sorted_matches = sorted(matches, key=lambda x: int(x[0]))
-                    translations = []
-                    
-                    for _, text in sorted_matches:
-                        # Asegurarnos de que no queden números en corchetes en el texto
-                        cleaned_text = re.sub(r'^\s*\[\d+\]\s*', '', text.strip())
-                        translations.append(cleaned_text)
-                    
-                    logger.info(f"Coincidencias procesadas: {len(translations)}")
-                
-                # Verificar que tenemos el mismo número de traducciones que de textos originales
-                if len(translations) != len(texts):
-                    logger.warning(f"Desajuste entre originales ({len(texts)}) y traducciones ({len(translations)})")
-                    
-                    # Guardar estado para depuración
-                    debug_info = {
-                        "original_texts": texts,
-                        "translation_text": translation_text,
-                        "parsed_translations": translations
-                    }
-                    logger.debug(f"Información de depuración: {json.dumps(debug_info, ensure_ascii=False)}")
-                    
-                    if len(translations) < len(texts):
-                        logger.warning(f"Faltan traducciones. Añadiendo {len(texts) - len(translations)} elementos vacíos")
-                        translations.extend(["" for _ in range(len(texts) - len(translations))])
-                    else:
-                        logger.warning(f"Sobran traducciones. Recortando a {len(texts)} elementos")
-                        translations = translations[:len(texts)]
-                
-                logger.info(f"Traducción completada exitosamente para {len(translations)} textos")
-                return translations
+                logger.info(f"Traducción completada exitosamente para {len(texts)} textos")
+                return [received.get(i, "") for i in range(len(texts))]
                 
             except Exception as e:
                 attempt += 1
                 error_msg = str(e).lower()
                 
-                # Manejar específicamente los rate limits
-                if "rate limit" in error_msg or "rate_limit" in error_msg:
-                    self.rate_limit_retries += 1
-                    logger.warning(f"Rate limit alcanzado, intento {attempt}/{max_retries}, esperando {wait_time}s")
-                    time.sleep(wait_time)
+                # Manejar específicamente los rate limits: la pausa se aplica al limitador compartido,
+                # así todos los trabajos esperan una vez y luego se reparten el cupo sin repetir el 429
+                if isinstance(e, RateLimitError) or "rate limit" in error_msg or "rate_limit" in error_msg:
+                    self._count("rate_limit_retries")
+                    pause = retry_after_seconds(e) or wait_time
+                    logger.warning(f"Rate limit alcanzado, intento {attempt}/{max_retries}, pausa de {pause:.1f}s")
+                    rate_limiter().pause(pause)
                     wait_time = min(wait_time * CONFIG["wait_times"]["backoff"], CONFIG["wait_times"]["max"])
                     if attempt <= max_retries:
-                        self.successful_retries += 1
+                        self._count("successful_retries")
                         continue
                 
                 # Para otros errores, también reintentamos pero con menos espera
                 logger.error(f"Error en la traducción (intento {attempt}/{max_retries}): {e}")
                 if attempt <= max_retries:
-                    time.sleep(CONFIG["wait_times"]["base"])
-                    self.successful_retries += 1
+                    await asyncio.sleep(CONFIG["wait_times"]["base"])
+                    self._count("successful_retries")
                     continue
                 else:
-                    self.errors += 1
+                    self._count("errors")
                     logger.error(f"Se agotaron los reintentos ({max_retries}) para la traducción")
                     raise Exception(f"Error en la traducción después de {max_retries} intentos: {e}")
         
@@ -476,17 +1145,37 @@ No incluyas elementos adicionales, solo la traducción con su enumeración.
     
     def _estimate_tokens(self, text):
         """Estima tokens en un texto para el modelo cl100k_base"""
-        if not text: return 0
-        try:
-            encoder = tiktoken.get_encoding("cl100k_base")
-            return len(encoder.encode(text))
-        except Exception:
-            return len(text) // 4
+        return estimate_tokens(text)
+
+# Partes del paquete con texto DrawingML (a:p/a:t) que se traducen en la misma pasada,
+# en el orden en que se analizan
+TEXT_PARTS = [
+    ("slides", r"ppt/slides/slide(\d+)\.xml"),
+    ("notesSlides", r"ppt/notesSlides/notesSlide(\d+)\.xml"),
+    ("charts", r"ppt/charts/chart(\d+)\.xml"),
+    ("diagrams", r"ppt/diagrams/(?:data|drawing)(\d+)\.xml"),
+    ("slideLayouts", r"ppt/slideLayouts/slideLayout(\d+)\.xml"),
+    ("slideMasters", r"ppt/slideMasters/slideMaster(\d+)\.xml"),
+]
+
+def find_text_parts(names) -> List[Tuple[str, str]]:
+    """Devuelve (tipo, nombre) de las partes con texto, ordenadas por tipo y número"""
+    found = []
+    for order, (kind, pattern) in enumerate(TEXT_PARTS):
+        for name in names:
+            match = re.fullmatch(pattern, name)
+            if match:
+                found.append((order, int(match.group(1)), name, kind))
+    return [(kind, name) for _, _, name, kind in sorted(found)]
 
 class PPTXEditor:
     def __init__(self, translator):
         self.translator = translator
         self.slides_processed = self.total_texts = 0
+        # Partes con texto procesadas por tipo (slides, notesSlides, charts...)
+        self.parts_processed: Dict[str, int] = {}
+        # Callback opcional (etapa, hechos, total, **datos) por parte analizada, lote traducido y parte escrita
+        self.on_progress: Optional[Callable[..., None]] = None
         self.namespaces = {
             'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
             'p': 'http://schemas.openxmlformats.org/presentationml/2006/main'
@@ -497,176 +1186,186 @@ class PPTXEditor:
     
     def process_pptx(self, input_path, output_path):
         """Procesa un archivo PPTX para traducir su contenido textual"""
+        return run_sync(self.process_pptx_async(input_path, output_path))
+    
+    async def process_pptx_async(self, input_path, output_path):
+        """Versión asíncrona: ZIP y XML se procesan en hilos, la traducción en el bucle de eventos"""
         input_path, output_path = Path(input_path), Path(output_path)
         output_path.parent.mkdir(exist_ok=True, parents=True)
         
+        temp_output = output_path.with_suffix('.tmp')
         try:
             logger.info(f"Procesando: {input_path.name}")
-            temp_output = output_path.with_suffix('.tmp')
-            
-            with tempfile.TemporaryDirectory() as temp_dir:
-                temp_dir = Path(temp_dir)
-                self._extract_and_translate_pptx(input_path, temp_dir, temp_output, output_path)
+            await self._extract_and_translate_pptx(input_path, temp_output, output_path)
             
             if hasattr(self.translator, 'cache') and self.translator.cache:
-                self.translator.cache.save()
+                await asyncio.to_thread(self.translator.cache.save)
             
             return output_path
             
         except Exception as e:
             logger.error(f"Error al procesar presentación: {str(e)}")
             return None
+        finally:
+            if temp_output.exists():
+                await asyncio.to_thread(temp_output.unlink)
     
-    def _extract_and_translate_pptx(self, input_path, temp_dir, temp_output, output_path):
-        """Extrae, traduce y recomprime el PPTX"""
-        # Extraer PPTX
-        with zipfile.ZipFile(input_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
+    async def _extract_and_translate_pptx(self, input_path, temp_output, output_path):
+        """
+        Lee las partes con texto del ZIP y traduce mientras se reescribe el PPTX.
         
-        # Procesar diapositivas
-        slides_dir = temp_dir / 'ppt' / 'slides'
-        if not slides_dir.exists():
-            raise Exception(f"Estructura PPTX inválida: no existe {slides_dir}")
+        El paquete se escribe en un hilo desde el principio: lo que no tiene texto se copia
+        en bruto y, al llegar a una parte con texto, se espera a que esté lista. Cada parte se
+        reescribe en cuanto tiene todas sus traducciones (de la caché o según llegan por
+        streaming), sin esperar a que terminen la respuesta ni el resto de lotes.
+        """
+        text_index, part_data = await asyncio.to_thread(self._extract_pptx, input_path)
+        
+        # Por parte: sus párrafos (nº, texto original) y cuántos textos distintos faltan
+        part_texts: Dict[str, List[Tuple[int, str]]] = {}
+        for original, locations in text_index.items():
+            for part_name, paragraph_no in locations:
+                part_texts.setdefault(part_name, []).append((paragraph_no, original))
+        missing = {name: len({text for _, text in entries}) for name, entries in part_texts.items()}
+        # Resultado por parte: XML nuevo, {nº de párrafo: traducción} a aplicar al escribir, o None
+        ready = {name: Future() for name in part_texts}
+        translated: Dict[str, str] = {}
+        use_pool = len(part_texts) >= PARALLEL_MIN_PARTS
+        
+        def complete(part_name):
+            updates = {paragraph_no: translated[original] for paragraph_no, original in part_texts[part_name]
+                       if translated[original] and translated[original] != original}
+            self.total_texts += len(updates)
+            future = submit_to_pool(apply_part_translations, input_path, part_name,
+                                    part_data[part_name], updates) if updates and use_pool else None
+            if future is None:
+                ready[part_name].set_result(updates or None)
+                return
+            
+            def transfer(done):
+                try:
+                    ready[part_name].set_result(done.result())
+                except Exception as e:
+                    # Sin pool la parte se reescribe al escribir el paquete
+                    logger.warning(f"Error reescribiendo {part_name} en el pool: {e}")
+                    ready[part_name].set_result(updates)
+            future.add_done_callback(transfer)
+        
+        def on_translation(original, translation):
+            if original in translated or original not in text_index:
+                return
+            translated[original] = translation
+            for part_name in {name for name, _ in text_index[original]}:
+                missing[part_name] -= 1
+                if not missing[part_name]:
+                    complete(part_name)
+        
+        writer = asyncio.create_task(asyncio.to_thread(
+            self._repack_pptx, input_path, part_data, ready, temp_output, output_path
+        ))
+        
+        # Los lotes salen en el orden en que el escritor necesita las partes (orden del ZIP;
+        # patrones y diseños suelen ir antes que las diapositivas)
+        position = {name: i for i, name in enumerate(await asyncio.to_thread(list_members, input_path))}
+        texts = sorted(text_index, key=lambda text: min(position[name] for name, _ in text_index[text]))
         
-        slide_files = sorted(slides_dir.glob('slide*.xml'), 
-            key=lambda f: int(re.search(r'slide(\d+)\.xml', f.name).group(1))
+        # Traducir textos únicos
+        logger.info(f"Traduciendo {len(text_index)} textos únicos...")
+        self.translator.on_progress = lambda progress: self._report(
+            "translating", progress["chunks_done"], progress["chunks_total"], **progress
         )
+        self.translator.on_translation = on_translation
+        try:
+            translations = await self.translator.translate_async(texts)
+        except BaseException:
+            # Desbloquear al escritor, que espera partes que ya no llegarán
+            for name, waiting in missing.items():
+                if waiting:
+                    ready[name].set_exception(RuntimeError("Traducción interrumpida"))
+            await asyncio.gather(writer, return_exceptions=True)
+            raise
+        finally:
+            self.translator.on_translation = None
+            self.translator.on_progress = None
+        
+        # Textos que no llegaron por el callback (p. ej. sin traducción en la respuesta)
+        if not isinstance(translations, dict):
+            translations = {}
+        for original in text_index:
+            on_translation(original, translations.get(original, ""))
+        
+        await writer
+    
+    def _report(self, stage, done, total, **fields):
+        if self.on_progress:
+            try:
+                self.on_progress(stage, done, total, slides_processed=self.slides_processed, **fields)
+            except Exception as e:
+                logger.warning(f"Error notificando el progreso: {e}")
+    
+    def _extract_pptx(self, input_path):
+        """Localiza las partes con texto en el ZIP y extrae sus textos, sin descomprimir el resto"""
+        with zipfile.ZipFile(input_path, 'r') as zip_ref:
+            text_parts = find_text_parts(zip_ref.namelist())
         
-        if not slide_files:
-            raise Exception(f"No hay diapositivas en {slides_dir}")
+        if not any(kind == "slides" for kind, _ in text_parts):
+            raise Exception("Estructura PPTX inválida: no hay diapositivas en ppt/slides")
         
         # Extraer textos
-        all_texts, slide_data = self._extract_texts(slide_files)
-        
-        # Traducir textos únicos
-        logger.info(f"Traduciendo {len(all_texts)} textos únicos...")
-        translations = self.translator.translate(all_texts)
-        
-        # Actualizar diapositivas
-        self._update_slides(slide_files, slide_data, translations)
-        
-        # Reempaquetar
-        self._repack_pptx(temp_dir, temp_output, output_path)
+        return self._extract_texts(input_path, text_parts)
     
-    def _extract_texts(self, slide_files):
-        """Extrae todos los textos de las diapositivas"""
-        all_texts = []
-        slide_data = {}
+    def _extract_texts(self, input_path, text_parts):
+        """
+        Extrae los textos de diapositivas, notas, gráficos, SmartArt, diseños y patrones,
+        repartidos entre el pool de procesos.
         
-        for i, slide_file in enumerate(slide_files, 1):
-            logger.info(f"Analizando diapositiva {i}/{len(slide_files)}...")
-            
-            parser = ET.XMLParser(encoding="utf-8")
-            tree = ET.parse(slide_file, parser=parser)
-            root = tree.getroot()
-            
-            texts = []
-            for paragraph in root.findall('.//a:p', self.namespaces):
-                paragraph_runs = []
-                full_text = ""
-                
-                for run in paragraph.findall('.//a:t', self.namespaces):
-                    if run.text and run.text.strip():
-                        text = run.text.strip()
-                        has_space = run.text.endswith(" ")
-                        
-                        paragraph_runs.append({
-                            "element": run,
-                            "text": text,
-                            "length": len(text),
-                            "has_space": has_space
-                        })
-                        
-                        full_text += text + (" " if has_space else "")
-                
-                full_text = full_text.strip()
-                if full_text:
-                    texts.append({
-                        "full_text": full_text,
-                        "runs": paragraph_runs,
-                        "total_length": sum(r["length"] for r in paragraph_runs)
-                    })
-                    if full_text not in all_texts:
-                        all_texts.append(full_text)
-            
-            slide_data[slide_file] = {
-                "tree": tree,
-                "root": root,
-                "texts": texts
-            }
-            self.slides_processed += 1
+        Por parte solo se guarda la lista de runs de cada párrafo (ver extract_part_texts).
+        Los resultados se combinan en orden en un índice ordenado texto único ->
+        [(parte, nº de párrafo)], con pertenencia O(1): un texto repetido en una diapositiva
+        y en su patrón o sus notas se traduce una sola vez, en el mismo lote y caché.
+        """
+        text_index = {}
+        part_data = {}
         
-        return all_texts, slide_data
-    
-    def _update_slides(self, slide_files, slide_data, translations):
-        """Actualiza diapositivas con texto traducido"""
-        for i, slide_file in enumerate(slide_files, 1):
-            if slide_file not in slide_data:
-                continue
-            
-            info = slide_data[slide_file]
-            texts_translated = 0
+        results = map_ordered(extract_part_texts, ((input_path, name) for _, name in text_parts))
+        for i, ((kind, _), (part_name, paragraphs)) in enumerate(zip(text_parts, results), 1):
+            logger.info(f"Analizada parte {i}/{len(text_parts)}: {part_name}")
             
-            for paragraph in info["texts"]:
-                original = paragraph["full_text"]
-                translated = translations.get(original)
-                
-                if not translated or translated == original:
-                    continue
-                
-                if len(paragraph["runs"]) == 1:
-                    paragraph["runs"][0]["element"].text = translated
-                    texts_translated += 1
-                else:
-                    self._distribute_translation(paragraph, translated)
-                    texts_translated += 1
-            
-            self.total_texts += texts_translated
-            
-            # Guardar XML actualizado
-            xml_string = ET.tostring(info["root"], encoding='UTF-8', method='xml')
-            if not xml_string.startswith(b'<?xml'):
-                xml_string = b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n' + xml_string
-            
-            with open(slide_file, 'wb') as f:
-                f.write(xml_string)
-    
-    def _distribute_translation(self, paragraph, translated):
-        """Distribuye el texto traducido entre múltiples runs"""
-        words = translated.split()
-        runs = paragraph["runs"]
-        total_length = paragraph["total_length"]
-        assigned_words = 0
-        
-        for i, run in enumerate(runs):
-            elem = run["element"]
-            proportion = run["length"] / total_length if total_length > 0 else 0
-            words_for_run = max(1, round(proportion * len(words)))
-            words_for_run = min(words_for_run, len(words) - assigned_words)
-            
-            if words_for_run <= 0:
-                continue
-            
-            segment = words[assigned_words:assigned_words + words_for_run]
-            partial_text = " ".join(segment)
-            
-            if i == len(runs) - 1 and assigned_words + words_for_run < len(words):
-                remaining = words[assigned_words + words_for_run:]
-                partial_text += " " + " ".join(remaining)
-            
-            if run.get("has_space", False) or i < len(runs) - 1:
-                partial_text += " "
-            
-            elem.text = partial_text
-            assigned_words += words_for_run
+            for paragraph_no, (full_text, _) in enumerate(paragraphs):
+                text_index.setdefault(full_text, []).append((part_name, paragraph_no))
+            if paragraphs:
+                part_data[part_name] = [runs for _, runs in paragraphs]
+            self.parts_processed[kind] = self.parts_processed.get(kind, 0) + 1
+            if kind == "slides":
+                self.slides_processed += 1
+            self._report("extracting", i, len(text_parts), parts_processed=dict(self.parts_processed))
+        
+        return text_index, part_data
     
-    def _repack_pptx(self, temp_dir, temp_output, output_path):
-        """Reempaqueta el PPTX con los cambios"""
-        with zipfile.ZipFile(temp_output, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for file_path in temp_dir.rglob('*'):
-                if file_path.is_file():
-                    arcname = file_path.relative_to(temp_dir)
-                    zipf.write(file_path, arcname)
+    def _repack_pptx(self, input_path, part_data, ready, temp_output, output_path):
+        """
+        Reescribe el PPTX en orden de ZIP: partes con texto según van estando listas,
+        el resto copiado en bruto. Se ejecuta en un hilo mientras dura la traducción.
+        """
+        written = 0
+        
+        def writer(name):
+            def write(data):
+                nonlocal written
+                result = ready[name].result()
+                if isinstance(result, dict):
+                    result = apply_part_translations(input_path, name, part_data[name], result)
+                written += 1
+                self._report("writing", written, len(ready))
+                # Parte sin traducciones que aplicar: se conserva su XML
+                return data if result is None else result
+            return write
+        
+        # Las partes que no se reescribieron en el pool se leen con un único ZipFile por trabajo
+        with open_packages():
+            stats = rewrite_package(input_path, temp_output, {name: writer(name) for name in ready})
+        logger.info(f"Reescritas {stats['rewritten']} partes, copiadas sin recomprimir {stats['copied']} "
+                    f"({stats['copied_bytes'] / 1024 / 1024:.1f} MB)")
         
         if output_path.exists():
             output_path.unlink()
@@ -674,32 +1373,39 @@ class PPTXEditor:
         logger.info(f"Archivo generado: {output_path}")
 
 # Funciones de utilidad
-def save_to_storage(file_path):
-    """Guarda un archivo en almacenamiento permanente y devuelve su ID"""
-    file_id = str(uuid.uuid4())
-    dest_dir = CONFIG["storage_dir"] / file_id
-    dest_dir.mkdir(exist_ok=True)
-    
-    dest_path = dest_dir / Path(file_path).name
-    shutil.copy2(file_path, dest_path)
-    
-    return file_id
+def verify_pptx(input_path):
+    """Comprueba que el archivo es un ZIP con la estructura mínima de un PPTX"""
+    try:
+        from zipfile import ZipFile, BadZipFile
+        try:
+            with ZipFile(input_path) as zf:
+                # Verificar que contiene los archivos necesarios de un PPTX
+                content_types = any('[Content_Types].xml' in filename for filename in zf.namelist())
+                presentation = any('ppt/presentation.xml' in filename for filename in zf.namelist())
+                slides_folder = any('ppt/slides/' in filename for filename in zf.namelist())
+                
+                if not (content_types and presentation and slides_folder):
+                    logger.error(f"El archivo no parece ser un PPTX válido: {input_path}")
+                    raise Exception("El archivo no tiene la estructura de un documento PPTX válido")
+                    
+                logger.info(f"Archivo PPTX verificado: {input_path}")
+        except BadZipFile:
+            logger.error(f"El archivo no es un archivo ZIP válido: {input_path}")
+            raise Exception("El archivo no es un documento PPTX válido (no es un ZIP)")
+    except Exception as e:
+        logger.error(f"Error al verificar el archivo PPTX: {e}")
+        raise Exception(f"Error al verificar el archivo PPTX: {str(e)}")
 
-def process_translation_task(input_path, output_dir, source_lang, target_lang, job_id):
-    """Tarea en segundo plano para realizar la traducción"""
-    process_file = None
-    result_file = CONFIG["storage_dir"] / f"{job_id}_result.json"
+async def process_translation_task(input_path, output_dir, source_lang, target_lang, job_id, result_key=None):
+    """Tarea en segundo plano para realizar la traducción; se ejecuta en el bucle de eventos"""
+    registry = JobRegistry.shared()
     
     try:
         logger.info(f"Iniciando traducción: {input_path}, de {source_lang} a {target_lang}")
-        
-        # Identificar file_id
-        file_id = None
-        process_matches = list(CONFIG["storage_dir"].glob(f"*_processing_{job_id}.json"))
-        if process_matches:
-            process_file = process_matches[0]
-            file_id = process_file.name.split("_processing_")[0]
-            logger.info(f"Proceso asociado a file_id: {file_id}")
+        if not registry.transition(job_id, "processing"):
+            # La cola puede repetir un trabajo interrumpido justo después de terminar
+            logger.info(f"El trabajo {job_id} ya había terminado; no se repite")
+            return
         
         output_path = Path(output_dir) / f"{Path(input_path).stem}_translated_{target_lang}.pptx"
         
@@ -709,47 +1415,30 @@ def process_translation_task(input_path, output_dir, source_lang, target_lang, j
             raise FileNotFoundError(f"No se encontró el archivo: {input_path}")
             
         # Verificar que el archivo es un PPTX válido
-        try:
-            from zipfile import ZipFile, BadZipFile
-            try:
-                with ZipFile(input_path) as zf:
-                    # Verificar que contiene los archivos necesarios de un PPTX
-                    content_types = any('[Content_Types].xml' in filename for filename in zf.namelist())
-                    presentation = any('ppt/presentation.xml' in filename for filename in zf.namelist())
-                    slides_folder = any('ppt/slides/' in filename for filename in zf.namelist())
-                    
-                    if not (content_types and presentation and slides_folder):
-                        logger.error(f"El archivo no parece ser un PPTX válido: {input_path}")
-                        raise Exception("El archivo no tiene la estructura de un documento PPTX válido")
-                        
-                    logger.info(f"Archivo PPTX verificado: {input_path}")
-            except BadZipFile:
-                logger.error(f"El archivo no es un archivo ZIP válido: {input_path}")
-                raise Exception("El archivo no es un documento PPTX válido (no es un ZIP)")
-        except Exception as e:
-            logger.error(f"Error al verificar el archivo PPTX: {e}")
-            raise Exception(f"Error al verificar el archivo PPTX: {str(e)}")
+        await asyncio.to_thread(verify_pptx, input_path)
             
         # Iniciar proceso de traducción
         logger.info("Inicializando traductor...")
-        translator = Translator(target_language=target_lang)
+        translator = await asyncio.to_thread(Translator, target_language=target_lang, source_language=source_lang)
         
         # Verificar que el traductor se inicializó correctamente
-        if not translator.client:
-            logger.error("El cliente OpenAI no está disponible")
-            raise Exception("No se pudo inicializar el traductor: Cliente OpenAI no disponible")
+        if not translator.transport:
+            logger.error("El transporte de traducción no está disponible")
+            raise Exception("No se pudo inicializar el traductor: transporte no disponible")
             
-        if not translator.assistant_id:
+        if translator.transport.name == "assistant" and not translator.assistant_id:
             logger.error("El ID de asistente no está disponible")
             raise Exception("No se pudo inicializar el traductor: ID de asistente no disponible")
             
         logger.info("Inicializando editor PPTX...")
         editor = PPTXEditor(translator)
+        # Avance en vivo para /jobs/{job_id}/events; la traducción domina el tiempo total
+        editor.on_progress = ProgressTracker(job_id, {"extracting": 0.1, "translating": 0.8, "writing": 0.1}).update
         
         # Iniciar traducción con medición de tiempo
         start_time = time.time()
         logger.info(f"Comenzando procesamiento de PPTX: {input_path} -> {output_path}")
-        result_path = editor.process_pptx(input_path, output_path)
+        result_path = await editor.process_pptx_async(input_path, output_path)
         elapsed = time.time() - start_time
         logger.info(f"Procesamiento completado en {elapsed:.2f} segundos")
         
@@ -760,22 +1449,31 @@ def process_translation_task(input_path, output_dir, source_lang, target_lang, j
         logger.info(f"Archivo generado correctamente: {result_path}")
         
         # Recopilar estadísticas
+        cache_lookups = translator.cache_hits + translator.cache_misses
         stats = {
             "slides_processed": editor.slides_processed,
+            "parts_processed": editor.parts_processed,
             "texts_translated": editor.total_texts,
             "total_time": elapsed,
+            "transport": translator.transport.name,
             "api_calls": translator.api_calls,
+            "chunks_sent": translator.chunks_sent,
             "rate_limit_retries": translator.rate_limit_retries,
+            "rate_limit_wait_seconds": round(translator.rate_limit_wait, 2),
+            "tokens_estimated": translator.tokens_used,
             "successful_retries": translator.successful_retries,
             "errors": translator.errors,
-            "cache_hits": getattr(translator, 'cache_hits', 0),
-            "cache_misses": getattr(translator, 'cache_misses', 0),
-            "duplicates_avoided": getattr(translator, 'duplicates_avoided', 0)
+            "cache_hits": translator.cache_hits,
+            "cache_misses": translator.cache_misses,
+            "cache_hit_rate": round(translator.cache_hits / cache_lookups, 3) if cache_lookups else 0.0,
+            "duplicates_avoided": getattr(translator, 'duplicates_avoided', 0),
+            "memory_cache": MEMORY_TIER.stats()
         }
+        if translator.transport.name == "assistant":
+            stats["polling"] = translator.transport.polling_stats()
         
-        # Almacenar resultado
-        file_id_result = file_id or str(uuid.uuid4())
-        result_file_id = save_to_storage(str(result_path))
+        # Almacenar resultado: se renombra a su ubicación definitiva, sin copiarlo
+        result_file_id = await asyncio.to_thread(store_result, result_path, CONFIG["storage_dir"])
         filename = Path(result_path).name
         
         result_data = {
@@ -787,9 +1485,15 @@ def process_translation_task(input_path, output_dir, source_lang, target_lang, j
             "stats": stats
         }
         
-        logger.info(f"Guardando resultado en {result_file}")
-        with open(result_file, "w", encoding="utf-8") as f:
-            json.dump(result_data, f, ensure_ascii=False)
+        # Recordar el resultado para peticiones idénticas (mismo contenido, idiomas y versión)
+        if result_key:
+            store = ContentStore.shared()
+            result_hash = store.hash_of(stored_path(CONFIG["storage_dir"], result_file_id, filename))
+            if result_hash:
+                store.remember(result_key, result_data, [{"sha256": result_hash, "filename": filename}])
+        
+        logger.info(f"Guardando resultado del trabajo {job_id}")
+        registry.transition(job_id, "completed", result_data)
             
     except Exception as e:
         logger.error(f"Error procesando traducción: {str(e)}", exc_info=True)
@@ -805,25 +1509,15 @@ def process_translation_task(input_path, output_dir, source_lang, target_lang, j
         # Incluir detalles adicionales si es posible
         if 'translator' in locals() and translator:
             error_data["details"] = {
-                "client_initialized": hasattr(translator, 'client') and translator.client is not None,
+                "client_initialized": getattr(translator, 'transport', None) is not None,
                 "assistant_id_set": hasattr(translator, 'assistant_id') and translator.assistant_id is not None,
                 "api_calls": getattr(translator, 'api_calls', 0),
                 "errors": getattr(translator, 'errors', 0)
             }
         
-        logger.info(f"Guardando información de error en {result_file}")
-        with open(result_file, "w", encoding="utf-8") as f:
-            json.dump(error_data, f, ensure_ascii=False)
+        logger.info(f"Guardando información de error del trabajo {job_id}")
+        registry.transition(job_id, "error", error_data)
     finally:
-        # Limpieza de archivos temporales
-        if process_file and process_file.exists():
-            try:
-                logger.info(f"Eliminando archivo de proceso: {process_file}")
-                process_file.unlink()
-            except Exception as e:
-                logger.error(f"Error al eliminar archivo de proceso: {e}")
-                pass
-        
         # Intenta eliminar archivo de entrada si es temporal
         if os.path.exists(input_path):
             if '/temp/' in input_path.lower() or 'temporal' in input_path.lower():
@@ -838,11 +1532,17 @@ def process_translation_task(input_path, output_dir, source_lang, target_lang, j
         if os.path.exists(output_dir):
             try:
                 logger.info(f"Eliminando directorio de salida temporal: {output_dir}")
-                shutil.rmtree(output_dir)
+                await asyncio.to_thread(shutil.rmtree, output_dir)
             except Exception as e:
                 logger.error(f"Error al eliminar directorio de salida: {e}")
                 pass
 
+register_handler("translate", process_translation_task)
+
+# La cola de trabajos arranca y se detiene con la aplicación
+router.on_event("startup")(start_workers)
+router.on_event("shutdown")(stop_workers)
+
 # API Endpoints
 @router.post("/upload-pptx-for-translation")
 async def upload_pptx_for_translation(
@@ -870,37 +1570,31 @@ async def upload_pptx_for_translation(
         if not assistant_id:
             raise HTTPException(status_code=500, detail="Configuración de traducción no disponible: ID de asistente no encontrado")
         
-        # Guardar archivo
-        temp_dir = tempfile.mkdtemp()
+        # Guardar y validar el archivo fuera del bucle de eventos, con su SHA-256
+        # En el volumen de almacenamiento, no en /tmp del contenedor
+        file_id = str(uuid.uuid4())
         safe_filename = file.filename.replace(" ", "_").replace("(", "").replace(")", "")
-        input_path = os.path.join(temp_dir, safe_filename)
+        partial_path = CONFIG["upload_dir"] / f".{file_id}.partial"
+        try:
+            received = await receive_upload(file, partial_path)
+        except UploadRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
         
-        with open(input_path, "wb") as buffer:
-            chunk_size = 1024 * 1024
-            total_size = 0
-            
-            while True:
-                chunk = await file.read(chunk_size)
-                if not chunk:
-                    break
-                
-                buffer.write(chunk)
-                total_size += len(chunk)
+        # Una subida repetida comparte los bytes de la anterior
+        content_hash = received["sha256"]
+        total_size = received["size"]
+        input_path = shard_dir(CONFIG["upload_dir"], file_id) / safe_filename
+        await asyncio.to_thread(ContentStore.shared().store, partial_path, input_path, content_hash)
         
         # Registrar metadatos
-        file_id = str(uuid.uuid4())
         original_name = Path(file.filename).stem
         
-        file_meta = CONFIG["storage_dir"] / f"{file_id}_meta.json"
-        with open(file_meta, "w", encoding="utf-8") as f:
-            json.dump({
-                "file_id": file_id,
-                "original_name": original_name,
-                "input_path": input_path,
-                "source_language": source_language,
-                "target_language": target_language,
-                "timestamp": str(int(time.time()))
-            }, f, ensure_ascii=False)
+        JobRegistry.shared().register_file(file_id, "translate", input_path, original_name, {
+            "source_language": source_language,
+            "target_language": target_language,
+            "sha256": content_hash,
+            "size": total_size
+        })
         
         return JSONResponse({
             "file_id": file_id,
@@ -916,18 +1610,64 @@ async def upload_pptx_for_translation(
         logger.error(f"Error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
+def already_running_response(job, file_id):
+    """Respuesta cuando el archivo ya tiene una traducción activa"""
+    return JSONResponse({
+        "job_id": job["job_id"],
+        "file_id": file_id,
+        "output_filename": job["data"].get("output_filename"),
+        "status": job["status"],
+        "message": "Ya existe un proceso de traducción en curso",
+        "download_url": f"/api/translate/jobs/{job['job_id']}"
+    })
+
+def reuse_translation(key, file_id, output_filename, data):
+    """
+    Resuelve la petición con un resultado anterior idéntico: enlaza su archivo con el nombre
+    pedido y registra el trabajo ya completado. None si no hay resultado reutilizable.
+    """
+    store = ContentStore.shared()
+    previous = store.recall(key)
+    if not previous:
+        return None
+    dest = store.link(previous["files"][0]["sha256"], new_storage_path(CONFIG["storage_dir"], output_filename))
+    if dest is None:
+        return None
+    
+    result = dict(previous["result"])
+    result.update({
+        "file_id": dest.parent.name,
+        "filename": dest.name,
+        "download_url": f"/api/translate/files/{dest.parent.name}/{dest.name}",
+        "completion_time": time.time(),
+        "reused": True
+    })
+    
+    registry = JobRegistry.shared()
+    job_id = str(uuid.uuid4())
+    job, created = registry.create_job(job_id, "translate", file_id, data, status="processing")
+    if not created:
+        store.release(dest)
+        shutil.rmtree(dest.parent, ignore_errors=True)
+        return already_running_response(job, file_id)
+    registry.transition(job_id, "completed", result)
+    logger.info(f"Resultado reutilizado para file_id {file_id}: trabajo {job_id}")
+    return JSONResponse({"job_id": job_id, "message": "Traducción reutilizada de una petición idéntica", **result})
+
 @router.post("/process-translation")
-async def process_translation(
-    background_tasks: BackgroundTasks,
-    request: dict
-):
-    """Inicia proceso de traducción en segundo plano"""
+async def process_translation(request: dict):
+    """Encola el proceso de traducción; lo ejecuta el pool de workers de la cola"""
     try:
         file_id = request.get("file_id")
         original_name = request.get("original_name")
         source_language = request.get("source_language", "es")
         target_language = request.get("target_language", "en")
         
+        try:
+            priority = int(request.get("priority", 0))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="La prioridad debe ser un número entero")
+        
         if not file_id:
             logger.error("Se requiere file_id para procesar la traducción")
             raise HTTPException(status_code=400, detail="Se requiere file_id")
@@ -935,35 +1675,19 @@ async def process_translation(
         logger.info(f"Procesando traducción para file_id: {file_id}, de {source_language} a {target_language}")
         
         # Verificar si ya está en proceso
-        result_check = list(CONFIG["storage_dir"].glob(f"{file_id}_processing_*.json"))
-        if result_check:
+        registry = JobRegistry.shared()
+        existing_job = registry.active_job(file_id, "translate")
+        if existing_job:
             logger.info(f"Ya existe un proceso de traducción en curso para file_id: {file_id}")
-            with open(result_check[0], "r", encoding="utf-8") as f:
-                existing_job = json.load(f)
-                
-            return JSONResponse({
-                "job_id": existing_job.get("job_id"),
-                "file_id": file_id,
-                "output_filename": existing_job.get("output_filename", f"{original_name}_translated_{target_language}.pptx"),
-                "status": "processing",
-                "message": "Ya existe un proceso de traducción en curso",
-                "download_url": f"/api/translate/jobs/{existing_job.get('job_id')}"
-            })
+            return already_running_response(existing_job, file_id)
         
         # Cargar metadatos
-        file_meta_path = CONFIG["storage_dir"] / f"{file_id}_meta.json"
-        if not file_meta_path.exists():
-            logger.error(f"Archivo de metadatos no encontrado: {file_meta_path}")
+        file_meta = registry.get_file(file_id)
+        if not file_meta:
+            logger.error(f"Archivo no registrado: {file_id}")
             raise HTTPException(status_code=404, detail="Archivo no encontrado")
         
-        try:
-            with open(file_meta_path, "r", encoding="utf-8") as f:
-                file_meta = json.load(f)
-        except json.JSONDecodeError as e:
-            logger.error(f"Error al decodificar JSON de metadatos: {e}")
-            raise HTTPException(status_code=500, detail=f"Error al leer metadatos: {str(e)}")
-        
-        input_path = file_meta.get("input_path")
+        input_path = file_meta.get("path")
         if not input_path or not os.path.exists(input_path):
             logger.error(f"Archivo original no encontrado: {input_path}")
             raise HTTPException(status_code=404, detail="Archivo original no encontrado")
@@ -990,56 +1714,65 @@ async def process_translation(
         # Verificación rápida de inicialización de Translator
         try:
             logger.info("Probando inicialización de Translator...")
-            test_translator = Translator()
-            if not test_translator.client or not test_translator.assistant_id:
-                logger.error(f"Error en inicialización de Translator: cliente o ID de asistente no disponibles")
-                logger.error(f"client: {test_translator.client}, assistant_id: {test_translator.assistant_id}")
+            test_translator = Translator(use_cache=False)
+            if not test_translator.transport:
+                logger.error(f"Error en inicialización de Translator: transporte no disponible")
                 raise Exception("El traductor no pudo inicializarse correctamente")
             logger.info("Translator inicializado correctamente para verificación")
         except Exception as e:
             logger.error(f"Error al inicializar Translator: {e}")
             raise HTTPException(status_code=500, detail=f"Error en la configuración del traductor: {str(e)}")
         
-        # Preparar tarea
-        output_dir = tempfile.mkdtemp()
         output_filename = f"{original_name or file_meta.get('original_name')}_translated_{target_language}.pptx"
+        job_data = {
+            "input_path": input_path,
+            "output_filename": output_filename,
+            "source_language": source_language,
+            "target_language": target_language,
+            "assistant_id": assistant_id
+        }
         
+        # Mismo contenido, idiomas y versión de traducción: devolver el resultado anterior sin reprocesar
+        content_hash = (file_meta.get("meta") or {}).get("sha256")
+        key = result_key(content_hash, "translate", {
+            "source_language": source_language,
+            "target_language": target_language,
+            "version": test_translator.cache_version
+        }) if content_hash else None
+        if key:
+            reused = await asyncio.to_thread(reuse_translation, key, file_id, output_filename, job_data)
+            if reused is not None:
+                return reused
+        
+        # Preparar tarea (el directorio de trabajo sobrevive a un reinicio para poder reanudarla)
         job_id = str(uuid.uuid4())
-        
-        # Registrar trabajo
-        processing_file = CONFIG["storage_dir"] / f"{file_id}_processing_{job_id}.json"
-        with open(processing_file, "w", encoding="utf-8") as f:
-            job_data = {
-                "job_id": job_id,
-                "file_id": file_id,
-                "input_path": input_path,
-                "output_dir": output_dir,
-                "output_filename": output_filename,
-                "source_language": source_language,
-                "target_language": target_language,
-                "start_time": time.time(),
-                "assistant_id": assistant_id
-            }
-            json.dump(job_data, f, ensure_ascii=False)
-            logger.info(f"Trabajo registrado: {job_id} para archivo {file_id}")
-        
-        # Iniciar tarea en segundo plano
-        logger.info(f"Iniciando tarea en segundo plano con job_id: {job_id}")
-        background_tasks.add_task(
-            process_translation_task,
-            input_path,
-            output_dir,
-            source_language,
-            target_language,
-            job_id
-        )
+        output_dir = str(JobQueue.shared().workspace(job_id))
+        job_data["output_dir"] = output_dir
+        
+        # Registrar trabajo (atómico: si otra petición se adelantó, se devuelve la suya)
+        job, created = registry.create_job(job_id, "translate", file_id, job_data)
+        if not created:
+            await asyncio.to_thread(shutil.rmtree, output_dir, True)
+            return already_running_response(job, file_id)
+        logger.info(f"Trabajo registrado: {job_id} para archivo {file_id}")
+        
+        # Encolar: la respuesta no espera a que haya un worker libre
+        await submit("translate", {
+            "input_path": input_path,
+            "output_dir": output_dir,
+            "source_lang": source_language,
+            "target_lang": target_language,
+            "job_id": job_id,
+            "result_key": key
+        }, priority=priority, job_id=job_id)
+        logger.info(f"Trabajo encolado con job_id: {job_id} (prioridad {priority})")
         
         return JSONResponse({
             "job_id": job_id,
             "file_id": file_id,
             "output_filename": output_filename,
-            "status": "processing",
-            "message": "Procesando traducción en segundo plano",
+            "status": "queued",
+            "message": "Traducción en cola",
             "download_url": f"/api/translate/jobs/{job_id}"
         })
             
@@ -1052,73 +1785,97 @@ async def process_translation(
 @router.get("/jobs/{job_id}")
 async def get_translation_status(job_id: str):
     """Obtiene estado de un trabajo de traducción"""
-    result_file = CONFIG["storage_dir"] / f"{job_id}_result.json"
+    job = JobRegistry.shared().get_job(job_id)
+    
+    # No encontrado
+    if job is None:
+        return JSONResponse({
+            "job_id": job_id,
+            "status": "queued",
+            "message": "Trabajo en cola o no encontrado"
+        })
     
     # Comprobar si completado
-    if result_file.exists():
-        try:
-            with open(result_file, "r", encoding="utf-8") as f:
-                result = json.load(f)
-            
-            if "job_id" not in result:
-                result["job_id"] = job_id
-                
-            return JSONResponse(result)
-        except Exception as e:
-            return JSONResponse({
-                "job_id": job_id,
-                "status": "error",
-                "message": f"Error al recuperar estado: {str(e)}"
-            })
-    
-    # Comprobar si en proceso
-    processing_files = list(CONFIG["storage_dir"].glob(f"*_processing_{job_id}.json"))
-    if processing_files:
-        try:
-            with open(processing_files[0], "r", encoding="utf-8") as f:
-                process_info = json.load(f)
-            
-            start_time = process_info.get("start_time", 0)
-            elapsed = time.time() - float(start_time) if start_time else 0
-            max_time = 30 * 60
-            progress = min(95, (elapsed / max_time) * 100) if elapsed > 0 else 5
-            
-            return JSONResponse({
-                "job_id": job_id,
-                "file_id": process_info.get("file_id"),
-                "status": "processing",
-                "message": "La traducción está en proceso",
-                "elapsed_seconds": int(elapsed),
-                "estimated_progress": round(progress, 1),
-                "start_time": start_time
-            })
-        except Exception as e:
-            return JSONResponse({
-                "job_id": job_id,
-                "status": "processing",
-                "message": "La traducción sigue en proceso"
-            })
+    if job["status"] in ("completed", "error"):
+        result = job["result"] or {"status": job["status"]}
+        result.setdefault("job_id", job_id)
+        return JSONResponse(result)
+    
+    # Comprobar si sigue en cola o la cola lo dio por perdido
+    queued = JobQueue.shared().get(job_id)
+    if queued and queued["status"] == "queued":
+        return JSONResponse({
+            "job_id": job_id,
+            "file_id": job["file_id"],
+            "status": "queued",
+            "message": "Trabajo en cola",
+            "queue_position": queued["position"],
+            "priority": queued["priority"]
+        })
+    if queued and queued["status"] == "failed":
+        error_data = {"status": "error", "message": queued["error"], "completion_time": time.time()}
+        JobRegistry.shared().transition(job_id, "error", error_data)
+        return JSONResponse({"job_id": job_id, **error_data})
+    
+    # En proceso: avance real si el trabajo corre en este proceso, estimado por tiempo si no
+    start_time = job["started_at"] or job["created_at"]
+    elapsed = time.time() - start_time
+    live = EVENTS.snapshot(job_id) or {}
+    if "progress" in live:
+        progress = live["progress"]
+    else:
+        max_time = 30 * 60
+        progress = min(95, (elapsed / max_time) * 100) if elapsed > 0 else 5
     
-    # No encontrado
     return JSONResponse({
         "job_id": job_id,
-        "status": "queued",
-        "message": "Trabajo en cola o no encontrado"
+        "file_id": job["file_id"],
+        "status": "processing",
+        "message": "La traducción está en proceso",
+        "elapsed_seconds": int(elapsed),
+        "estimated_progress": round(progress, 1),
+        "eta_seconds": live.get("eta_seconds"),
+        "slides_processed": live.get("slides_processed"),
+        "texts_translated": live.get("texts_translated"),
+        "cache_hits": live.get("cache_hits"),
+        "start_time": start_time
     })
 
+@router.get("/jobs/{job_id}/events")
+async def stream_translation_events(job_id: str):
+    """
+    Progreso del trabajo en vivo (Server-Sent Events): diapositivas analizadas, lotes y
+    textos traducidos, aciertos de caché y ETA. El último evento (completed o error)
+    lleva el mismo resultado que /jobs/{job_id} y cierra el flujo.
+    """
+    if EVENTS.snapshot(job_id) is None and JobRegistry.shared().get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    
+    return StreamingResponse(
+        EVENTS.stream(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/queue/stats")
+async def get_queue_stats():
+    """Trabajos por tipo y estado, y workers ocupados"""
+    return JSONResponse(await asyncio.to_thread(queue_stats))
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Estadísticas de la capa de caché en memoria compartida por los trabajos"""
+    return JSONResponse(MEMORY_TIER.stats())
+
 @router.get("/files/{file_id}/{filename}")
-async def download_translated_file(file_id: str, filename: str):
-    """Descarga archivo traducido"""
-    file_path = CONFIG["storage_dir"] / file_id / filename
+async def download_translated_file(file_id: str, filename: str, request: Request):
+    """Descarga archivo traducido (con ETag, 304 y rangos)"""
+    file_path = stored_path(CONFIG["storage_dir"], file_id, filename)
     
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
     
-    return FileResponse(
-        path=file_path,
-        filename=filename,
-        media_type="application/vnd.openxmlformats-officedocument.presentationml.presentation"
-    )
+    return await serve_file(request, file_path, filename)
 
 @router.get("/download-all-files")
 async def download_all_files_get(file_ids: str, filenames: str):
@@ -1142,7 +1899,7 @@ async def download_all_files_get(file_ids: str, filenames: str):
             file_id = file_ids_list[i]
             filename = filenames_list[i]
             
-            file_path = CONFIG["storage_dir"] / file_id / filename
+            file_path = stored_path(CONFIG["storage_dir"], file_id, filename)
             
             if file_path.exists():
                 files_to_zip.append((file_path, filename))
@@ -1153,42 +1910,8 @@ async def download_all_files_get(file_ids: str, filenames: str):
         if not files_to_zip:
             raise HTTPException(status_code=404, detail="Ningún archivo encontrado")
         
-        # Crear ZIP
-        temp_dir = Path(tempfile.mkdtemp())
-        zip_file_path = temp_dir / "traducciones.zip"
-        
-        with zipfile.ZipFile(zip_file_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for file_path, filename in files_to_zip:
-                zipf.write(file_path, filename)
-                logger.info(f"Añadido {filename} al ZIP")
-        
-        # Verificar ZIP
-        if not zip_file_path.exists() or os.path.getsize(zip_file_path) == 0:
-            raise Exception("Error al crear ZIP")
-        
-        # Programar limpieza de archivos temporales
-        background_tasks = BackgroundTasks()
-        
-        async def cleanup_temp():
-            try:
-                if zip_file_path.exists():
-                    os.unlink(zip_file_path)
-                if temp_dir.exists():
-                    shutil.rmtree(temp_dir)
-            except Exception as e:
-                logger.error(f"Error en limpieza: {e}")
-        
-        background_tasks.add_task(cleanup_temp)
-        
-        # Devolver ZIP
-        response = FileResponse(
-            path=zip_file_path,
-            filename="traducciones.zip",
-            media_type="application/zip",
-            background=background_tasks
-        )
-        
-        return response
+        # ZIP generado mientras se envía: el primer byte sale sin esperar al archivo completo
+        return zip_response(files_to_zip, "traducciones.zip")
                 
     except HTTPException:
         raise            
@@ -1226,7 +1949,7 @@ async def download_all_files(request: dict):
             if not file_id or not filename:
                 continue
             
-            file_path = CONFIG["storage_dir"] / file_id / filename
+            file_path = stored_path(CONFIG["storage_dir"], file_id, filename)
             
             if file_path.exists():
                 files_to_zip.append((file_path, filename))
@@ -1237,38 +1960,8 @@ async def download_all_files(request: dict):
         if not files_to_zip:
             raise HTTPException(status_code=404, detail="Ningún archivo encontrado")
         
-        # Crear ZIP
-        temp_dir = Path(tempfile.mkdtemp())
-        zip_file_path = temp_dir / "traducciones.zip"
-        
-        with zipfile.ZipFile(zip_file_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for file_path, filename in files_to_zip:
-                zipf.write(file_path, filename)
-                logger.info(f"Añadido {filename} al ZIP")
-        
-        # Programar limpieza de archivos temporales
-        background_tasks = BackgroundTasks()
-        
-        async def cleanup_temp():
-            try:
-                if zip_file_path.exists():
-                    os.unlink(zip_file_path)
-                if temp_dir.exists():
-                    shutil.rmtree(temp_dir)
-            except Exception as e:
-                logger.error(f"Error en limpieza: {e}")
-        
-        background_tasks.add_task(cleanup_temp)
-        
-        # Devolver ZIP
-        response = FileResponse(
-            path=zip_file_path,
-            filename="traducciones.zip",
-            media_type="application/zip",
-            background=background_tasks
-        )
-        
-        return response
+        # ZIP generado mientras se envía: el primer byte sale sin esperar al archivo completo
+        return zip_response(files_to_zip, "traducciones.zip")
             
     except HTTPException:
         raise
@@ -1285,6 +1978,8 @@ def parse_args():
                       choices=CONFIG["supported_languages"],
                       help="Idioma destino (por defecto: en)")
     parser.add_argument("--no-cache", action="store_true", help="Desactivar caché de traducciones")
+    parser.add_argument("--transport", type=str, choices=["chat", "assistant"], default=CONFIG["transport"],
+                      help="Transporte de traducción (por defecto: %(default)s)")
     
     return parser.parse_args()
 
@@ -1319,11 +2014,12 @@ def main():
         
         logger.info(f"Iniciando traducción de {input_path.name} a {args.language}")
         
-        translator = Translator()
+        translator = Translator(target_language=args.language, use_cache=not args.no_cache,
+                                transport=args.transport)
         
         # Verificar que el traductor se inicializó correctamente
-        if not translator.assistant_id:
-            logger.error("Error: No se pudo inicializar el traductor (ID de asistente no disponible)")
+        if not translator.transport:
+            logger.error("Error: No se pudo inicializar el traductor (transporte no disponible)")
             return 1
             
         editor = PPTXEditor(translator)
@@ -1340,6 +2036,7 @@ def main():
         logger.info(f"Archivo generado: {result_path}")
         logger.info(f"\nEstadísticas:")
         logger.info(f"- Diapositivas procesadas: {editor.slides_processed}")
+        logger.info(f"- Partes con texto: {editor.parts_processed}")
         logger.info(f"- Textos traducidos: {editor.total_texts}")
         
         if hasattr(translator, 'cache') and translator.cache:
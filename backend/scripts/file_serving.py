@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Descarga de archivos almacenados con validación condicional, rangos y descarga delegada.
+
+Todas las rutas de descarga (traducción, división, autofit) responden con serve_file:
+- ETag fuerte a partir del SHA-256 del contenido (el de ContentStore si el archivo está
+  registrado; si no, calculado una vez y recordado mientras el archivo no cambie).
+- If-None-Match / If-Modified-Since -> 304 sin cuerpo.
+- Range (un único rango, con If-Range) -> 206, para reanudar descargas cortadas.
+- Con FILE_OFFLOAD=x-accel o x-sendfile la transferencia la hace el proxy inverso
+  (nginx, Apache/lighttpd) y el worker de uvicorn solo envía las cabeceras.
+"""
+import os, re, asyncio, logging, threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from fastapi import Request
+from fastapi.responses import Response, FileResponse, StreamingResponse
+
+try:
+    from scripts.file_store import ContentStore, file_sha256
+except ImportError:
+    from file_store import ContentStore, file_sha256
+
+logger = logging.getLogger("file-serving")
+
+PPTX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+SERVING_CONFIG = {
+    # "", "x-accel" (nginx) o "x-sendfile" (Apache mod_xsendfile, lighttpd)
+    "offload": os.environ.get("FILE_OFFLOAD", "").strip().lower(),
+    # Directorio que el proxy sirve internamente y ruta interna de nginx que le corresponde
+    "offload_root": Path(os.environ.get("FILE_OFFLOAD_ROOT", os.environ.get("STORAGE_DIR", "./storage"))),
+    "accel_prefix": os.environ.get("X_ACCEL_PREFIX", "/protected-storage/"),
+    "chunk_size": 256 * 1024,
+    # Las rutas de descarga son de un único resultado: el navegador revalida con el ETag
+    "cache_control": "private, no-cache",
+}
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Hashes calculados de archivos que no están en ContentStore, por (ruta, inodo, tamaño, mtime)
+_HASH_CACHE: "OrderedDict[Tuple, str]" = OrderedDict()
+_HASH_CACHE_SIZE = 2048
+_hash_lock = threading.Lock()
+
+def content_disposition(filename: str, disposition: str = "attachment") -> str:
+    quoted = quote(filename)
+    if quoted == filename:
+        return f'{disposition}; filename="{filename}"'
+    return f"{disposition}; filename*=utf-8''{quoted}"
+
+def content_hash(path: Path, stat_result: os.stat_result) -> str:
+    """SHA-256 del archivo; bloqueante, llamar fuera del bucle de eventos"""
+    store = ContentStore.shared()
+    digest = store.hash_of(path)
+    if digest:
+        # Cada descarga cuenta como uso para el desalojo LRU del almacenamiento
+        store.touch(digest)
+        return digest
+    key = (str(path), stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns)
+    with _hash_lock:
+        if key in _HASH_CACHE:
+            _HASH_CACHE.move_to_end(key)
+            return _HASH_CACHE[key]
+    digest = file_sha256(path)
+    with _hash_lock:
+        _HASH_CACHE[key] = digest
+        while len(_HASH_CACHE) > _HASH_CACHE_SIZE:
+            _HASH_CACHE.popitem(last=False)
+    return digest
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Comparación débil de If-None-Match (RFC 9110): el prefijo W/ no cuenta"""
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+def _not_modified_since(header: str, mtime: float) -> bool:
+    try:
+        return int(mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Rango (inicio, fin inclusive) de una cabecera Range de un solo tramo.
+
+    None si la cabecera no es utilizable (varios tramos, otra unidad): se envía el archivo
+    completo, como permite el RFC. ValueError si el rango no se puede satisfacer.
+    """
+    match = _RANGE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Sufijo: los últimos N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+async def _read_range(path: Path, start: int, end: int, chunk_size: int):
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def _offload_headers(path: Path) -> Optional[dict]:
+    """Cabecera que delega el envío en el proxy, o None si no aplica a esta ruta"""
+    mode = SERVING_CONFIG["offload"]
+    if mode not in ("x-accel", "x-sendfile"):
+        return None
+    if mode == "x-sendfile":
+        # Codificada en %: las cabeceras HTTP solo admiten latin-1 (mod_xsendfile la decodifica)
+        return {"X-Sendfile": quote(str(path))}
+    try:
+        relative = path.relative_to(SERVING_CONFIG["offload_root"].resolve())
+    except ValueError:
+        logger.warning(f"{path} está fuera de {SERVING_CONFIG['offload_root']}: se envía directamente")
+        return None
+    return {"X-Accel-Redirect": SERVING_CONFIG["accel_prefix"].rstrip("/") + "/" + quote(relative.as_posix())}
+
+async def serve_file(request: Request, path, filename: str, media_type: str = PPTX_MEDIA_TYPE) -> Response:
+    """Respuesta de descarga de `path` según las cabeceras condicionales y de rango de la petición"""
+    path = Path(path).resolve()
+    stat_result = await asyncio.to_thread(os.stat, path)
+    digest = await asyncio.to_thread(content_hash, path, stat_result)
+    etag = f'"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": SERVING_CONFIG["cache_control"],
+        "Accept-Ranges": "bytes",
+    }
+
+    # If-None-Match tiene prioridad; If-Modified-Since solo sin él
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    elif _not_modified_since(request.headers.get("if-modified-since"), stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    headers["Content-Disposition"] = content_disposition(filename)
+
+    # El proxy atiende él mismo los rangos; aquí ya se resolvieron las condicionales
+    offload = _offload_headers(path)
+    if offload:
+        return Response(status_code=200, headers={**headers, **offload}, media_type=media_type)
+
+    size = stat_result.st_size
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range: el rango solo vale si el archivo sigue siendo el que el cliente tenía
+    if range_header and (if_range is None or if_range.strip() in (etag, headers["Last-Modified"])):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                _read_range(path, start, end, SERVING_CONFIG["chunk_size"]),
+                status_code=206,
+                headers=headers,
+                media_type=media_type
+            )
+
+    return FileResponse(path, headers=headers, media_type=media_type, stat_result=stat_result)
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Colocación de resultados en el almacenamiento sin copiarlos.
+
+Los archivos generados se mueven a su ubicación definitiva con os.replace, que en el
+mismo sistema de archivos es un renombrado atómico: ni se escribe el archivo dos veces
+ni un lector puede ver un archivo a medias. Solo si origen y destino están en
+dispositivos distintos se copia (a un temporal junto al destino, que luego se renombra).
+
+Para que siempre se aplique el renombrado, los directorios de trabajo (cola, subidas)
+cuelgan del mismo STORAGE_DIR que los resultados: en Docker, del volumen /app/storage.
+
+Cada resultado o subida vive en <base>/<2 primeros caracteres del file_id>/<file_id>/: con
+file_id aleatorios, 256 subdirectorios repartidos por igual en lugar de un directorio plano
+con miles de entradas.
+
+Subidas y resultados se guardan además por contenido (SHA-256) en ContentStore: cada
+contenido distinto existe una sola vez en blobs/ y las rutas visibles
+(<file_id>/<nombre>) son enlaces duros a él, con un recuento de referencias en SQLite.
+"""
+import os, json, time, uuid, errno, shutil, sqlite3, hashlib, logging, threading
+from pathlib import Path
+from typing import Dict, Any, Optional, List
+
+logger = logging.getLogger("file-store")
+
+def place_file(src, dest) -> Path:
+    """Mueve `src` a `dest` de forma atómica; copia solo si están en dispositivos distintos"""
+    src, dest = Path(src), Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.replace(src, dest)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        logger.warning(f"{src.parent} y {dest.parent} están en dispositivos distintos: se copia el archivo")
+        partial = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}.partial")
+        try:
+            shutil.copy2(src, partial)
+            os.replace(partial, dest)
+        finally:
+            if partial.exists():
+                partial.unlink()
+        src.unlink()
+    return dest
+
+def shard_dir(base_dir, file_id: str) -> Path:
+    """Directorio de un file_id: <base_dir>/<file_id[:2]>/<file_id>"""
+    return Path(base_dir) / file_id[:2] / file_id
+
+def stored_path(base_dir, file_id: str, filename: str) -> Path:
+    """Ruta de un archivo almacenado; admite la disposición plana anterior (<base_dir>/<file_id>)"""
+    path = shard_dir(base_dir, file_id) / filename
+    legacy = Path(base_dir) / file_id / filename
+    return legacy if not path.exists() and legacy.exists() else path
+
+def new_storage_path(storage_dir, filename: str) -> Path:
+    """Ruta definitiva de un archivo nuevo: <storage_dir>/<shard>/<file_id>/<nombre>"""
+    dest_dir = shard_dir(storage_dir, str(uuid.uuid4()))
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    return dest_dir / filename
+
+def store_result(src, storage_dir, filename=None) -> str:
+    """Mueve un resultado al almacenamiento (deduplicado por contenido) y devuelve su file_id"""
+    dest = new_storage_path(storage_dir, filename or Path(src).name)
+    ContentStore.shared().store(src, dest)
+    return dest.parent.name
+
+# Almacenamiento por contenido
+
+CONTENT_DIR = Path(os.environ.get("CONTENT_STORE_DIR", Path(os.environ.get("STORAGE_DIR", "./storage")) / "blobs"))
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def result_key(input_hash: str, operation: str, params: Dict[str, Any]) -> str:
+    """Clave de un resultado reutilizable: mismo contenido, operación y parámetros"""
+    return hashlib.sha256(json.dumps([input_hash, operation, params], sort_keys=True).encode()).hexdigest()
+
+class ContentStore:
+    """
+    Blobs por SHA-256 con referencias contadas; compartido por todo el proceso.
+
+    Un blob se borra cuando desaparece su última referencia. Los resultados de cada
+    (contenido de entrada, operación, parámetros) se recuerdan para no repetir el trabajo.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, base_dir):
+        self.base_dir = Path(base_dir)
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.base_dir / "content.db"
+        self._local = threading.local()
+        # Serializa altas y bajas de referencias frente al borrado del blob
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    hash TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS refs (
+                    path TEXT PRIMARY KEY,
+                    hash TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS refs_by_hash ON refs (hash)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    files TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+
+    @classmethod
+    def shared(cls):
+        """Devuelve la instancia del proceso, creándola la primera vez"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(CONTENT_DIR)
+            return cls._instance
+
+    def _connect(self):
+        """Conexión propia de cada hilo; WAL permite lectores y escritores simultáneos"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def blob_path(self, digest: str) -> Path:
+        return self.base_dir / digest[:2] / digest[2:4] / digest
+
+    def store(self, src, dest, digest: Optional[str] = None) -> str:
+        """
+        Guarda `src` por contenido y deja en `dest` (puede ser la misma ruta) un enlace al
+        blob. `src` deja de existir: o pasa a ser el blob, o se descarta por duplicado.
+        """
+        src, dest = Path(src), Path(dest)
+        digest = digest or file_sha256(src)
+        blob = self.blob_path(digest)
+        size = src.stat().st_size
+        with self._lock:
+            if blob.exists():
+                src.unlink()
+                logger.info(f"Contenido ya almacenado ({size / 1024 / 1024:.1f} MB no duplicados): {digest[:12]}")
+            else:
+                place_file(src, blob)
+                os.chmod(blob, 0o444)
+            now = time.time()
+            with self._connect() as conn:
+                conn.execute("INSERT OR IGNORE INTO blobs VALUES (?, ?, ?, ?)", (digest, size, now, now))
+            self._link(digest, dest)
+        return digest
+
+    def link(self, digest: str, dest) -> Optional[Path]:
+        """Nueva referencia a un blob existente; None si el blob ya no está"""
+        with self._lock:
+            if not self.blob_path(digest).exists():
+                return None
+            return self._link(digest, Path(dest))
+
+    def _link(self, digest: str, dest: Path) -> Path:
+        dest = Path(os.path.abspath(dest))
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if dest.exists():
+            dest.unlink()
+        try:
+            os.link(self.blob_path(digest), dest)
+        except OSError as e:
+            # Sin enlaces duros (otro dispositivo, sistema de archivos sin soporte): copia
+            logger.warning(f"No se pudo enlazar {dest.name} ({e}); se copia")
+            shutil.copy2(self.blob_path(digest), dest)
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO refs VALUES (?, ?)", (str(dest), digest))
+            conn.execute("UPDATE blobs SET last_access = ? WHERE hash = ?", (time.time(), digest))
+        return dest
+
+    def release(self, path) -> int:
+        """
+        Borra una referencia; el blob se elimina al quedarse sin ninguna. Devuelve los bytes
+        liberados: el tamaño del blob si era la última referencia, el del archivo si no
+        estaba registrado, 0 si solo desaparece un enlace.
+        """
+        path = Path(os.path.abspath(path))
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT hash FROM refs WHERE path = ?", (str(path),)).fetchone()
+            freed = 0
+            if path.exists():
+                if row is None:
+                    freed = path.stat().st_size
+                path.unlink()
+            if row is None:
+                return freed
+            digest = row["hash"]
+            with conn:
+                conn.execute("DELETE FROM refs WHERE path = ?", (str(path),))
+                remaining = conn.execute("SELECT COUNT(*) FROM refs WHERE hash = ?", (digest,)).fetchone()[0]
+                if remaining == 0:
+                    conn.execute("DELETE FROM blobs WHERE hash = ?", (digest,))
+            if remaining == 0:
+                freed = self._unlink_blob(digest)
+        return freed
+
+    def _unlink_blob(self, digest: str) -> int:
+        blob = self.blob_path(digest)
+        if not blob.exists():
+            return 0
+        size = blob.stat().st_size
+        blob.unlink()
+        return size
+
+    def touch(self, digest: str):
+        """Marca un blob como usado ahora (orden de desalojo LRU)"""
+        with self._connect() as conn:
+            conn.execute("UPDATE blobs SET last_access = ? WHERE hash = ?", (time.time(), digest))
+
+    def evict(self, digest: str) -> int:
+        """Borra un blob con todas sus referencias; devuelve los bytes liberados"""
+        with self._lock:
+            conn = self._connect()
+            paths = [row["path"] for row in conn.execute("SELECT path FROM refs WHERE hash = ?", (digest,))]
+            for path in paths:
+                if os.path.exists(path):
+                    os.unlink(path)
+            with conn:
+                conn.execute("DELETE FROM refs WHERE hash = ?", (digest,))
+                conn.execute("DELETE FROM blobs WHERE hash = ?", (digest,))
+            return self._unlink_blob(digest)
+
+    def lru_blobs(self) -> List[Dict[str, Any]]:
+        """Blobs del menos al más recientemente usado"""
+        rows = self._connect().execute("SELECT hash, size, last_access FROM blobs ORDER BY last_access")
+        return [dict(row) for row in rows]
+
+    def reconcile(self, min_age: float) -> Dict[str, int]:
+        """
+        Repara el almacén tras borrados externos o caídas: quita las referencias cuya ruta ya
+        no existe (con sus blobs si se quedan sin ninguna) y borra los blobs del disco que no
+        figuran en la base de datos y tienen más de `min_age` segundos.
+        """
+        conn = self._connect()
+        freed = files = 0
+        dangling = [row["path"] for row in conn.execute("SELECT path FROM refs") if not os.path.exists(row["path"])]
+        for path in dangling:
+            freed += self.release(path)
+            files += 1
+
+        with self._lock:
+            known = {row["hash"] for row in conn.execute("SELECT hash FROM blobs")}
+            referenced = {row["hash"] for row in conn.execute("SELECT DISTINCT hash FROM refs")}
+            # Registrados sin referencias (caída entre el alta del blob y la del enlace)
+            for digest in known - referenced:
+                with conn:
+                    conn.execute("DELETE FROM blobs WHERE hash = ?", (digest,))
+                freed += self._unlink_blob(digest)
+                files += 1
+            limit = time.time() - min_age
+            for blob in self.base_dir.glob("??/??/*"):
+                if blob.name not in known and blob.stat().st_mtime < limit:
+                    freed += blob.stat().st_size
+                    blob.unlink()
+                    files += 1
+        return {"files": files, "bytes": freed}
+
+    def refcount(self, digest: str) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM refs WHERE hash = ?", (digest,)).fetchone()[0]
+
+    def hash_of(self, path) -> Optional[str]:
+        row = self._connect().execute("SELECT hash FROM refs WHERE path = ?", (os.path.abspath(path),)).fetchone()
+        return row["hash"] if row else None
+
+    # Resultados reutilizables
+
+    def remember(self, key: str, result: Dict[str, Any], files: List[Dict[str, str]]):
+        """Recuerda el resultado de una operación; `files` son [{"sha256", "filename"}] de sus salidas"""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (key, json.dumps(result, ensure_ascii=False), json.dumps(files), time.time())
+            )
+
+    def recall(self, key: str) -> Optional[Dict[str, Any]]:
+        """Resultado recordado cuyos archivos siguen almacenados, o None"""
+        row = self._connect().execute("SELECT result, files FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        files = json.loads(row["files"])
+        if not all(self.blob_path(f["sha256"]).exists() for f in files):
+            with self._connect() as conn:
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            return None
+        return {"result": json.loads(row["result"]), "files": files}
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Progreso de trabajos en tiempo real mediante Server-Sent Events.
+
+Los trabajos publican eventos (desde el bucle de eventos o desde hilos) y cada cliente
+suscrito a /jobs/{job_id}/events los recibe al momento, en lugar de consultar el estado
+periódicamente. El último estado de cada trabajo se conserva para que un cliente que
+se conecta tarde reciba primero la situación actual.
+"""
+import json, time, asyncio, logging, threading
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator
+
+try:
+    from scripts.job_registry import JobRegistry
+except ImportError:
+    from job_registry import JobRegistry
+
+logger = logging.getLogger("job-events")
+
+EVENTS_CONFIG = {
+    # Comentario periódico para que proxies y navegadores no cierren la conexión
+    "keepalive": 15.0,
+    # Tiempo que se conserva el estado de un trabajo terminado para clientes rezagados
+    "retention": 600.0
+}
+TERMINAL_STATES = ("completed", "error")
+
+class JobEvents:
+    """Canal de eventos por trabajo con estado acumulado; seguro entre hilos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state: Dict[str, Dict[str, Any]] = {}
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+
+    def publish(self, job_id: str, event: Dict[str, Any]):
+        """Fusiona el evento en el estado del trabajo y lo envía a los suscriptores"""
+        with self._lock:
+            state = self._state.setdefault(job_id, {"job_id": job_id})
+            state.update(event)
+            state["updated_at"] = time.time()
+            snapshot = dict(state)
+            subscribers = list(self._subscribers.get(job_id, ()))
+            self._prune()
+        for loop, queue in subscribers:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(queue.put_nowait, snapshot)
+
+    def snapshot(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            state = self._state.get(job_id)
+            return dict(state) if state else None
+
+    def _prune(self):
+        """Olvida los trabajos terminados hace tiempo y sin suscriptores"""
+        limit = time.time() - EVENTS_CONFIG["retention"]
+        for job_id in [job_id for job_id, state in self._state.items()
+                       if state.get("status") in TERMINAL_STATES and state["updated_at"] < limit
+                       and not self._subscribers.get(job_id)]:
+            del self._state[job_id]
+
+    async def stream(self, job_id: str) -> AsyncIterator[str]:
+        """Genera los eventos SSE de un trabajo hasta que termina"""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.setdefault(job_id, []).append((loop, queue))
+            current = dict(self._state[job_id]) if job_id in self._state else None
+
+        try:
+            # Sin estado en memoria (trabajo de otro arranque): partir del registro
+            if current is None:
+                current = await asyncio.to_thread(registry_snapshot, job_id)
+            if current:
+                yield format_event(current)
+                if current.get("status") in TERMINAL_STATES:
+                    return
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), EVENTS_CONFIG["keepalive"])
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_event(event)
+                if event.get("status") in TERMINAL_STATES:
+                    return
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(job_id, [])
+                if (loop, queue) in subscribers:
+                    subscribers.remove((loop, queue))
+                if not subscribers:
+                    self._subscribers.pop(job_id, None)
+
+def format_event(event: Dict[str, Any]) -> str:
+    """Serializa un evento en formato SSE; el tipo es el estado del trabajo"""
+    kind = event.get("status", "progress")
+    return f"event: {kind}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+def registry_snapshot(job_id: str) -> Optional[Dict[str, Any]]:
+    """Estado de un trabajo según el registro, con el resultado si ya terminó"""
+    job = JobRegistry.shared().get_job(job_id)
+    if job is None:
+        return None
+    event = {"job_id": job_id, "status": job["status"]}
+    if job["status"] in TERMINAL_STATES and job["result"]:
+        event.update(job["result"])
+        event["status"] = job["status"]
+    return event
+
+EVENTS = JobEvents()
+
+def _on_registry_change(job_id: str, status: str, result: Optional[Dict[str, Any]]):
+    """Publica cada cambio de estado del registro: el resultado llega en el mismo instante en que se guarda"""
+    event = dict(result or {})
+    event["status"] = status
+    if status == "completed":
+        event["progress"] = 100.0
+        event["eta_seconds"] = 0
+    EVENTS.publish(job_id, event)
+
+JobRegistry.add_listener(_on_registry_change)
+
+class ProgressTracker:
+    """
+    Convierte el avance por etapas en eventos con porcentaje global y ETA.
+
+    `weights` reparte el 100 % entre las etapas del trabajo en orden; la ETA se estima
+    con el ritmo observado desde el inicio del trabajo.
+    """
+
+    def __init__(self, job_id: str, weights: Dict[str, float]):
+        self.job_id = job_id
+        self.weights = weights
+        self.started = time.time()
+        self.stage_progress = {stage: 0.0 for stage in weights}
+        self._last_sent = 0.0
+
+    def update(self, stage: str, done: int, total: int, force: bool = False, **fields):
+        self.stage_progress[stage] = min(1.0, done / total) if total else 1.0
+        fraction = sum(self.weights[name] * value for name, value in self.stage_progress.items())
+        fraction /= sum(self.weights.values())
+
+        # Limitar el ritmo de eventos en decks muy grandes (salvo el último de cada etapa)
+        now = time.time()
+        if not force and done < total and now - self._last_sent < 0.2:
+            return
+        self._last_sent = now
+
+        elapsed = now - self.started
+        eta = elapsed * (1 - fraction) / fraction if fraction > 0.01 else None
+        EVENTS.publish(self.job_id, {
+            "status": "processing",
+            "stage": stage,
+            "stage_done": done,
+            "stage_total": total,
+            "progress": round(fraction * 100, 1),
+            "elapsed_seconds": round(elapsed, 1),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            **fields
+        })
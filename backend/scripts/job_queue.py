@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Cola de trabajos persistente (SQLite, modo WAL) con un pool de workers asíncronos.
+
+Los endpoints solo encolan y responden; los workers del proceso recogen los trabajos
+por prioridad y orden de llegada, con un límite de trabajos simultáneos. Un trabajo que
+estaba en curso cuando el proceso se detuvo vuelve a la cola al arrancar.
+
+Pensada para un único proceso de API (como en el contenedor): al arrancar, todo lo que
+figure "en curso" se considera interrumpido.
+"""
+import os, json, time, uuid, shutil, sqlite3, asyncio, logging, threading, inspect
+from pathlib import Path
+from typing import Dict, Any, Optional, Callable, List
+
+logger = logging.getLogger("job-queue")
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+
+QUEUE_CONFIG = {
+    "dir": Path(os.environ.get("JOB_QUEUE_DIR", Path(os.environ.get("STORAGE_DIR", "./storage")) / "queue")),
+    # Trabajos simultáneos en este proceso; limita CPU y memoria ante ráfagas de subidas
+    "workers": max(1, int(os.environ.get("JOB_WORKERS", 2))),
+    # Intentos antes de dar por perdido un trabajo interrumpido varias veces
+    "max_attempts": int(os.environ.get("JOB_MAX_ATTEMPTS", 3)),
+    # Espera máxima entre consultas cuando no llega ningún aviso de trabajo nuevo
+    "poll_interval": 5.0
+}
+
+class JobQueue:
+    """Trabajos pendientes, en curso y terminados; compartida por todo el proceso"""
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, base_dir):
+        self.base_dir = Path(base_dir)
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.base_dir / "jobs.db"
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority DESC, created_at)")
+
+    @classmethod
+    def shared(cls):
+        """Devuelve la instancia del proceso, creándola la primera vez"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(QUEUE_CONFIG["dir"])
+            return cls._instance
+
+    def _connect(self):
+        """Conexión propia de cada hilo; WAL permite lectores y escritores simultáneos"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def workspace(self, job_id: str) -> Path:
+        """Directorio de trabajo persistente del trabajo; sobrevive a un reinicio"""
+        path = self.base_dir / "work" / job_id
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], priority: int = 0, job_id: Optional[str] = None) -> str:
+        """Añade un trabajo a la cola y devuelve su ID"""
+        job_id = job_id or str(uuid.uuid4())
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, payload, priority, status, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                (job_id, kind, json.dumps(payload, ensure_ascii=False), int(priority), time.time())
+            )
+        return job_id
+
+    def claim(self, kinds: List[str]) -> Optional[Dict[str, Any]]:
+        """Toma el siguiente trabajo (mayor prioridad, más antiguo) de los tipos indicados"""
+        if not kinds:
+            return None
+        conn = self._connect()
+        placeholders = ",".join("?" * len(kinds))
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                f"SELECT * FROM jobs WHERE status = 'queued' AND kind IN ({placeholders}) "
+                "ORDER BY priority DESC, created_at LIMIT 1", kinds
+            ).fetchone()
+            if row is None:
+                conn.rollback()
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ? WHERE id = ?",
+                (time.time(), row["id"])
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["attempts"] += 1
+        return job
+
+    def finish(self, job_id: str, error: Optional[str] = None):
+        """Marca un trabajo como terminado (o fallido) y borra su directorio de trabajo"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                ("failed" if error else "done", error, time.time(), job_id)
+            )
+        shutil.rmtree(self.base_dir / "work" / job_id, ignore_errors=True)
+
+    def recover(self):
+        """Devuelve a la cola los trabajos que estaban en curso cuando se detuvo el proceso"""
+        with self._connect() as conn:
+            failed = conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Interrumpido demasiadas veces', finished_at = ? "
+                "WHERE status = 'running' AND attempts >= ?",
+                (time.time(), QUEUE_CONFIG["max_attempts"])
+            ).rowcount
+            requeued = conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'"
+            ).rowcount
+        if requeued or failed:
+            logger.info(f"Cola recuperada: {requeued} trabajos reanudados, {failed} descartados")
+        return requeued, failed
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Estado de un trabajo; si está en cola incluye su posición"""
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT id, kind, priority, status, attempts, error, created_at, started_at, finished_at "
+            "FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        if job["status"] == "queued":
+            job["position"] = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND kind = ? AND "
+                "(priority > ? OR (priority = ? AND created_at < ?))",
+                (job["kind"], job["priority"], job["priority"], job["created_at"])
+            ).fetchone()[0] + 1
+        return job
+
+    def prune(self, before: float) -> int:
+        """Borra los trabajos terminados antes de `before`; devuelve cuántos"""
+        with self._connect() as conn:
+            return conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (before,)
+            ).rowcount
+
+    def is_active(self, job_id: str) -> bool:
+        row = self._connect().execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is not None and row["status"] in ("queued", "running")
+
+    def stats(self) -> Dict[str, Any]:
+        """Número de trabajos por tipo y estado"""
+        rows = self._connect().execute("SELECT kind, status, COUNT(*) FROM jobs GROUP BY kind, status").fetchall()
+        result: Dict[str, Dict[str, int]] = {}
+        for kind, status, count in rows:
+            result.setdefault(kind, {})[status] = count
+        return result
+
+# Funciones que ejecutan cada tipo de trabajo; reciben el payload como argumentos con nombre
+_HANDLERS: Dict[str, Callable] = {}
+
+def register_handler(kind: str, handler: Callable):
+    """Registra la función de un tipo de trabajo (corrutina, o función síncrona que irá a un hilo)"""
+    _HANDLERS[kind] = handler
+
+class WorkerPool:
+    """Workers asíncronos del proceso que consumen la cola"""
+
+    def __init__(self, queue: JobQueue, workers: int):
+        self.queue = queue
+        self.workers = workers
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop = None
+        self.running: Dict[str, str] = {}
+
+    async def start(self):
+        """Arranca los workers en el bucle actual (idempotente)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # Marcar antes de esperar: un segundo start() concurrente no repite la recuperación
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        await asyncio.to_thread(self.queue.recover)
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        logger.info(f"Cola de trabajos iniciada con {self.workers} workers ({', '.join(_HANDLERS)})")
+
+    async def stop(self):
+        """Detiene los workers; los trabajos en curso se reanudarán en el próximo arranque"""
+        tasks, self._tasks, self._loop = self._tasks, [], None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def wake(self):
+        """Avisa a los workers de que hay trabajo nuevo (seguro desde cualquier hilo)"""
+        if self._loop and self._wakeup and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _worker(self, number: int):
+        while True:
+            # Limpiar antes de consultar: un aviso que llegue durante claim() no se pierde
+            self._wakeup.clear()
+            job = await asyncio.to_thread(self.queue.claim, list(_HANDLERS))
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), QUEUE_CONFIG["poll_interval"])
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Los demás workers pueden quedar esperando: comprobar si queda más trabajo
+            self._wakeup.set()
+            await self._run(job)
+
+    async def _run(self, job: Dict[str, Any]):
+        job_id, kind = job["id"], job["kind"]
+        handler = _HANDLERS[kind]
+        self.running[job_id] = kind
+        logger.info(f"Ejecutando trabajo {kind} {job_id} (intento {job['attempts']})")
+        try:
+            if inspect.iscoroutinefunction(handler):
+                await handler(**job["payload"])
+            else:
+                await asyncio.to_thread(handler, **job["payload"])
+        except asyncio.CancelledError:
+            # Apagado: el trabajo queda "running" y recover() lo devolverá a la cola
+            raise
+        except Exception as e:
+            logger.error(f"Trabajo {kind} {job_id} fallido: {e}", exc_info=True)
+            await asyncio.to_thread(self.queue.finish, job_id, str(e) or type(e).__name__)
+        else:
+            await asyncio.to_thread(self.queue.finish, job_id)
+        finally:
+            self.running.pop(job_id, None)
+
+_POOL: Optional[WorkerPool] = None
+
+def worker_pool() -> WorkerPool:
+    global _POOL
+    if _POOL is None:
+        _POOL = WorkerPool(JobQueue.shared(), QUEUE_CONFIG["workers"])
+    return _POOL
+
+async def start_workers():
+    """Arranca los workers (se llama en el evento startup de cada router)"""
+    await worker_pool().start()
+
+async def stop_workers():
+    await worker_pool().stop()
+
+async def submit(kind: str, payload: Dict[str, Any], priority: int = 0, job_id: Optional[str] = None) -> str:
+    """Encola un trabajo sin bloquear el bucle de eventos y despierta a los workers"""
+    pool = worker_pool()
+    job_id = await asyncio.to_thread(pool.queue.enqueue, kind, payload, priority, job_id)
+    # Por si la aplicación no emitió startup (p. ej. API independiente de un script)
+    await pool.start()
+    pool.wake()
+    return job_id
+
+def queue_stats() -> Dict[str, Any]:
+    pool = worker_pool()
+    return {
+        "workers": pool.workers,
+        "running": len(pool.running),
+        "jobs": pool.queue.stats()
+    }
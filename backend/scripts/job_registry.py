@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Registro de archivos subidos y trabajos (traducción, división, autofit) en SQLite.
+
+Sustituye a los ficheros {file_id}_meta.json, {file_id}_processing_{job_id}.json y
+{job_id}_result.json: las consultas por job_id o file_id son búsquedas por índice y los
+cambios de estado son UPDATE condicionados al estado actual, así dos peticiones no
+pueden pasar el mismo trabajo a estados distintos.
+"""
+import os, json, time, sqlite3, logging, threading
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple, List, Callable
+
+logger = logging.getLogger("job-registry")
+
+REGISTRY_DB = Path(os.environ.get("JOB_REGISTRY_DB", Path(os.environ.get("STORAGE_DIR", "./storage")) / "registry.db"))
+
+# Estados activos: como mucho un trabajo activo de cada tipo por archivo
+ACTIVE_STATES = ("queued", "processing")
+# Estados desde los que se puede llegar a cada uno; completed y error son finales
+TRANSITIONS = {
+    "processing": ("queued", "processing"),
+    "completed": ("queued", "processing"),
+    "error": ("queued", "processing"),
+}
+
+class JobRegistry:
+    """Archivos y trabajos con búsqueda O(1) por ID; compartido por todo el proceso"""
+
+    _instance = None
+    _instance_lock = threading.Lock()
+    # Funciones (job_id, status, result) avisadas tras cada cambio de estado confirmado
+    _listeners: List[Callable[[str, str, Optional[Dict[str, Any]]], None]] = []
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    file_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    original_name TEXT,
+                    path TEXT NOT NULL,
+                    meta TEXT NOT NULL DEFAULT '{}',
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    file_id TEXT,
+                    status TEXT NOT NULL,
+                    data TEXT NOT NULL DEFAULT '{}',
+                    result TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_by_file ON jobs (file_id)")
+            # Garantiza en la propia base de datos un único trabajo activo por archivo y tipo
+            conn.execute(f"""
+                CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_per_file ON jobs (file_id, kind)
+                WHERE file_id IS NOT NULL AND status IN {ACTIVE_STATES}
+            """)
+
+    @classmethod
+    def shared(cls):
+        """Devuelve la instancia del proceso, creándola la primera vez"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(REGISTRY_DB)
+            return cls._instance
+
+    @classmethod
+    def add_listener(cls, listener: Callable[[str, str, Optional[Dict[str, Any]]], None]):
+        """Registra una función que se llama tras crear un trabajo o cambiar su estado"""
+        cls._listeners.append(listener)
+
+    def _notify(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None):
+        for listener in self._listeners:
+            try:
+                listener(job_id, status, result)
+            except Exception as e:
+                logger.warning(f"Error notificando el trabajo {job_id}: {e}")
+
+    def _connect(self):
+        """Conexión propia de cada hilo; WAL permite lectores y escritores simultáneos"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _decode(row, *fields) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        record = dict(row)
+        for field in fields:
+            record[field] = json.loads(record[field]) if record[field] else None
+        return record
+
+    # Archivos subidos
+
+    def register_file(self, file_id: str, kind: str, path, original_name: Optional[str] = None,
+                      meta: Optional[Dict[str, Any]] = None):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                (file_id, kind, original_name, str(path), json.dumps(meta or {}, ensure_ascii=False), time.time())
+            )
+
+    def get_file(self, file_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT * FROM files WHERE file_id = ?", (file_id,)).fetchone()
+        return self._decode(row, "meta")
+
+    def expired_files(self, before: float) -> List[Dict[str, Any]]:
+        """Archivos subidos antes de `before` que no tienen ningún trabajo activo"""
+        rows = self._connect().execute(f"""
+            SELECT * FROM files WHERE created_at < ? AND NOT EXISTS (
+                SELECT 1 FROM jobs WHERE jobs.file_id = files.file_id AND jobs.status IN {ACTIVE_STATES}
+            )
+        """, (before,)).fetchall()
+        return [self._decode(row, "meta") for row in rows]
+
+    def active_file_paths(self) -> List[str]:
+        """Rutas de los archivos con un trabajo en cola o en curso"""
+        rows = self._connect().execute(f"""
+            SELECT DISTINCT files.path FROM files JOIN jobs ON jobs.file_id = files.file_id
+            WHERE jobs.status IN {ACTIVE_STATES}
+        """).fetchall()
+        return [row["path"] for row in rows]
+
+    def forget_file(self, file_id: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
+
+    # Trabajos
+
+    def create_job(self, job_id: str, kind: str, file_id: Optional[str] = None,
+                   data: Optional[Dict[str, Any]] = None, status: str = "queued") -> Tuple[Dict[str, Any], bool]:
+        """
+        Registra un trabajo nuevo. Si el archivo ya tiene uno activo del mismo tipo no se crea
+        otro: devuelve (trabajo existente, False).
+        """
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO jobs (job_id, kind, file_id, status, data, created_at, started_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, kind, file_id, status, json.dumps(data or {}, ensure_ascii=False), time.time(),
+                     time.time() if status == "processing" else None)
+                )
+            self._notify(job_id, status)
+            return self.get_job(job_id), True
+        except sqlite3.IntegrityError:
+            existing = self.active_job(file_id, kind)
+            if existing is None:
+                raise
+            return existing, False
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._decode(row, "data", "result")
+
+    def active_job(self, file_id: str, kind: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            f"SELECT * FROM jobs WHERE file_id = ? AND kind = ? AND status IN {ACTIVE_STATES}", (file_id, kind)
+        ).fetchone()
+        return self._decode(row, "data", "result")
+
+    def prune_jobs(self, before: float) -> int:
+        """Borra los trabajos terminados antes de `before`; devuelve cuántos"""
+        with self._connect() as conn:
+            return conn.execute(
+                f"DELETE FROM jobs WHERE status NOT IN {ACTIVE_STATES} AND finished_at < ?", (before,)
+            ).rowcount
+
+    def report(self, job_id: str, partial: Dict[str, Any]) -> bool:
+        """Guarda un resultado parcial de un trabajo en curso (p. ej. las partes ya escritas)"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET result = ? WHERE job_id = ? AND status = 'processing'",
+                (json.dumps(partial, ensure_ascii=False), job_id)
+            )
+        if cursor.rowcount == 0:
+            return False
+        self._notify(job_id, "processing", partial)
+        return True
+
+    def transition(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None) -> bool:
+        """Cambia el estado solo si el actual lo permite; devuelve si se aplicó"""
+        allowed = TRANSITIONS[status]
+        now = time.time()
+        with self._connect() as conn:
+            if status == "processing":
+                cursor = conn.execute(
+                    f"UPDATE jobs SET status = ?, started_at = ? WHERE job_id = ? AND status IN {allowed}",
+                    (status, now, job_id)
+                )
+            else:
+                cursor = conn.execute(
+                    f"UPDATE jobs SET status = ?, result = ?, finished_at = ? WHERE job_id = ? AND status IN {allowed}",
+                    (status, json.dumps(result, ensure_ascii=False) if result is not None else None, now, job_id)
+                )
+        if cursor.rowcount == 0:
+            logger.warning(f"Transición ignorada: trabajo {job_id} -> {status}")
+            return False
+        self._notify(job_id, status, result)
+        return True
@@ -0,0 +1,752 @@
+#!/usr/bin/env python3
+"""
+Utilidades para reescribir paquetes PPTX (ZIP) sin descomprimirlos en disco.
+
+Los miembros que no cambian (imágenes, vídeos, fuentes...) se copian tal cual,
+con sus bytes ya comprimidos, de un ZIP a otro; solo se comprimen de nuevo las
+partes XML modificadas.
+"""
+import os, io, re, zipfile, struct, logging, posixpath, threading, multiprocessing
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Callable, Union, List, Tuple, Any
+from urllib.parse import unquote
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import unescape
+
+logger = logging.getLogger("pptx-package")
+
+COPY_CHUNK_SIZE = 1024 * 1024
+# Procesos para el trabajo XML por parte (parseo y serialización); 1 desactiva el pool
+PROCESS_WORKERS = max(1, int(os.environ.get("PPTX_WORKERS", os.cpu_count() or 1)))
+# Con pocas partes el coste de enviar trabajo a otro proceso supera la ganancia
+PARALLEL_MIN_PARTS = int(os.environ.get("PPTX_PARALLEL_MIN_PARTS", 16))
+NS_A = "http://schemas.openxmlformats.org/drawingml/2006/main"
+# Cabecera local de ZIP: firma + 26 bytes; longitud del nombre y del campo extra al final
+LOCAL_HEADER_SIZE = 30
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+ZIP64_EXTRA_ID = 0x0001
+FLAG_DATA_DESCRIPTOR = 0x08
+
+def _strip_zip64_extra(extra: bytes) -> bytes:
+    """Quita el campo zip64 del extra; zipfile lo vuelve a añadir si hace falta"""
+    result, i = b"", 0
+    while i + 4 <= len(extra):
+        header_id, size = struct.unpack("<HH", extra[i:i + 4])
+        if header_id != ZIP64_EXTRA_ID:
+            result += extra[i:i + 4 + size]
+        i += 4 + size
+    return result
+
+def copy_member_raw(src_fp, info: zipfile.ZipInfo, dst: zipfile.ZipFile):
+    """Copia un miembro comprimido (leído de `src_fp`) a `dst` sin descomprimirlo ni recomprimirlo"""
+    # Saltar la cabecera local de origen hasta el inicio de los datos comprimidos
+    src_fp.seek(info.header_offset)
+    header = src_fp.read(LOCAL_HEADER_SIZE)
+    if header[:4] != LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Cabecera local inválida para {info.filename}")
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    src_fp.seek(name_length + extra_length, 1)
+
+    # Nueva cabecera local con CRC y tamaños reales: no hace falta descriptor de datos
+    new_info = _clone_info(info)
+    new_info.header_offset = dst.fp.tell()
+    dst.fp.write(new_info.FileHeader())
+
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = src_fp.read(min(COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Datos truncados en {info.filename}")
+        dst.fp.write(chunk)
+        remaining -= len(chunk)
+
+    dst.start_dir = dst.fp.tell()
+    dst.filelist.append(new_info)
+    dst.NameToInfo[new_info.filename] = new_info
+    dst._didModify = True
+
+def _clone_info(info: zipfile.ZipInfo) -> zipfile.ZipInfo:
+    """Copia de un ZipInfo lista para escribirse en otro archivo"""
+    new_info = zipfile.ZipInfo(info.filename, info.date_time)
+    new_info.compress_type = info.compress_type
+    new_info.comment = info.comment
+    new_info.extra = _strip_zip64_extra(info.extra)
+    new_info.create_system = info.create_system
+    new_info.create_version = info.create_version
+    new_info.extract_version = info.extract_version
+    new_info.internal_attr = info.internal_attr
+    new_info.external_attr = info.external_attr
+    new_info.flag_bits = info.flag_bits & ~FLAG_DATA_DESCRIPTOR
+    new_info.CRC = info.CRC
+    new_info.compress_size = info.compress_size
+    new_info.file_size = info.file_size
+    return new_info
+
+def rewrite_package(
+    input_path,
+    output_path,
+    replacements: Dict[str, Union[bytes, Callable[[bytes], bytes]]],
+    skip: Iterable[str] = (),
+    extra_members: Optional[Dict[str, bytes]] = None
+) -> Dict[str, int]:
+    """
+    Escribe `output_path` a partir de `input_path` en una sola pasada.
+
+    - `replacements`: nombre de miembro -> contenido nuevo (se comprime con DEFLATE), o una
+      función que recibe el contenido original y devuelve el nuevo; se llama justo al
+      escribir ese miembro, así solo hay una parte en memoria a la vez
+    - `skip`: miembros que no se copian
+    - `extra_members`: miembros nuevos que se añaden al final
+
+    El resto de miembros se copia en bruto conservando orden y compresión.
+    Devuelve cuántos miembros se copiaron y cuántos se reescribieron.
+    """
+    skip = set(skip)
+    stats = {"copied": 0, "rewritten": 0, "skipped": 0, "copied_bytes": 0}
+
+    with zipfile.ZipFile(input_path, "r") as src, \
+         open(input_path, "rb") as src_fp, \
+         zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as dst:
+        for info in src.infolist():
+            if info.filename in skip:
+                stats["skipped"] += 1
+            elif info.filename in replacements:
+                new_info = zipfile.ZipInfo(info.filename, info.date_time)
+                new_info.compress_type = zipfile.ZIP_DEFLATED
+                new_info.external_attr = info.external_attr
+                data = replacements[info.filename]
+                if callable(data):
+                    data = data(src.read(info))
+                dst.writestr(new_info, data)
+                stats["rewritten"] += 1
+            else:
+                copy_member_raw(src_fp, info, dst)
+                stats["copied"] += 1
+                stats["copied_bytes"] += info.compress_size
+
+        for name, data in (extra_members or {}).items():
+            dst.writestr(name, data)
+            stats["rewritten"] += 1
+
+    logger.debug(f"Paquete reescrito: {stats}")
+    return stats
+
+def read_members(input_path, names: Iterable[str]) -> Dict[str, bytes]:
+    """Lee solo los miembros indicados, sin extraer el resto del paquete"""
+    with zipfile.ZipFile(input_path, "r") as zf:
+        return {name: zf.read(name) for name in names}
+
+def list_members(input_path, predicate: Optional[Callable[[str], bool]] = None):
+    """Nombres de los miembros del paquete, filtrados opcionalmente"""
+    with zipfile.ZipFile(input_path, "r") as zf:
+        names = zf.namelist()
+    return [n for n in names if predicate is None or predicate(n)]
+
+# Pool de procesos compartido por todos los trabajos
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+def process_pool() -> ProcessPoolExecutor:
+    """Pool de procesos del proceso actual; se crea una vez y se reutiliza entre trabajos"""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            # spawn: los workers no heredan hilos ni el bucle de eventos del servidor
+            _POOL = ProcessPoolExecutor(
+                max_workers=PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker
+            )
+            logger.info(f"Pool de procesos XML iniciado con {PROCESS_WORKERS} workers")
+        return _POOL
+
+def _discard_pool(pool):
+    """Descarta un pool roto para que el siguiente trabajo cree uno nuevo"""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is pool:
+            _POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def map_ordered(fn: Callable, items: Iterable[Tuple]) -> Iterable[Any]:
+    """
+    Aplica `fn(*args)` a cada elemento y devuelve los resultados en el orden de entrada.
+
+    Con varias partes se reparte en el pool de procesos con una ventana acotada de
+    tareas en vuelo, para que la memoria no dependa del tamaño del paquete.
+    """
+    items = list(items)
+    if PROCESS_WORKERS <= 1 or len(items) < PARALLEL_MIN_PARTS:
+        with open_packages():
+            for args in items:
+                yield fn(*args)
+        return
+
+    pool = process_pool()
+    remaining = iter(items)
+    try:
+        pending = deque(pool.submit(fn, *args) for args in islice(remaining, PROCESS_WORKERS * 2))
+        while pending:
+            result = pending.popleft().result()
+            args = next(remaining, None)
+            if args is not None:
+                pending.append(pool.submit(fn, *args))
+            yield result
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
+
+def map_unordered(fn: Callable, items: Iterable[Tuple], min_parallel: int = PARALLEL_MIN_PARTS) -> Iterable[Tuple[int, Any]]:
+    """
+    Como map_ordered, pero devuelve (posición, resultado) según va terminando cada tarea.
+
+    Para tareas pesadas e independientes (p. ej. escribir una parte de una presentación)
+    en las que interesa usar cada resultado en cuanto está listo.
+    """
+    items = list(items)
+    if PROCESS_WORKERS <= 1 or len(items) < max(2, min_parallel):
+        with open_packages():
+            for index, args in enumerate(items):
+                yield index, fn(*args)
+        return
+
+    pool = process_pool()
+    remaining = iter(enumerate(items))
+    pending = {}
+    try:
+        for index, args in islice(remaining, PROCESS_WORKERS):
+            pending[pool.submit(fn, *args)] = index
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                following = next(remaining, None)
+                if following is not None:
+                    pending[pool.submit(fn, *following[1])] = following[0]
+                yield index, future.result()
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
+    finally:
+        # Si quien consume el generador se detiene (p. ej. por un error), no dejar trabajo en vuelo
+        for future in pending:
+            future.cancel()
+
+def submit_to_pool(fn: Callable, *args) -> Optional[Future]:
+    """
+    Envía una sola tarea al pool de procesos, para quien decide cuándo está lista cada parte.
+
+    Devuelve None si el pool está desactivado o roto: el llamador ejecuta `fn` él mismo.
+    """
+    if PROCESS_WORKERS <= 1:
+        return None
+    pool = process_pool()
+    try:
+        return pool.submit(fn, *args)
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        return None
+
+# Paquetes abiertos por read_member, por hilo. Solo existe en los procesos del pool (el
+# último paquete leído, para no releer el directorio central en cada parte) y, en el
+# proceso principal, dentro de un bloque open_packages(): nunca se comparte entre hilos
+_LOCAL = threading.local()
+
+def _init_worker():
+    """Inicializador de los procesos del pool"""
+    _LOCAL.packages = {}
+    _LOCAL.worker = True
+
+@contextmanager
+def open_packages():
+    """Mantiene abiertos en este hilo, hasta salir del bloque, los paquetes que lea read_member"""
+    if getattr(_LOCAL, "packages", None) is not None:
+        yield
+        return
+    packages = _LOCAL.packages = {}
+    try:
+        yield
+    finally:
+        # Un generador abandonado puede cerrarse desde otro hilo: solo se limpia el propio
+        if getattr(_LOCAL, "packages", None) is packages:
+            _LOCAL.packages = None
+        for package in packages.values():
+            package.close()
+
+def read_member(input_path, name: str) -> bytes:
+    """Lee un miembro del paquete; reutiliza el ZipFile abierto del hilo si lo hay"""
+    packages = getattr(_LOCAL, "packages", None)
+    if packages is None:
+        with zipfile.ZipFile(input_path, "r") as zf:
+            return zf.read(name)
+    stat = os.stat(input_path)
+    key = (str(input_path), stat.st_mtime_ns, stat.st_size)
+    package = packages.get(key)
+    if package is None:
+        # En el pool solo se conserva el último paquete; en un bloque, todos los que se lean
+        if getattr(_LOCAL, "worker", False):
+            for stale in packages.values():
+                stale.close()
+            packages.clear()
+        package = packages[key] = zipfile.ZipFile(input_path, "r")
+    return package.read(name)
+
+# Texto DrawingML (a:p / a:t): funciones de módulo para poder ejecutarse en el pool
+
+def extract_part_texts(input_path, name: str) -> Tuple[str, List[Tuple[str, Tuple]]]:
+    """
+    Extrae los párrafos con texto de una parte XML en streaming (iterparse).
+
+    Devuelve (nombre, [(texto completo, runs)]) donde cada run es (posición del a:t
+    en el documento, longitud, termina en espacio). No se conserva ningún árbol.
+    """
+    tag_p, tag_t = f"{{{NS_A}}}p", f"{{{NS_A}}}t"
+    paragraphs = []
+    paragraph_runs = []
+    t_index = 0
+    for _, elem in ET.iterparse(io.BytesIO(read_member(input_path, name)), events=("end",)):
+        if elem.tag == tag_t:
+            if elem.text and elem.text.strip():
+                paragraph_runs.append((t_index, elem.text.strip(), elem.text.endswith(" ")))
+            t_index += 1
+        elif elem.tag == tag_p:
+            full_text = "".join(text + (" " if has_space else "")
+                                for _, text, has_space in paragraph_runs).strip()
+            if full_text:
+                paragraphs.append((full_text, tuple(
+                    (index, len(text), has_space) for index, text, has_space in paragraph_runs
+                )))
+            paragraph_runs = []
+            # El párrafo ya está registrado: liberar su subárbol
+            elem.clear()
+    return name, paragraphs
+
+def apply_part_translations(input_path, name: str, paragraphs: List[Tuple], updates: Dict[int, str]) -> bytes:
+    """Vuelve a parsear una parte, aplica las traducciones {nº de párrafo: texto} y devuelve su XML"""
+    # Registrar los prefijos del documento para que la serialización los conserve
+    events = ET.iterparse(io.BytesIO(read_member(input_path, name)), events=("start-ns",))
+    for _, (prefix, uri) in events:
+        if not prefix:
+            continue
+        try:
+            ET.register_namespace(prefix, uri)
+        except ValueError:
+            pass
+    root = events.root
+    text_elements = list(root.iter(f"{{{NS_A}}}t"))
+
+    for paragraph_no, translated in updates.items():
+        runs = paragraphs[paragraph_no]
+        if len(runs) == 1:
+            text_elements[runs[0][0]].text = translated
+        else:
+            distribute_translation({
+                "runs": [{"element": text_elements[index], "length": length, "has_space": has_space}
+                         for index, length, has_space in runs],
+                "total_length": sum(length for _, length, _ in runs)
+            }, translated)
+
+    xml_string = ET.tostring(root, encoding='UTF-8', method='xml')
+    if not xml_string.startswith(b'<?xml'):
+        xml_string = b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n' + xml_string
+    return xml_string
+
+def distribute_translation(paragraph, translated):
+    """Distribuye el texto traducido entre múltiples runs"""
+    words = translated.split()
+    runs = paragraph["runs"]
+    total_length = paragraph["total_length"]
+    assigned_words = 0
+
+    for i, run in enumerate(runs):
+        elem = run["element"]
+        proportion = run["length"] / total_length if total_length > 0 else 0
+        words_for_run = max(1, round(proportion * len(words)))
+        words_for_run = min(words_for_run, len(words) - assigned_words)
+
+        if words_for_run <= 0:
+            continue
+
+        segment = words[assigned_words:assigned_words + words_for_run]
+        partial_text = " ".join(segment)
+
+        if i == len(runs) - 1 and assigned_words + words_for_run < len(words):
+            remaining = words[assigned_words + words_for_run:]
+            partial_text += " " + " ".join(remaining)
+
+        if run.get("has_space", False) or i < len(runs) - 1:
+            partial_text += " "
+
+        elem.text = partial_text
+        assigned_words += words_for_run
+
+# División por diapositivas: grafo de relaciones del paquete leído una sola vez
+
+NS_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+RT_OFFICE_DOCUMENT = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+RT_SLIDE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/slide"
+CONTENT_TYPES = "[Content_Types].xml"
+# Elementos vacíos o con hijos, con cualquier prefijo: <p:sldId .../>, <p14:sldId .../>, <p:sld .../>...
+_ATTRIBUTE = re.compile(rb'([\w:.-]+)\s*=\s*"([^"]*)"')
+
+def _element_pattern(local_name: str):
+    return re.compile(
+        rb'<(?P<tag>(?:[\w.-]+:)?' + local_name.encode() + rb')\b(?P<attrs>[^>]*?)(?:/>|>.*?</(?P=tag)\s*>)',
+        re.S
+    )
+
+_SLD_ID = _element_pattern("sldId")
+_SLD = _element_pattern("sld")
+_RELATIONSHIP = _element_pattern("Relationship")
+_OVERRIDE = _element_pattern("Override")
+
+def _attributes(match) -> Dict[str, str]:
+    return {name.decode(): unescape(value.decode(), {"&quot;": '"', "&apos;": "'"})
+            for name, value in _ATTRIBUTE.findall(match.group("attrs"))}
+
+def _relationship_id(attrs: Dict[str, str]) -> Optional[str]:
+    """Valor de r:id sea cual sea el prefijo del espacio de relaciones"""
+    return next((value for name, value in attrs.items() if name.endswith(":id")), None)
+
+def _drop_elements(xml: bytes, pattern, drop: Callable[[Dict[str, str]], bool]) -> bytes:
+    """Quita del XML los elementos que cumplen `drop`, sin reserializar el resto del documento"""
+    return pattern.sub(lambda match: b"" if drop(_attributes(match)) else match.group(0), xml)
+
+# Referencias a relaciones dentro de una parte: r:id="rId3" con cualquier prefijo
+_RELATIONSHIP_REFERENCE = re.compile(rb'(\s[\w.-]+:id\s*=\s*")([^"]*)(")')
+
+def _clear_references(xml: bytes, rel_ids: set) -> bytes:
+    """Deja vacías (r:id="", como escribe PowerPoint en acciones sin destino) las referencias a `rel_ids`"""
+    rel_ids = {rel_id.encode() for rel_id in rel_ids}
+    return _RELATIONSHIP_REFERENCE.sub(
+        lambda match: match.group(1) + match.group(3) if match.group(2) in rel_ids else match.group(0), xml
+    )
+
+def rels_name(part: str) -> str:
+    """Miembro .rels de una parte ("" es la raíz del paquete)"""
+    directory, name = posixpath.split(part)
+    return posixpath.join(directory, "_rels", name + ".rels")
+
+def _source_part(rels: str) -> str:
+    directory, name = posixpath.split(rels)
+    return posixpath.join(posixpath.dirname(directory), name[:-len(".rels")])
+
+class SlidePackage:
+    """
+    Relaciones internas de un PPTX, leídas una sola vez, para escribir presentaciones con
+    un subconjunto de sus diapositivas.
+
+    Cada parte resultante contiene solo lo alcanzable desde la raíz del paquete sin las
+    diapositivas excluidas (sus notas, imágenes y vídeos propios desaparecen; diseños y
+    patrones se mantienen). Los vínculos entre diapositivas no cuentan para el alcance: un
+    hipervínculo a una diapositiva excluida se elimina en vez de arrastrarla con sus
+    dependencias. Las partes conservadas se copian comprimidas tal cual; solo se reescriben
+    presentation.xml, sus relaciones, [Content_Types].xml y las diapositivas con vínculos
+    eliminados.
+    """
+
+    def __init__(self, input_path):
+        self.input_path = Path(input_path)
+        with zipfile.ZipFile(self.input_path, "r") as zf:
+            self.names = zf.namelist()
+            # Los nombres de parte OPC no distinguen mayúsculas
+            self._by_lower = {name.lower(): name for name in self.names}
+            self.relations: Dict[str, List[Tuple[str, str, str]]] = {}
+            for name in self.names:
+                if name.endswith(".rels") and (name.startswith("_rels/") or "/_rels/" in name):
+                    self.relations[_source_part(name)] = self._parse_rels(name, zf.read(name))
+
+            self.presentation = next(
+                (target for _, rel_type, target in self.relations.get("", ()) if rel_type == RT_OFFICE_DOCUMENT),
+                "ppt/presentation.xml"
+            )
+            self.presentation_rels = rels_name(self.presentation)
+            self.presentation_xml = zf.read(self.presentation)
+            self.presentation_rels_xml = zf.read(self.presentation_rels)
+            self.content_types_xml = zf.read(CONTENT_TYPES)
+
+        # Diapositivas en orden de presentación: (id de diapositiva, rId)
+        targets = {rel_id: target for rel_id, rel_type, target in self.relations.get(self.presentation, ())
+                   if rel_type == RT_SLIDE}
+        self.slides = []
+        for match in _SLD_ID.finditer(self.presentation_xml):
+            attrs = _attributes(match)
+            rel_id = _relationship_id(attrs)
+            if rel_id in targets:
+                self.slides.append((attrs.get("id"), rel_id))
+
+    def _parse_rels(self, rels: str, xml: bytes) -> List[Tuple[str, str, str]]:
+        """Relaciones internas de un .rels como (rId, tipo, miembro destino)"""
+        source = _source_part(rels)
+        relations = []
+        for match in _RELATIONSHIP.finditer(xml):
+            attrs = _attributes(match)
+            if attrs.get("TargetMode") == "External" or "Target" not in attrs:
+                continue
+            target = unquote(attrs["Target"])
+            if target.startswith("/"):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join(posixpath.dirname(source), target))
+            member = self._by_lower.get(target.lower())
+            if member:
+                relations.append((attrs.get("Id"), attrs.get("Type"), member))
+        return relations
+
+    def _reachable(self, dropped_rels: set) -> set:
+        """Miembros alcanzables desde la raíz sin seguir las relaciones descartadas de presentation.xml"""
+        keep = {CONTENT_TYPES}
+        pending = [""]
+        while pending:
+            part = pending.pop()
+            if part:
+                keep.add(part)
+            if part in self.relations:
+                keep.add(rels_name(part))
+            for rel_id, rel_type, target in self.relations.get(part, ()):
+                if part == self.presentation and rel_id in dropped_rels:
+                    continue
+                # Solo presentation.xml decide qué diapositivas entran
+                if rel_type == RT_SLIDE and part != self.presentation:
+                    continue
+                if target not in keep:
+                    pending.append(target)
+        return keep
+
+    def write_slides(self, output_path, indices: Iterable[int]) -> Dict[str, int]:
+        """Escribe una presentación solo con las diapositivas de `indices` (base 0, en orden)"""
+        selected = set(indices)
+        dropped = [slide for i, slide in enumerate(self.slides) if i not in selected]
+        dropped_ids = {slide_id for slide_id, _ in dropped}
+        dropped_rels = {rel_id for _, rel_id in dropped}
+        keep = self._reachable(dropped_rels)
+        kept_parts = {"/" + name.lower() for name in keep}
+
+        # p:sldId de la lista y p14:sldId de las secciones comparten el id de diapositiva
+        presentation_xml = _drop_elements(self.presentation_xml, _SLD_ID, lambda a: a.get("id") in dropped_ids)
+        # Presentaciones personalizadas que citaban diapositivas eliminadas
+        presentation_xml = _drop_elements(presentation_xml, _SLD, lambda a: _relationship_id(a) in dropped_rels)
+        replacements = {
+            self.presentation: presentation_xml,
+            self.presentation_rels: _drop_elements(
+                self.presentation_rels_xml, _RELATIONSHIP, lambda a: a.get("Id") in dropped_rels
+            ),
+            CONTENT_TYPES: _drop_elements(
+                self.content_types_xml, _OVERRIDE, lambda a: a.get("PartName", "").lower() not in kept_parts
+            )
+        }
+        # Vínculos a diapositivas que no están en esta presentación (p. ej. hipervínculos)
+        for part in keep:
+            if part == self.presentation:
+                continue
+            broken = {rel_id for rel_id, rel_type, target in self.relations.get(part, ())
+                      if rel_type == RT_SLIDE and target not in keep}
+            if broken:
+                replacements[rels_name(part)] = lambda xml, broken=broken: _drop_elements(
+                    xml, _RELATIONSHIP, lambda a: a.get("Id") in broken
+                )
+                replacements[part] = lambda xml, broken=broken: _clear_references(xml, broken)
+        return rewrite_package(self.input_path, output_path, replacements,
+                               skip=[name for name in self.names if name not in keep])
+
+    def slide_parts(self) -> List[str]:
+        """Miembros de las diapositivas en orden de presentación"""
+        targets = {rel_id: target for rel_id, rel_type, target in self.relations.get(self.presentation, ())
+                   if rel_type == RT_SLIDE}
+        return [targets[rel_id] for _, rel_id in self.slides]
+
+def write_slide_range(package: SlidePackage, output_path, start: int, end: int) -> Dict[str, int]:
+    """Escribe las diapositivas [start, end) de `package`; función de módulo para poder ir al pool"""
+    return package.write_slides(output_path, range(start, end))
+
+# Autofit directo sobre el XML de las diapositivas, sin el modelo de objetos de python-pptx
+
+NS_P = "http://schemas.openxmlformats.org/presentationml/2006/main"
+URI_TABLE = "http://schemas.openxmlformats.org/drawingml/2006/table"
+# Etiquetas de apertura, cierre o vacías; comentarios, instrucciones y CDATA se reconocen para saltarlos
+_TAG = re.compile(
+    rb"<!--.*?-->|<\?.*?\?>|<!\[CDATA\[.*?\]\]>"
+    rb"|<(/?)([^\s/>!?]+)((?:\s+[^\s=/>]+\s*=\s*(?:\"[^\"]*\"|'[^']*'))*)\s*(/?)>",
+    re.S
+)
+_TAG_ATTRIBUTE = re.compile(rb"([^\s=]+)\s*=\s*(?:\"([^\"]*)\"|'([^']*)')")
+# Grupo EG_TextAutofit de a:bodyPr y los elementos que deben ir detrás (esquema DrawingML)
+_AUTOFIT_CHOICES = {"noAutofit", "normAutofit", "spAutoFit"}
+_BODY_PR_SUCCESSORS = {"scene3d", "sp3d", "flatTx", "extLst"}
+
+class _Element:
+    __slots__ = ("uri", "local", "qname", "ns", "role", "open_end", "claimed", "insert_at", "skip_from")
+
+    def __init__(self, uri, local, qname, ns, role, open_end):
+        self.uri, self.local, self.qname, self.ns, self.role = uri, local, qname, ns, role
+        self.open_end = open_end
+        # Papeles únicos ya asignados a un hijo (el primer txBody, bodyPr o tbl)
+        self.claimed = set()
+        # Dónde insertar el elemento nuevo si no hay que ponerlo al final
+        self.insert_at = None
+        self.skip_from = None
+
+def _prefixed(ns: Dict[bytes, str], uri: str, preferred: bytes) -> Tuple[bytes, bytes]:
+    """(prefijo:, declaración) para crear un elemento del espacio `uri` en este punto del documento"""
+    for prefix, value in ns.items():
+        if value == uri:
+            return (prefix + b":" if prefix else b""), b""
+    return preferred + b":", b' xmlns:' + preferred + b'="' + uri.encode() + b'"'
+
+def _new_txbody(ns: Dict[bytes, str], container_uri: str) -> bytes:
+    """txBody nuevo como el que crea python-pptx al acceder a text_frame, ya con normAutofit"""
+    body, body_decl = _prefixed(ns, container_uri, b"p" if container_uri == NS_P else b"a")
+    a, a_decl = _prefixed(ns, NS_A, b"a")
+    return (b"<" + body + b"txBody" + body_decl + a_decl + b"><" + a + b"bodyPr><" + a + b"normAutofit/></"
+            + a + b"bodyPr><" + a + b"p/></" + body + b"txBody>")
+
+# (papel del padre, espacio, nombre local) -> papel del hijo; solo hijos directos, como python-pptx
+_ROLES = {
+    ("cSld", NS_P, "spTree"): "spTree",
+    # slide.shapes: hijos directos del árbol; grupos y mc:AlternateContent no se recorren
+    ("spTree", NS_P, "sp"): "shape",
+    ("spTree", NS_P, "graphicFrame"): "frame",
+    ("frame", NS_A, "graphic"): "graphic",
+    ("graphic", NS_A, "graphicData"): "graphicData",
+    ("graphicData", NS_A, "tbl"): "tbl",
+    ("tbl", NS_A, "tr"): "tr",
+    ("tr", NS_A, "tc"): "cell",
+    ("shape", NS_P, "txBody"): "txBody",
+    ("cell", NS_A, "txBody"): "txBody",
+    ("txBody", NS_A, "bodyPr"): "bodyPr",
+}
+_UNIQUE_ROLES = {"tbl", "txBody", "bodyPr"}
+
+def _classify(parent: Optional[_Element], uri: str, local: str, attrs: bytes) -> Optional[str]:
+    """Papel del elemento en el recorrido de autofit según el de su padre"""
+    if parent is None:
+        return "root"
+    if parent.role == "root":
+        return "cSld" if (uri, local) == (NS_P, "cSld") else None
+    if parent.role == "bodyPr" and uri == NS_A and local in _AUTOFIT_CHOICES:
+        return "autofit"
+    role = _ROLES.get((parent.role, uri, local))
+    if role == "graphicData":
+        values = {name: (v1 or v2) for name, v1, v2 in _TAG_ATTRIBUTE.findall(attrs)}
+        if unescape(values.get(b"uri", b"").decode()) != URI_TABLE:
+            return None
+    if role in _UNIQUE_ROLES:
+        if role in parent.claimed:
+            return None
+        parent.claimed.add(role)
+    return role
+
+def autofit_xml(xml: bytes) -> Tuple[bytes, int]:
+    """
+    Aplica "ajustar texto a la forma" (a:normAutofit) a una diapositiva editando solo los bytes
+    de a:bodyPr. Equivale a `text_frame.auto_size = MSO_AUTO_SIZE.TEXT_TO_FIT_SHAPE` en cada
+    forma p:sp del árbol y en cada celda de sus tablas: se quita el autoajuste que hubiera
+    (noAutofit, normAutofit con su escala, spAutoFit) y se añade <a:normAutofit/> en su sitio
+    del esquema; formas y celdas sin texto reciben el txBody mínimo que crearía python-pptx.
+
+    Devuelve (XML nuevo, nº de cuadros de texto ajustados). El resto del documento no cambia.
+    """
+    stack: List[_Element] = []
+    edits: List[Tuple[int, int, bytes]] = []
+    adjusted = 0
+
+    for match in _TAG.finditer(xml):
+        closing, qname, attrs, self_closing = match.groups()
+        if qname is None:
+            continue
+        if closing:
+            element = stack.pop()
+            close_start = match.start()
+        else:
+            parent = stack[-1] if stack else None
+            ns = parent.ns if parent else {b"xml": "http://www.w3.org/XML/1998/namespace"}
+            declarations = [(name, v1 or v2) for name, v1, v2 in _TAG_ATTRIBUTE.findall(attrs)
+                            if name == b"xmlns" or name.startswith(b"xmlns:")]
+            if declarations:
+                ns = dict(ns)
+                for name, value in declarations:
+                    ns[name[6:]] = unescape(value.decode())
+            prefix, _, local = qname.rpartition(b":")
+            uri = ns.get(prefix)
+            local = local.decode()
+            element = _Element(uri, local, qname, ns, _classify(parent, uri, local, attrs), match.end())
+
+            # Posición de inserción: antes del primer sucesor en el esquema
+            if parent is not None and parent.insert_at is None and uri in (NS_A, NS_P):
+                if (parent.role == "bodyPr" and uri == NS_A and local in _BODY_PR_SUCCESSORS) or \
+                        (parent.role == "shape" and (uri, local) == (NS_P, "extLst")):
+                    parent.insert_at = match.start()
+            if element.role == "autofit":
+                element.skip_from = match.start()
+            if not self_closing:
+                stack.append(element)
+                continue
+            close_start = None
+
+        role = element.role
+        if role == "autofit":
+            edits.append((element.skip_from, match.end(), b""))
+        elif role == "bodyPr":
+            a = element.qname.rpartition(b":")[0]
+            normautofit = b"<" + (a + b":" if a else b"") + b"normAutofit/>"
+            if close_start is None:
+                # <a:bodyPr .../> -> <a:bodyPr ...><a:normAutofit/></a:bodyPr>
+                opened = match.group(0)[:-2].rstrip() + b">"
+                edits.append((match.start(), match.end(), opened + normautofit + b"</" + element.qname + b">"))
+            else:
+                position = element.insert_at if element.insert_at is not None else close_start
+                edits.append((position, position, normautofit))
+            adjusted += 1
+        elif role == "shape" and close_start is not None and "txBody" not in element.claimed:
+            position = element.insert_at if element.insert_at is not None else close_start
+            edits.append((position, position, _new_txbody(element.ns, NS_P)))
+            adjusted += 1
+        elif role == "cell" and "txBody" not in element.claimed:
+            txbody = _new_txbody(element.ns, NS_A)
+            if close_start is None:
+                opened = match.group(0)[:-2].rstrip() + b">"
+                edits.append((match.start(), match.end(), opened + txbody + b"</" + element.qname + b">"))
+            else:
+                # txBody es el primer hijo de a:tc
+                edits.append((element.open_end, element.open_end, txbody))
+            adjusted += 1
+
+    if not edits:
+        return xml, adjusted
+    parts = []
+    position = 0
+    for start, end, replacement in sorted(edits, key=lambda edit: (edit[0], edit[1])):
+        parts.append(xml[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(xml[position:])
+    return b"".join(parts), adjusted
+
+def autofit_part(input_path, name: str) -> Tuple[str, Optional[bytes], int]:
+    """Aplica autofit a una parte; función de módulo para poder ir al pool. None si no cambia"""
+    xml = read_member(input_path, name)
+    new_xml, adjusted = autofit_xml(xml)
+    return name, (new_xml if new_xml != xml else None), adjusted
+
+def autofit_package(input_path, output_path) -> Dict[str, int]:
+    """
+    Escribe `output_path` con autofit en todas las diapositivas de `input_path`. Solo se
+    reescriben las diapositivas que cambian; imágenes, vídeos y demás partes se copian
+    comprimidas tal cual.
+    """
+    package = SlidePackage(input_path)
+    replacements = {}
+    adjusted = 0
+    for name, new_xml, count in map_ordered(autofit_part, ((input_path, name) for name in package.slide_parts())):
+        adjusted += count
+        if new_xml is not None:
+            replacements[name] = new_xml
+    stats = rewrite_package(input_path, output_path, replacements)
+    stats["slides"] = len(package.slides)
+    stats["text_frames"] = adjusted
+    return stats
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Ciclo de vida del almacenamiento: caducidad por tipo de archivo, cuota global y limpieza.
+
+Una tarea de fondo recorre periódicamente STORAGE_DIR y TMP_DIR y:
+- borra subidas, resultados, salidas de autofit, temporales y ficheros JSON de la versión
+  anterior cuando superan su tiempo de vida (STORAGE_TTL_<TIPO>_HOURS);
+- elimina directorios de trabajo de la cola huérfanos, subidas a medias y referencias o
+  blobs de ContentStore que ya no corresponden a nada;
+- olvida los trabajos terminados antiguos del registro y de la cola;
+- si el uso supera STORAGE_QUOTA_GB, desaloja los contenidos menos usados recientemente
+  (LRU por blobs.last_access, que se actualiza con cada descarga) hasta bajar de la cuota.
+
+Cada pasada deja un informe con los archivos y bytes recuperados por categoría.
+"""
+import os, re, time, shutil, asyncio, logging, threading
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Tuple
+
+try:
+    from scripts.file_store import ContentStore
+    from scripts.job_registry import JobRegistry
+    from scripts.job_queue import JobQueue
+except ImportError:
+    from file_store import ContentStore
+    from job_registry import JobRegistry
+    from job_queue import JobQueue
+
+logger = logging.getLogger("storage-lifecycle")
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+
+HOUR = 3600.0
+
+def _ttl(name: str, default_hours: float) -> float:
+    return float(os.environ.get(f"STORAGE_TTL_{name.upper()}_HOURS", default_hours)) * HOUR
+
+_STORAGE_DIR = Path(os.environ.get("STORAGE_DIR", "./storage"))
+
+LIFECYCLE_CONFIG = {
+    "storage_dir": _STORAGE_DIR,
+    "upload_dir": _STORAGE_DIR / "uploads",
+    "autofit_dir": Path(os.environ.get("AUTOFIT_STORAGE_DIR", _STORAGE_DIR / "autofit")),
+    "tmp_dir": Path(os.environ.get("TMP_DIR", "./tmp")),
+    # Segundos entre pasadas
+    "interval": float(os.environ.get("STORAGE_CLEANUP_INTERVAL", HOUR)),
+    # Cuota global de STORAGE_DIR + TMP_DIR; 0 la desactiva
+    "quota_bytes": int(float(os.environ.get("STORAGE_QUOTA_GB", 20)) * 1024 ** 3),
+    # Al superar la cuota se desaloja hasta quedar en esta fracción, para no rozarla en cada pasada
+    "quota_target": 0.9,
+    # Nada más reciente que esto se toca: puede estar escribiéndose o a punto de usarse
+    "min_age": HOUR,
+    "ttl": {
+        "uploads": _ttl("uploads", 48),
+        "results": _ttl("results", 7 * 24),
+        "autofit": _ttl("autofit", 7 * 24),
+        "tmp": _ttl("tmp", 24),
+        "legacy": _ttl("legacy", 7 * 24),
+        "jobs": _ttl("jobs", 30 * 24),
+    },
+}
+
+_UUID = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+_SHARD = re.compile(r"^[0-9a-f]{2}$")
+# Metadatos en JSON de la versión anterior al registro SQLite
+_LEGACY_JSON = re.compile(r"_(meta|result)\.json$|_(processing|job)_.+\.json$")
+
+def _age(path: Path, now: float) -> float:
+    try:
+        return now - path.stat().st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+def _item_dirs(base_dir: Path) -> List[Path]:
+    """Directorios <file_id> de una base, repartidos (<shard>/<file_id>) o planos (anteriores)"""
+    if not base_dir.is_dir():
+        return []
+    dirs = []
+    for entry in base_dir.iterdir():
+        if not entry.is_dir():
+            continue
+        if _UUID.match(entry.name):
+            dirs.append(entry)
+        elif _SHARD.match(entry.name):
+            dirs.extend(child for child in entry.iterdir() if child.is_dir() and _UUID.match(child.name))
+    return dirs
+
+def disk_usage(*roots: Path) -> int:
+    """Bytes ocupados bajo las rutas; los enlaces duros (mismo inodo) cuentan una vez"""
+    seen = set()
+    total = 0
+    for root in roots:
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                try:
+                    stat = os.lstat(os.path.join(dirpath, name))
+                except FileNotFoundError:
+                    continue
+                if (stat.st_dev, stat.st_ino) not in seen:
+                    seen.add((stat.st_dev, stat.st_ino))
+                    total += stat.st_size
+    return total
+
+class StorageLifecycle:
+    """Una pasada de limpieza por llamada a run_once; el informe de la última queda en last_report"""
+
+    def __init__(self, config: Dict[str, Any] = LIFECYCLE_CONFIG):
+        self.config = config
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def run_once(self) -> Dict[str, Any]:
+        with self._lock:
+            started = time.time()
+            self._reclaimed: Dict[str, Dict[str, int]] = {}
+            steps = [self._expire_uploads, self._expire_results, self._expire_autofit, self._expire_tmp,
+                     self._expire_legacy, self._clean_workspaces, self._reconcile, self._prune_records,
+                     self._enforce_quota, self._remove_empty_dirs]
+            for step in steps:
+                try:
+                    step(started)
+                except Exception as e:
+                    logger.error(f"Error en {step.__name__}: {e}", exc_info=True)
+
+            total = sum(item["bytes"] for item in self._reclaimed.values())
+            report = {
+                "started_at": started,
+                "duration_seconds": round(time.time() - started, 2),
+                "reclaimed_bytes": total,
+                "reclaimed": self._reclaimed,
+                "usage_bytes": disk_usage(self.config["storage_dir"], self.config["tmp_dir"]),
+                "quota_bytes": self.config["quota_bytes"],
+            }
+            self.last_report = report
+            detail = ", ".join(f"{category}: {item['files']}" for category, item in self._reclaimed.items())
+            logger.info(f"Limpieza de almacenamiento: {total / 1024 / 1024:.1f} MB recuperados, "
+                        f"{report['usage_bytes'] / 1024 / 1024:.1f} MB en uso ({detail or 'nada que borrar'})")
+            return report
+
+    def _count(self, category: str, files: int = 1, freed: int = 0):
+        item = self._reclaimed.setdefault(category, {"files": 0, "bytes": 0})
+        item["files"] += files
+        item["bytes"] += freed
+
+    def _remove_tree(self, path: Path, category: str):
+        """Borra un archivo o directorio liberando sus referencias en ContentStore"""
+        store = ContentStore.shared()
+        files = [path] if path.is_file() else [p for p in path.rglob("*") if p.is_file()]
+        freed = sum(store.release(file) for file in files)
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        self._count(category, len(files), freed)
+
+    # Caducidad por tipo
+
+    def _expire_uploads(self, now: float):
+        registry = JobRegistry.shared()
+        for uploaded in registry.expired_files(now - self.config["ttl"]["uploads"]):
+            path = Path(uploaded["path"])
+            # Subida en su propio directorio <file_id>: se borra entero
+            target = path.parent if path.parent.name == uploaded["file_id"] else path
+            if target.exists():
+                self._remove_tree(target, "uploads")
+            registry.forget_file(uploaded["file_id"])
+
+        upload_dir = self.config["upload_dir"]
+        # Subidas sin registrar (proceso caído antes de registrarlas) y escrituras a medias
+        for item_dir in _item_dirs(upload_dir):
+            if _age(item_dir, now) > self.config["ttl"]["uploads"] and registry.get_file(item_dir.name) is None:
+                self._remove_tree(item_dir, "uploads")
+        for partial in upload_dir.glob(".*.partial") if upload_dir.is_dir() else []:
+            if _age(partial, now) > self.config["min_age"]:
+                self._remove_tree(partial, "partial")
+
+    def _expire_results(self, now: float):
+        for item_dir in _item_dirs(self.config["storage_dir"]):
+            if _age(item_dir, now) > self.config["ttl"]["results"]:
+                self._remove_tree(item_dir, "results")
+
+    def _expire_autofit(self, now: float):
+        autofit_dir = self.config["autofit_dir"]
+        if not autofit_dir.is_dir():
+            return
+        for path in autofit_dir.iterdir():
+            if path.is_file() and _age(path, now) > self.config["ttl"]["autofit"]:
+                self._remove_tree(path, "autofit")
+
+    def _expire_tmp(self, now: float):
+        tmp_dir = self.config["tmp_dir"]
+        if not tmp_dir.is_dir():
+            return
+        for path in tmp_dir.iterdir():
+            if _age(path, now) > self.config["ttl"]["tmp"]:
+                self._remove_tree(path, "tmp")
+
+    def _expire_legacy(self, now: float):
+        for path in self.config["storage_dir"].glob("*.json"):
+            if _LEGACY_JSON.search(path.name) and _age(path, now) > self.config["ttl"]["legacy"]:
+                self._remove_tree(path, "legacy")
+
+    # Reparación
+
+    def _clean_workspaces(self, now: float):
+        """Directorios de trabajo de la cola cuyo trabajo ya no está pendiente ni en curso"""
+        queue = JobQueue.shared()
+        work_dir = queue.base_dir / "work"
+        if not work_dir.is_dir():
+            return
+        for workspace in work_dir.iterdir():
+            if _age(workspace, now) > self.config["min_age"] and not queue.is_active(workspace.name):
+                self._remove_tree(workspace, "workspaces")
+
+    def _reconcile(self, now: float):
+        result = ContentStore.shared().reconcile(self.config["min_age"])
+        if result["files"]:
+            self._count("content_store", result["files"], result["bytes"])
+
+    def _prune_records(self, now: float):
+        before = now - self.config["ttl"]["jobs"]
+        pruned = JobRegistry.shared().prune_jobs(before) + JobQueue.shared().prune(before)
+        if pruned:
+            self._count("job_records", pruned)
+
+    def _remove_empty_dirs(self, now: float):
+        """Directorios <file_id> vacíos; los de reparto (<shard>) se conservan siempre"""
+        for base_dir in (self.config["storage_dir"], self.config["upload_dir"], self.config["autofit_dir"]):
+            for item_dir in _item_dirs(base_dir):
+                if _age(item_dir, now) > self.config["min_age"] and not any(item_dir.iterdir()):
+                    item_dir.rmdir()
+
+    # Cuota
+
+    def _enforce_quota(self, now: float):
+        quota = self.config["quota_bytes"]
+        if not quota:
+            return
+        usage = disk_usage(self.config["storage_dir"], self.config["tmp_dir"])
+        if usage <= quota:
+            return
+        target = quota * self.config["quota_target"]
+        logger.warning(f"Almacenamiento por encima de la cuota ({usage / 1024 ** 3:.2f} GB de "
+                       f"{quota / 1024 ** 3:.2f} GB): se desalojan los contenidos menos usados")
+
+        store = ContentStore.shared()
+        protected = self._protected_hashes(store)
+        recent = now - self.config["min_age"]
+        candidates: List[Tuple[float, str, Any]] = [
+            (blob["last_access"], "blob", blob["hash"]) for blob in store.lru_blobs()
+            if blob["hash"] not in protected and blob["last_access"] < recent
+        ]
+        autofit_dir = self.config["autofit_dir"]
+        if autofit_dir.is_dir():
+            candidates += [(path.stat().st_mtime, "file", path) for path in autofit_dir.iterdir()
+                           if path.is_file() and path.stat().st_mtime < recent]
+        candidates.sort(key=lambda candidate: candidate[0])
+
+        for _, kind, item in candidates:
+            if usage <= target:
+                break
+            if kind == "blob":
+                freed = store.evict(item)
+            else:
+                freed = item.stat().st_size
+                item.unlink()
+            usage -= freed
+            self._count("quota", 1, freed)
+        if usage > quota:
+            logger.warning(f"No hay más contenido desalojable: {usage / 1024 ** 3:.2f} GB en uso")
+
+    def _protected_hashes(self, store: ContentStore) -> set:
+        """Contenidos que necesita un trabajo en cola o en curso"""
+        paths = [Path(path) for path in JobRegistry.shared().active_file_paths()]
+        work_dir = JobQueue.shared().base_dir / "work"
+        if work_dir.is_dir():
+            paths += [path for path in work_dir.rglob("*") if path.is_file()]
+        return {digest for digest in map(store.hash_of, paths) if digest}
+
+LIFECYCLE = StorageLifecycle()
+
+_task: Optional[asyncio.Task] = None
+
+async def _run_periodically():
+    # Primera pasada poco después de arrancar, luego cada `interval` segundos
+    delay = min(60.0, LIFECYCLE_CONFIG["interval"])
+    while True:
+        await asyncio.sleep(delay)
+        delay = LIFECYCLE_CONFIG["interval"]
+        try:
+            await asyncio.to_thread(LIFECYCLE.run_once)
+        except Exception as e:
+            logger.error(f"Error en la limpieza de almacenamiento: {e}", exc_info=True)
+
+async def start_lifecycle():
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_run_periodically())
+        logger.info(f"Limpieza de almacenamiento cada {LIFECYCLE_CONFIG['interval']:.0f} s")
+
+async def stop_lifecycle():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Recepción de subidas PPTX común a traducción, división y autofit.
+
+El archivo se copia a su destino en un hilo, fuera del bucle de eventos, por bloques: en
+la misma pasada se calcula el SHA-256, se aplica el límite de tamaño y se valida la
+estructura del paquete leyendo las cabeceras locales del ZIP a medida que llegan. Un
+archivo que no es un ZIP, con rutas peligrosas, con demasiados miembros o cuyo
+[Content_Types].xml no es el de una presentación se rechaza en el primer bloque que lo
+delata, sin esperar a que termine la copia ni a que lo descubra el trabajo en cola.
+"""
+import os, re, zlib, struct, asyncio, hashlib, logging, zipfile
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from fastapi import UploadFile
+
+logger = logging.getLogger("upload-pipeline")
+
+UPLOAD_CONFIG = {
+    "max_bytes": int(float(os.environ.get("MAX_UPLOAD_MB", 500)) * 1024 * 1024),
+    "chunk_size": 1024 * 1024,
+    # Límites contra paquetes manipulados (bombas ZIP)
+    "max_members": 50000,
+    "max_uncompressed_bytes": 4 * 1024 ** 3,
+}
+
+LOCAL_HEADER = b"PK\x03\x04"
+# Firmas que siguen a los datos de los miembros: a partir de ahí no hay más cabeceras locales
+END_OF_MEMBERS = (b"PK\x01\x02", b"PK\x05\x06", b"PK\x06\x06", b"PK\x06\x08", b"PK\x05\x05")
+_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+CONTENT_TYPES = "[Content_Types].xml"
+_SLIDE_PART = re.compile(r"ppt/slides/slide\d+\.xml")
+_PRESENTATION_TYPE = re.compile(
+    rb'ContentType="application/vnd\.(openxmlformats-officedocument\.presentationml|ms-powerpoint)'
+    rb'\.[A-Za-z.]+\.main\+xml"'
+)
+
+class UploadRejected(Exception):
+    """Subida no aceptada; `status_code` es el código HTTP con el que responder"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+class PackageValidator:
+    """
+    Validación incremental de un paquete OOXML de presentación.
+
+    feed() recorre las cabeceras locales saltando los datos de cada miembro, salvo los de
+    [Content_Types].xml, que se descomprimen para comprobar el tipo de documento. Si un
+    miembro usa descriptor de datos (tamaño desconocido hasta el final) se deja de
+    recorrer y finish() valida con el directorio central.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._skip = 0
+        self._capture: Optional[bytearray] = None
+        self._capture_method = 0
+        self._walking = True
+        self.members = 0
+        self.uncompressed = 0
+        self.content_types_checked = False
+
+    def feed(self, data: bytes):
+        if not self._walking:
+            return
+        self._buffer += data
+        while True:
+            if self._skip:
+                taken = min(self._skip, len(self._buffer))
+                if self._capture is not None:
+                    self._capture += self._buffer[:taken]
+                del self._buffer[:taken]
+                self._skip -= taken
+                if self._skip:
+                    return
+                if self._capture is not None:
+                    self._check_content_types(self._capture, self._capture_method)
+                    self._capture = None
+
+            if len(self._buffer) < 4:
+                return
+            signature = bytes(self._buffer[:4])
+            if signature in END_OF_MEMBERS and self.members:
+                self._walking = False
+                return
+            if signature != LOCAL_HEADER:
+                raise UploadRejected("El archivo no es un PPTX válido (no es un paquete ZIP)")
+            if len(self._buffer) < _LOCAL_HEADER.size:
+                return
+            (_, _, flags, method, _, _, _, compressed, size,
+             name_length, extra_length) = _LOCAL_HEADER.unpack_from(self._buffer)
+            header_length = _LOCAL_HEADER.size + name_length + extra_length
+            if len(self._buffer) < header_length:
+                return
+            raw_name = bytes(self._buffer[_LOCAL_HEADER.size:_LOCAL_HEADER.size + name_length])
+            try:
+                name = raw_name.decode("utf-8" if flags & 0x800 else "cp437", errors="strict")
+            except UnicodeDecodeError:
+                raise UploadRejected("El archivo contiene un nombre de elemento no válido")
+            del self._buffer[:header_length]
+            self._member(name, size)
+
+            # Tamaño solo en el descriptor de datos, o en el extra ZIP64: el final decide
+            if flags & 0x08 or compressed == 0xFFFFFFFF:
+                self._walking = False
+                return
+            self._skip = compressed
+            if name == CONTENT_TYPES and method in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+                self._capture = bytearray()
+                self._capture_method = method
+                if not compressed:
+                    self._check_content_types(b"", method)
+                    self._capture = None
+
+    def _member(self, name: str, size: int):
+        self.members += 1
+        if self.members > UPLOAD_CONFIG["max_members"]:
+            raise UploadRejected("El archivo contiene demasiados elementos")
+        if name.startswith(("/", "\\")) or ".." in name.replace("\\", "/").split("/"):
+            raise UploadRejected(f"El archivo contiene una ruta no válida: {name}")
+        if size != 0xFFFFFFFF:
+            self.uncompressed += size
+            if self.uncompressed > UPLOAD_CONFIG["max_uncompressed_bytes"]:
+                raise UploadRejected("El contenido descomprimido del archivo es demasiado grande", 413)
+
+    def _check_content_types(self, data: bytes, method: int):
+        if method == zipfile.ZIP_DEFLATED:
+            try:
+                # [Content_Types].xml ocupa unos KB: un límite generoso basta
+                data = zlib.decompressobj(-15).decompress(bytes(data), 16 * 1024 * 1024)
+            except zlib.error:
+                raise UploadRejected("El archivo está dañado ([Content_Types].xml ilegible)")
+        if not _PRESENTATION_TYPE.search(data):
+            raise UploadRejected("El archivo no es una presentación de PowerPoint")
+        self.content_types_checked = True
+
+    def finish(self, path: Path):
+        """Comprobación final con el directorio central (la referencia para lectores ZIP)"""
+        if self._skip or (self._walking and self._buffer) or not self.members:
+            raise UploadRejected("El archivo PPTX está incompleto o truncado")
+        try:
+            with zipfile.ZipFile(path) as zf:
+                names = set(zf.namelist())
+                if CONTENT_TYPES not in names or "ppt/presentation.xml" not in names \
+                        or not any(_SLIDE_PART.fullmatch(name) for name in names):
+                    raise UploadRejected("El archivo no tiene la estructura de un documento PPTX válido")
+                if not self.content_types_checked:
+                    self._check_content_types(zf.read(CONTENT_TYPES), zipfile.ZIP_STORED)
+        except (zipfile.BadZipFile, UnicodeDecodeError):
+            raise UploadRejected("El archivo no es un PPTX válido (ZIP dañado)")
+
+def _receive(source, dest: Path, max_bytes: int) -> Dict[str, Any]:
+    digest = hashlib.sha256()
+    validator = PackageValidator()
+    size = 0
+    with open(dest, "wb") as buffer:
+        while chunk := source.read(UPLOAD_CONFIG["chunk_size"]):
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadRejected(f"El archivo supera el tamaño máximo de {max_bytes // 1024 // 1024} MB", 413)
+            validator.feed(chunk)
+            digest.update(chunk)
+            buffer.write(chunk)
+    validator.finish(dest)
+    return {"path": dest, "sha256": digest.hexdigest(), "size": size}
+
+async def receive_upload(file: UploadFile, dest, max_bytes: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Copia una subida PPTX a `dest` validándola; devuelve {"path", "sha256", "size"}.
+
+    Lanza UploadRejected (y no deja nada en `dest`) si el archivo no es aceptable.
+    """
+    dest = Path(dest)
+    max_bytes = max_bytes or UPLOAD_CONFIG["max_bytes"]
+    # El tamaño ya se conoce si el formulario terminó de recibirse: rechazo inmediato
+    if file.size is not None and file.size > max_bytes:
+        raise UploadRejected(f"El archivo supera el tamaño máximo de {max_bytes // 1024 // 1024} MB", 413)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        received = await asyncio.to_thread(_receive, file.file, dest, max_bytes)
+    except BaseException as e:
+        dest.unlink(missing_ok=True)
+        if isinstance(e, UploadRejected):
+            logger.warning(f"Subida rechazada ({file.filename}): {e}")
+        raise
+    logger.info(f"Subida recibida: {file.filename} ({received['size'] / 1024 / 1024:.2f} MB)")
+    return received
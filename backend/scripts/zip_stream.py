@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Respuestas ZIP en streaming para descargas de varios archivos.
+
+El archivo se genera mientras se envía: cada miembro se lee por bloques y sus bytes
+salen hacia el cliente en cuanto se escriben, sin ZIP temporal en disco. Los formatos
+que ya van comprimidos (PPTX y demás OOXML, imágenes, vídeo) se guardan sin recomprimir.
+"""
+import io, zipfile, logging
+from pathlib import Path
+from typing import Iterable, Iterator, Tuple
+
+from fastapi.responses import StreamingResponse
+
+try:
+    from scripts.file_serving import content_disposition
+except ImportError:
+    from file_serving import content_disposition
+
+logger = logging.getLogger("zip-stream")
+
+CHUNK_SIZE = 1024 * 1024
+# Contenedores ya comprimidos: DEFLATE apenas reduce su tamaño y cuesta CPU
+STORED_EXTENSIONS = {
+    ".pptx", ".docx", ".xlsx", ".zip", ".png", ".jpg", ".jpeg", ".gif", ".webp", ".mp3", ".mp4", ".pdf"
+}
+
+class _StreamSink(io.RawIOBase):
+    """Destino no posicionable para zipfile: acumula lo escrito hasta que se recoge"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offset = 0
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def write(self, data):
+        self._buffer += data
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def take(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+def stream_zip(entries: Iterable[Tuple[Path, str]]) -> Iterator[bytes]:
+    """
+    Genera los bytes de un ZIP con los archivos (ruta, nombre en el ZIP) indicados.
+
+    Con un destino no posicionable zipfile escribe descriptores de datos tras cada miembro
+    (CRC y tamaños) y ZIP64 cuando hace falta, así que no necesita volver atrás.
+    """
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, "w") as archive:
+        for path, arcname in entries:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = (zipfile.ZIP_STORED if Path(arcname).suffix.lower() in STORED_EXTENSIONS
+                                  else zipfile.ZIP_DEFLATED)
+            with open(path, "rb") as src, archive.open(info, "w") as dst:
+                while chunk := src.read(CHUNK_SIZE):
+                    dst.write(chunk)
+                    if sink.pending() >= CHUNK_SIZE:
+                        yield sink.take()
+            logger.info(f"Añadido {arcname} al ZIP")
+            yield sink.take()
+    # Directorio central
+    yield sink.take()
+
+def zip_response(entries: Iterable[Tuple[Path, str]], filename: str) -> StreamingResponse:
+    """StreamingResponse que descarga los archivos como un ZIP generado al vuelo"""
+    return StreamingResponse(
+        stream_zip(list(entries)),
+        media_type="application/zip",
+        headers={"Content-Disposition": content_disposition(filename)}
+    )